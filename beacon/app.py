@@ -2,13 +2,14 @@
 '''The app module, containing the app factory function.'''
 
 import sys
+import atexit
 import logging
 import os
 import datetime
 
 from werkzeug.utils import import_string
 
-from flask import Flask, render_template
+from flask import Flask, render_template, has_app_context
 from celery import Celery
 
 from flask_security import current_user, SQLAlchemyUserDatastore
@@ -28,6 +29,7 @@ from beacon.filters import (
 
 # import models so that flask-migrate can auto-detect
 from beacon.models.public import AppStatus
+from beacon.health import errors
 
 def log_file(app):
     log_dir = '/var/log/chime'
@@ -70,6 +72,10 @@ def create_app():
         abstract = True
 
         def __call__(self, *args, **kwargs):
+            # eager tasks run inside the caller's context, and popping a
+            # new one would tear down the caller's database session
+            if has_app_context():
+                return TaskBase.__call__(self, *args, **kwargs)
             with app.app_context():
                 return TaskBase.__call__(self, *args, **kwargs)
 
@@ -102,10 +108,10 @@ def register_extensions(app):
         anonymous_user=AnonymousUser
     )
 
-    from beacon.tasks import send_email
+    from beacon.tasks import deliver
     @security_ctx.send_mail_task
     def async_security_email(msg):
-        send_email([msg])
+        deliver([msg])
 
     app.config['SECURITY_MSG_UNAUTHORIZED'] = (
         'You do not have sufficent permissions to do that! If you are staff, make sure you are logged in using the link to the upper right.',
@@ -156,18 +162,25 @@ def register_errorhandlers(app):
         error_code = getattr(error, 'code', 500)
 
         if error_code == 500:
-            app_status = AppStatus.query.first()
-            app_status.status = 'error'
-            app_status.last_updated = datetime.datetime.utcnow()
-            app_status.message = str(error)
-            db.session.commit()
+            errors.record(error)
 
         app.logger.exception(error)
 
         return render_template("errors/{0}.html".format(error_code)), error_code
     for errcode in [401, 403, 404, 413, 500]:
-        # for 500-level status codes, change the db status
+        # for 500-level status codes, count the error towards the db status
         app.errorhandler(errcode)(render_error)
+
+    # errors coalesced by an earlier request are written once their interval
+    # has passed, even if no more errors come in to write them
+    @app.teardown_request
+    def flush_errors(exception):
+        errors.flush()
+
+    def flush_errors_at_exit():
+        with app.app_context():
+            errors.flush(force=True)
+    atexit.register(flush_errors_at_exit)
     return None
 
 def register_logging(app, config_string):
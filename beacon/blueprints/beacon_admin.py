@@ -4,16 +4,18 @@ import datetime
 
 from flask import (
     render_template, url_for, Response, stream_with_context,
-    redirect, flash, abort, request, current_app, Blueprint
+    redirect, flash, abort, request, current_app, Blueprint, jsonify
 )
 from flask_security import current_user, roles_accepted, utils as sec_utils
 
 from beacon.database import db
+from beacon.exports import EXPORT_FORMATS, gzipped, parse_since
 
-from beacon.models.opportunities.base import Opportunity
+from beacon.models.opportunities.base import Opportunity, opportunity_pages
 from beacon.models.opportunities.documents import OpportunityDocument
 from beacon.models.vendors import Vendor
 from beacon.models.questions import Question
+from beacon.jobs.job_base import JobStatus
 
 from beacon.forms.opportunities import OpportunityForm
 from beacon.forms.questions import AnswerForm
@@ -56,7 +58,6 @@ def new():
 
     return render_template(
         'beacon/admin/opportunity.html', form=form, opportunity=None,
-        subcategories=form.get_subcategories(),
         categories=form.get_categories(),
         help_blocks=Opportunity.get_help_blocks()
     )
@@ -100,7 +101,6 @@ def edit(opportunity_id):
             return render_template(
                 'beacon/admin/opportunity.html', form=form,
                 opportunity=opportunity,
-                subcategories=form.get_subcategories(),
                 categories=form.get_categories()
             )
 
@@ -143,11 +143,13 @@ def answer_question(opportunity_id, question_id):
                 answer['edited'] = True
                 answer['edited_at'] = datetime.datetime.utcnow()
                 question.update(**answer)
+                opportunity_pages.invalidate()
                 flash('Answer successfully edited.')
             else:
                 answer['answered_at'] = datetime.datetime.utcnow()
                 answer['answered_by'] = current_user
                 question.update(**answer)
+                opportunity_pages.invalidate()
                 flash('This question has been answered! The Vendor has been notified and the question and answer are now public.')
 
                 to_email = set([
@@ -162,6 +164,7 @@ def answer_question(opportunity_id, question_id):
                     html_template='beacon/emails/answered_question.html',
                     question=question
                 ).send(multi=True)
+                db.session.commit()
 
             return redirect(
                 url_for('beacon_admin.questions', opportunity_id=opportunity_id)
@@ -182,6 +185,7 @@ def delete_question(opportunity_id, question_id):
             sec_utils.do_flash(*sec_utils.get_message('UNAUTHORIZED'))
             return redirect('/')
         question.delete()
+        opportunity_pages.invalidate()
         flash('Question successfully deleted', 'alert-info')
         return redirect(url_for('beacon_admin.questions', opportunity_id=opportunity_id))
 
@@ -206,6 +210,7 @@ def remove_document(opportunity_id, document_id):
                 )
             )
             document.delete()
+            opportunity_pages.invalidate()
             flash('Document successfully deleted', 'alert-success')
         else:
             flash("That document doesn't exist!", 'alert-danger')
@@ -239,6 +244,7 @@ def publish(opportunity_id):
 
         opportunity.is_public = True
         db.session.commit()
+        opportunity_pages.invalidate()
 
         opportunity.send_publish_email()
 
@@ -276,9 +282,9 @@ def pending():
     ).all()
 
     approved = Opportunity.query.filter(
-        Opportunity.planned_publish > datetime.date.today(),
         Opportunity.is_public == True,
-        Opportunity.planned_submission_end >= datetime.date.today(),
+        db.not_(Opportunity.is_published),
+        db.not_(Opportunity.is_submission_end),
         Opportunity.is_archived == False
     ).all()
 
@@ -303,6 +309,7 @@ def archive(opportunity_id):
     if opportunity:
         opportunity.is_archived = True
         db.session.commit()
+        opportunity_pages.invalidate()
 
         current_app.logger.info(
 '''BEACON ARCHIVED: ID: {} | Title: {} | Publish Date: {} | Submission Start Date: {} | Submission End Date: {} '''.format(
@@ -322,27 +329,94 @@ def archive(opportunity_id):
 def signups():
     '''Basic dashboard view for category-level signups
 
-    :status 200: Download a tab-separated file of all vendor signups
+    :query format: One of ``tsv`` (the default), ``csv`` or ``jsonl``
+    :query since: Only include vendors created or updated at or after this
+        timestamp. Timestamps without a timezone are taken to be UTC
+    :query gzip: If set, gzip the file as it is streamed
+    :status 200: Download a file of all vendor signups, with a timestamp
+        to pass as ``since`` for the next incremental download in the
+        ``X-Export-Timestamp`` header. The timestamp is taken from the
+        database when the download starts, less ``EXPORT_WATERMARK_OVERLAP``
+        seconds, so that vendors saved by transactions that were still
+        running then are picked up next time. Consecutive downloads
+        overlap as a result, so consumers should de-duplicate vendors by
+        email
+    :status 400: Unknown format or unreadable ``since`` timestamp
     '''
-    def stream():
-        # yield the title columns
-        yield 'first_name\tlast_name\tbusiness_name\temail\tphone_number\t' +\
-            'minority_owned\twoman_owned\tveteran_owned\t' +\
-            'disadvantaged_owned\tcategories\topportunities\n'
+    export_format = request.args.get('format', 'tsv')
+    if export_format not in EXPORT_FORMATS:
+        abort(400)
+
+    since = request.args.get('since')
+    if since:
+        try:
+            since = parse_since(since)
+        except (ValueError, OverflowError):
+            abort(400)
+    else:
+        since = None
+
+    # the rows are read in the same transaction, so they are at least as
+    # fresh as the database's clock here
+    watermark = db.session.execute(
+        db.select([db.func.timezone('utc', db.func.now())])
+    ).scalar() - datetime.timedelta(seconds=current_app.config['EXPORT_WATERMARK_OVERLAP'])
+
+    writer, mimetype = EXPORT_FORMATS[export_format]
+    stream = writer(
+        Vendor.DOWNLOADABLE_HEADER, Vendor.downloadable_rows(since=since),
+        quoted=Vendor.DOWNLOADABLE_GROUPS
+    )
+    filename = 'vendors-{}.{}'.format(datetime.date.today(), export_format)
 
-        vendors = Vendor.query.all()
-        for vendor in vendors:
-            row = vendor.build_downloadable_row()
-            yield '\t'.join([str(i) for i in row]) + '\n'
+    if request.args.get('gzip'):
+        stream, mimetype = gzipped(stream), 'application/gzip'
+        filename += '.gz'
 
-    current_app.logger.info('BEACON VENDOR CSV DOWNLOAD')
+    current_app.logger.info('BEACON VENDOR {} DOWNLOAD{}'.format(
+        export_format.upper(), ' SINCE {}'.format(since.isoformat()) if since else ''
+    ))
 
     resp = Response(
-        stream_with_context(stream()),
+        stream_with_context(stream),
         headers={
-            "Content-Disposition": "attachment; filename=vendors-{}.tsv".format(datetime.date.today())
+            "Content-Disposition": "attachment; filename={}".format(filename),
+            "X-Export-Timestamp": watermark.isoformat()
         },
-        mimetype='text/tsv'
+        mimetype=mimetype
     )
 
     return resp
+
+def _job_history():
+    try:
+        days = int(request.args.get('days', 30))
+    except ValueError:
+        abort(400)
+    return JobStatus.history(name=request.args.get('name'), days=days).all()
+
+@blueprint.route('/jobs')
+@roles_accepted('admin')
+def jobs():
+    '''History of the nightly job runs, with how long each one took
+
+    :query name: Only show runs of the job with this name
+    :query days: Number of days of runs to show, defaults to 30
+    :status 200: Render the job history template
+    :status 400: ``days`` is not a number
+    '''
+    return render_template('beacon/admin/jobs.html', jobs=_job_history())
+
+@blueprint.route('/jobs.json')
+@roles_accepted('admin')
+def jobs_json():
+    '''History of the nightly job runs as JSON
+
+    :query name: Only include runs of the job with this name
+    :query days: Number of days of runs to include, defaults to 30
+    :status 200: JSON with a ``jobs`` list, newest first, of each run's
+        status, timestamps, phase timings in seconds, and notification
+        and recipient counts
+    :status 400: ``days`` is not a number
+    '''
+    return jsonify(jobs=[i.as_dict() for i in _job_history()])
@@ -3,23 +3,25 @@
 import datetime
 
 from flask import (
-    render_template, request, current_app, flash,
+    render_template, request, current_app, flash, jsonify,
     redirect, url_for, session, abort, Blueprint, Markup
 )
 
 from flask_security import current_user
 
-from beacon.database import db
+from beacon.database import db, KeysetPagination
 from beacon.notifications import Notification
 from beacon.forms.opportunities import (
-    UnsubscribeForm, VendorSignupForm, OpportunitySignupForm
+    UnsubscribeForm, VendorSignupForm, OpportunitySignupForm, category_tree
 )
 from beacon.forms.questions import QuestionForm
 
 from beacon.models.vendors import Category, Vendor
 from beacon.models.opportunities.base import Opportunity
 
-from beacon.blueprints.view_util import init_form, signup_for_opp
+from beacon.blueprints.view_util import (
+    init_form, signup_for_opp, cached_fragment, render_conditional
+)
 
 from beacon.models.users import User, Role
 
@@ -48,14 +50,13 @@ def signup():
     :status 302: Process the signup form post, redirect
         the vendor back to the splash page
     '''
-    session_vendor = Vendor.query.filter(
-        Vendor.email == session.get('email'),
-        Vendor.business_name == session.get('business_name')
-    ).first()
+    session_vendor = Vendor.for_email(session.get('email'))
+    if session_vendor and session_vendor.business_name != session.get('business_name'):
+        session_vendor = None
     form = init_form(VendorSignupForm, model=session_vendor)
 
     if form.validate_on_submit():
-        vendor = Vendor.query.filter(Vendor.email == form.data.get('email')).first()
+        vendor = Vendor.for_email(form.data.get('email'))
 
         if vendor:
             current_app.logger.info('''
@@ -108,6 +109,7 @@ def signup():
                     vendor=form.data['email'], convert_args=True,
                     business_name=form.data['business_name']
                 ).send()
+                db.session.commit()
 
                 flash('Thank you for signing up! Check your email for more information', 'alert-success')
 
@@ -135,9 +137,55 @@ def signup():
 
     return render_template(
         'beacon/front/signup.html', form=form,
-        categories=form.get_categories(),
-        subcategories=form.get_subcategories()
+        categories=form.get_categories()
+    )
+
+@blueprint.route('/categories/subcategories', methods=['GET'])
+def subcategories():
+    '''Subcategories of one parent category, for the category picker
+
+    :query category: Name of the parent category, or ``Select All``
+    :status 200: JSON with a ``subcategories`` list of [id, name] pairs
+    '''
+    tree = category_tree.get()
+    return jsonify(
+        subcategories=tree['subcategories'].get(request.args.get('category'), [])
+    )
+
+@blueprint.route('/categories/typeahead', methods=['GET'])
+def category_typeahead():
+    '''Subcategories matching a partially typed search
+
+    Searches of up to ``CATEGORY_TYPEAHEAD_CACHE_LENGTH`` characters, which
+    are the ones every visitor types on their way to a longer search, are
+    cached until the categories are next imported, as long as they found
+    something. Longer searches go straight to the database, so that
+    arbitrary queries can't fill up the cache.
+
+    :query q: What the user has typed so far, of which only the first
+        ``CATEGORY_TYPEAHEAD_MAX_LENGTH`` characters are used
+    :status 200: JSON with a ``results`` list of the best matching
+        subcategories' ``id``, ``category`` and ``category_friendly_name``
+    '''
+    terms = u' '.join(
+        request.args.get('q', u'')[:current_app.config['CATEGORY_TYPEAHEAD_MAX_LENGTH']].lower().split()
     )
+    limit = current_app.config['CATEGORY_TYPEAHEAD_LIMIT']
+
+    def build():
+        # None is a cache miss, so searches that find nothing aren't kept
+        return [
+            dict(id=i.id, category=i.category, category_friendly_name=i.category_friendly_name)
+            for i in Category.typeahead(terms, limit=limit)
+        ] or None
+
+    if not terms:
+        results = None
+    elif len(terms) <= current_app.config['CATEGORY_TYPEAHEAD_CACHE_LENGTH']:
+        results = category_tree.get_derived(u'typeahead:{}'.format(terms), build)
+    else:
+        results = build()
+    return jsonify(results=results or [])
 
 @blueprint.route('/manage', methods=['GET', 'POST'])
 def manage():
@@ -157,7 +205,7 @@ def manage():
 
     if form.validate_on_submit():
         email = form.data.get('email')
-        vendor = Vendor.query.filter(Vendor.email == email).first()
+        vendor = Vendor.for_email(email)
 
         if vendor is None:
             current_app.logger.info(
@@ -213,11 +261,11 @@ def browse():
     '''Browse available opportunities
 
     :status 200: render the browse template page
+    :status 304: the browser's copy of the page is current, see
+        :py:func:`~beacon.blueprints.view_util.render_conditional`
     :status 302: subscribe to one or multiple opportunities via
         the :py:class:`~purchasing.forms.front.OpportunitySignupForm`
     '''
-    _open, upcoming = [], []
-
     signup_form = init_form(OpportunitySignupForm)
     if signup_form.validate_on_submit():
         opportunities = request.form.getlist('opportunity')
@@ -227,47 +275,104 @@ def browse():
             flash(Markup('Successfully subscribed for updates! <a href=' + url_for('front.signup') + '>Sign up</a> for alerts about future opportunities.'), 'alert-success')
             return redirect(url_for('front.browse'))
 
-    opportunities = Opportunity.query.filter(
-        Opportunity.planned_submission_end >= datetime.date.today()
-    ).all()
+    version = Opportunity.listing_version()
+
+    def listing():
+        _open = Opportunity.listing_query().filter(
+            Opportunity.is_submission_start
+        ).order_by(Opportunity.planned_submission_end).all()
+
+        upcoming = Opportunity.listing_query().filter(
+            Opportunity.is_upcoming
+        ).order_by(Opportunity.planned_submission_start).all()
+
+        subscribed = Vendor.subscribed_opportunity_ids(
+            session.get('email'), [i.id for i in _open + upcoming]
+        )
 
-    for opportunity in opportunities:
-        if opportunity.is_submission_start:
-            _open.append(opportunity)
-        elif opportunity.is_upcoming:
-            upcoming.append(opportunity)
+        return Markup(render_template(
+            'beacon/_browse_listing.html', current_user=current_user,
+            _open=_open, upcoming=upcoming, subscribed=subscribed
+        )), len(_open) + len(upcoming)
+
+    def render():
+        html, listed = cached_fragment('browse', version, listing)
+        return render_template(
+            'beacon/browse.html', current_user=current_user,
+            signup_form=signup_form, listing=html, listed=listed
+        )
 
     current_app.logger.info('BEACON FRONT OPEN OPPORTUNITY VIEW')
+    return render_conditional(version, render)
+
+@blueprint.route('/opportunities/search', methods=['GET'])
+def search():
+    '''Search published opportunities, best matches first
+
+    :query q: Search terms
+    :query page: Page of results to show
+    :status 200: render the search form and a page of results
+    '''
+    terms = request.args.get('q', '').strip()
+    pagination = None
+
+    if terms:
+        pagination = Opportunity.search(terms).paginate(
+            request.args.get('page', 1, type=int),
+            current_app.config['PER_PAGE'], error_out=False
+        )
+
+    current_app.logger.info('BEACON FRONT SEARCH VIEW')
     return render_template(
-        'beacon/browse.html', opportunities=opportunities,
-        current_user=current_user, signup_form=signup_form,
-        _open=sorted(_open, key=lambda i: i.planned_submission_end),
-        upcoming=sorted(upcoming, key=lambda i: i.planned_submission_start),
-        session_vendor=session.get('email')
+        'beacon/front/search.html', terms=terms, pagination=pagination
     )
 
 @blueprint.route('/opportunities/expired', methods=['GET'])
 def expired():
-    '''View expired contracts
+    '''View expired contracts, most recently closed first
+
+    Paginated with ``after`` and ``before`` cursors, see
+    :py:class:`~beacon.database.KeysetPagination`
 
     :status 200: render the expired opportunities templates
+    :status 304: the browser's copy of the page is current
     '''
-    expired = Opportunity.query.filter(
-        Opportunity.planned_submission_end < datetime.date.today(),
-        Opportunity.is_public == True
-    ).all()
+    version = Opportunity.listing_version()
+    after, before = request.args.get('after'), request.args.get('before')
+    columns = (Opportunity.planned_submission_end, Opportunity.id)
+    page_key = KeysetPagination.page_key(columns, after, before)
+
+    def listing():
+        pagination = KeysetPagination(
+            Opportunity.listing_query().filter(Opportunity.is_submission_end),
+            columns, current_app.config['PER_PAGE'], descending=True,
+            after=after, before=before
+        )
 
-    current_app.logger.info('BEACON FRONT CLOSED OPPORTUNITY VIEW')
+        return Markup(render_template(
+            'beacon/front/_expired_listing.html', expired=pagination.items,
+            pagination=pagination
+        ))
 
-    return render_template(
-        'beacon/front/expired.html', expired=expired
-    )
+    def render():
+        # junk cursors all render the first page; don't give each its own
+        # cache entry
+        if page_key is None:
+            return render_template('beacon/front/expired.html', listing=listing())
+        return render_template(
+            'beacon/front/expired.html',
+            listing=cached_fragment(('expired', page_key), version, listing)
+        )
+
+    current_app.logger.info('BEACON FRONT CLOSED OPPORTUNITY VIEW')
+    return render_conditional(version, render)
 
 @blueprint.route('/opportunities/<int:opportunity_id>', methods=['GET', 'POST'])
 def detail(opportunity_id):
     '''View one opportunity in detail
 
     :status 200: Render the opportunity's detail template
+    :status 304: The browser's copy of the page is current
     :status 302: Signup for this particular opportunity via the
         :py:class:`~purchasing.forms.front.OpportunitySignupForm`
     '''
@@ -293,12 +398,26 @@ def detail(opportunity_id):
             opportunity.title.encode('ascii', 'ignore'), opportunity.id
         ))
 
-        return render_template(
-            'beacon/front/detail.html', opportunity=opportunity,
-            current_user=current_user, signup_form=signup_form,
-            question_form=question_form,
-            questions=opportunity.get_answered_questions()
-        )
+        version = opportunity.detail_version()
+
+        def fragments():
+            return dict([
+                (name, Markup(render_template(
+                    'beacon/front/_detail_{}.html'.format(name),
+                    opportunity=opportunity, current_user=current_user
+                ))) for name in ('title', 'description', 'timeline')
+            ])
+
+        def render():
+            return render_template(
+                'beacon/front/detail.html', opportunity=opportunity,
+                current_user=current_user, signup_form=signup_form,
+                question_form=question_form,
+                questions=opportunity.get_answered_questions(),
+                fragments=cached_fragment(('detail', opportunity.id), version, fragments)
+            )
+
+        return render_conditional(version, render)
     abort(404)
 
 @blueprint.route('/opportunities/<int:opportunity_id>/propose')
@@ -1,14 +1,10 @@
 # -*- coding: utf-8 -*-
 
 import time
-import datetime
-import urllib2
-import json
 
-from flask import jsonify, current_app, Blueprint
+from flask import jsonify, Blueprint
 
-from beacon.extensions import cache
-from beacon.models.public import AppStatus
+from beacon import health
 
 blueprint = Blueprint(
     'public', __name__, url_prefix='/app',
@@ -18,6 +14,13 @@ blueprint = Blueprint(
 @blueprint.route('/_status')
 def status():
     '''Reports about App Status
+
+    Every dependency is probed at the same time, each with a timeout, and
+    each probe's result is reused for ``STATUS_PROBE_TTL`` seconds. See
+    :py:mod:`beacon.health`.
+
+    :status 200: JSON with the overall ``status``, which is either ``ok``
+        or every problem that was found, most serious first
     '''
     response = {
         'status': 'ok',
@@ -25,46 +28,25 @@ def status():
         'resources': {}
     }
 
-    # order the try/except blocks in the reverse order of seriousness
-    # in terms of an outage
-    try:
-        url = 'https://sendgrid.com/api/stats.get.json?api_user={user}&api_key={_pass}&days={days}'.format(
-            user=current_app.config['MAIL_USERNAME'],
-            _pass=current_app.config['MAIL_PASSWORD'],
-            days=datetime.date.today().day
-        )
+    problems = []
+    for name, problem, resources in health.check():
+        response['resources'].update(resources)
+        if problem:
+            problems.append(problem)
 
-        sendgrid = json.loads(urllib2.urlopen(url).read())
-        sent = sum([m['delivered'] + m['repeat_bounces'] for m in sendgrid])
-        response['resources']['Sendgrid'] = '{}% used'.format((100 * float(sent)) / int(
-            current_app.config.get('SENDGRID_MONTHLY_LIMIT', 12000)
-        ))
+    if problems:
+        response['status'] = ' || '.join(problems)
 
-    except Exception, e:
-        response['status'] = 'Sendgrid is unavailable: {}'.format(e)
-
-    try:
-        # TODO: figure out some way to figure out if s3 is down
-        pass
-    except Exception, e:
-        response['status'] = 'S3 is unavailable: {}'.format(e)
+    response['updated'] = int(time.time())
+    return jsonify(response)
 
-    try:
-        redis_up = cache.cache._client.ping()
-        if not redis_up:
-            response['status'] = 'Redis is down or unavailable'
-    except Exception, e:
-        response['status'] = 'Redis is down or unavailable'
+@blueprint.route('/_status/live')
+def liveness():
+    '''Reports that the app is up and serving requests
 
-    try:
-        status = AppStatus.query.first()
-        if status.status != 'ok':
-            if response['status'] != 'ok':
-                response['status'] += ' || {}: {}'.format(status.status, status.message)
-            else:
-                response['status'] = '{}: {}'.format(status.status, status.message)
-    except Exception, e:
-        response['status'] = 'Database is unavailable: {}'.format(e)
+    Doesn't touch any dependency, so it is cheap enough to poll as often
+    as a load balancer likes.
 
-    response['updated'] = int(time.time())
-    return jsonify(response)
+    :status 200: JSON with a ``status`` of ``ok``
+    '''
+    return jsonify(status='ok', updated=int(time.time()))
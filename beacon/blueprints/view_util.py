@@ -1,13 +1,18 @@
 # -*- coding: utf-8 -*-
 
-from flask import session, current_app
+import time
+import hashlib
+
+from flask import session, current_app, request, make_response
+from flask_security import current_user
+from werkzeug.http import is_resource_modified
 from wtforms import widgets
 
 from beacon.database import db
 from beacon.notifications import Notification
 from beacon.models.users import User, Role
 from beacon.models.vendors import Vendor
-from beacon.models.opportunities.base import Opportunity
+from beacon.models.opportunities.base import Opportunity, opportunity_pages
 
 def parse_contact(contact_email, department):
     '''Finds or creates a user as the contact
@@ -139,9 +144,7 @@ def signup_for_opp(form, opportunity, multi=False):
     session['email'] = form.data.get('email')
     session['business_name'] = form.data.get('business_name')
     # subscribe the vendor to the opportunity
-    vendor = Vendor.query.filter(
-        Vendor.email == form.data.get('email')
-    ).first()
+    vendor = Vendor.for_email(form.data.get('email'))
 
     if vendor is None:
         vendor = Vendor(
@@ -195,5 +198,107 @@ def signup_for_opp(form, opportunity, multi=False):
             html_template='beacon/emails/oppselected.html',
             opportunities=email_opportunities
         ).send()
+        db.session.commit()
 
     return True
+
+def _visitor_key():
+    '''Everything about the current visitor that changes how a public
+    page renders
+    '''
+    vendor = Vendor.for_email(session.get('email'))
+
+    # forms on the page carry a csrf token that expires, so pages are
+    # re-rendered well before a cached copy's token would stop working
+    csrf = None
+    if current_app.config.get('WTF_CSRF_ENABLED', True) and 'csrf_token' in session:
+        time_limit = current_app.config.get('WTF_CSRF_TIME_LIMIT', 3600)
+        csrf = (
+            session['csrf_token'],
+            int(time.time() // (time_limit / 2)) if time_limit else None
+        )
+
+    return (
+        None if current_user.is_anonymous else current_user.id,
+        session.get('email'), session.get('business_name'),
+        (vendor.id, vendor.created_at, vendor.updated_at) if vendor else None,
+        csrf
+    )
+
+def cached_fragment(name, version, render):
+    '''Render part of a public page, cached for anonymous visitors
+
+    Visitors who aren't logged in and haven't given us an email address
+    all see the same opportunity listings and details, so those parts of
+    the page are rendered once and kept in the Flask-Cache backend. The
+    cached copy is keyed on the page's data ``version``, and is expired by
+    :py:data:`~beacon.models.opportunities.base.opportunity_pages`
+    whenever an opportunity changes. Everyone else gets a fresh render.
+
+    Arguments:
+        name: Unique name for the fragment. Fragments that render
+            differently depending on the request should pass a tuple of
+            the name and the relevant request arguments
+        version: Two-tuple of a key and last changed time for the page's
+            data, like :py:meth:`~beacon.models.opportunities.base.Opportunity.listing_version`
+        render: Function that queries for and renders the fragment
+
+    Returns:
+        Whatever ``render`` returns
+    '''
+    if not current_user.is_anonymous or session.get('email'):
+        return render()
+
+    key, _ = version
+    return opportunity_pages.get_derived(repr((name, key)), render)
+
+def render_conditional(version, render):
+    '''Render a public page, unless the browser's copy is still current
+
+    Pages are sent with an ``ETag`` built from the ``version`` of the data
+    on the page and from who is looking at it, and a conditional ``GET``
+    with a matching ``If-None-Match`` gets an empty 304 response without
+    the page's queries or template ever running. Pages that look the same to everyone (the visitor
+    is anonymous and has no session) also get a ``Last-Modified`` header,
+    and can be kept by shared caches for ``PUBLIC_PAGE_MAX_AGE`` seconds.
+    Everything else must be revalidated by the browser on each view.
+
+    Arguments:
+        version: Two-tuple of a key that changes whenever the page's data
+            does, and the naive UTC time that the data last changed, like
+            :py:meth:`~beacon.models.opportunities.base.Opportunity.listing_version`
+        render: Function that queries for and renders the page
+
+    Returns:
+        The rendered response, or an empty 304 response
+    '''
+    if request.method not in ('GET', 'HEAD') or '_flashes' in session:
+        # flashed messages are only shown once, so don't keep the page
+        response = make_response(render())
+        response.cache_control.no_store = True
+        return response
+
+    key, last_modified = version
+    etag = hashlib.sha1(repr((key, _visitor_key()))).hexdigest()
+    shared = current_user.is_anonymous and not session
+
+    if is_resource_modified(
+        request.environ, etag=etag, last_modified=last_modified if shared else None
+    ):
+        response = make_response(render())
+        # rendering forms can start a session
+        shared = shared and not session
+    else:
+        response = current_app.response_class(status=304)
+
+    response.set_etag(etag)
+    if shared:
+        response.last_modified = last_modified
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config['PUBLIC_PAGE_MAX_AGE']
+        response.vary.add('Cookie')
+    else:
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+
+    return response
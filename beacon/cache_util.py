@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+'''Helpers for caching values that rarely change.'''
+
+import uuid
+import hashlib
+
+from beacon.extensions import cache
+
+class VersionedCache(object):
+    '''Process-local cache of an expensive value, checked against a shared version stamp
+
+    The built value is kept in memory along with the version stamp it was
+    built for. On each read, the current version stamp is looked up in the
+    configured Flask-Cache backend (Redis in production). If it matches, the
+    in-process copy is used. Otherwise the value is taken from the Flask-Cache
+    backend if another process has already built it for that version, or
+    rebuilt and stored there.
+
+    Invalidating the cache only needs to write a new version stamp, so every
+    process picks up the change on its next read.
+
+    Arguments:
+        name: Unique name for the cached value, used to build cache keys
+
+    Keyword Arguments:
+        builder: Function that takes no arguments and builds the value.
+            Only needed by :py:meth:`get`; caches that only hold derived
+            values can leave it out
+        timeout: How long, in seconds, the version stamp and shared copy
+            should live in the Flask-Cache backend, defaults to one day.
+            Our version of werkzeug has no way to cache a key forever, and
+            an expired stamp only causes one extra rebuild.
+    '''
+    def __init__(self, name, builder=None, timeout=60 * 60 * 24):
+        self.name = name
+        self.builder = builder
+        self.timeout = timeout
+        self._local = None
+
+    @property
+    def version_key(self):
+        return 'versioned-cache:{}:version'.format(self.name)
+
+    @property
+    def value_key(self):
+        return 'versioned-cache:{}:value'.format(self.name)
+
+    def get_version(self):
+        '''Get the current version stamp, creating one if it doesn't exist
+        '''
+        version = cache.get(self.version_key)
+        if version is None:
+            version = self.invalidate()
+        return version
+
+    def get(self):
+        '''Get the cached value, rebuilding it if it is out of date
+        '''
+        version = self.get_version()
+
+        local = self._local
+        if local is not None and local[0] == version:
+            return local[1]
+
+        shared = cache.get(self.value_key)
+        if shared is None or shared[0] != version:
+            shared = (version, self.builder())
+            cache.set(self.value_key, shared, timeout=self.timeout)
+
+        self._local = shared
+        return shared[1]
+
+    def get_derived(self, key, builder):
+        '''Get a value built from the same data as the cached value
+
+        Derived values, like the results of a search over the cached data,
+        are only kept in the Flask-Cache backend, under the current version
+        stamp, so invalidating this cache expires them as well.
+
+        Arguments:
+            key: Unique key for the derived value
+            builder: Function that takes no arguments and builds the
+                value, or returns None for a value that shouldn't be kept
+        '''
+        cache_key = 'versioned-cache:{}:{}:{}'.format(
+            self.name, self.get_version(), hashlib.md5(key.encode('utf-8')).hexdigest()
+        )
+        value = cache.get(cache_key)
+        if value is None:
+            value = builder()
+            if value is not None:
+                cache.set(cache_key, value, timeout=self.timeout)
+        return value
+
+    def invalidate(self):
+        '''Write a new version stamp, which expires all cached copies
+
+        Returns:
+            The new version stamp
+        '''
+        version = uuid.uuid4().hex
+        cache.set(self.version_key, version, timeout=self.timeout)
+        self._local = None
+        return version
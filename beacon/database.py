@@ -2,13 +2,19 @@
 """Database module, including the SQLAlchemy database object and DB-related
 utilities.
 """
+import base64
 import datetime
+import json
 
 import sqlalchemy
+import dateutil.parser
 
+from flask import current_app
 from flask_security import current_user
 
 from sqlalchemy.sql.functions import GenericFunction
+from sqlalchemy.sql.expression import ColumnElement
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import relationship
 
 from sqlalchemy.exc import IntegrityError
@@ -135,6 +141,37 @@ def before_update(mapper, connection, instance):
 
 # From Mike Bayer's "Building the app" talk
 # https://speakerdeck.com/zzzeek/building-the-app
+def on_commit(callback):
+    '''Run a function once the session's current transaction commits
+
+    Use this for side effects that other processes act on, like queueing
+    celery tasks, so that they only happen once the rows they need are
+    committed, and never happen if the transaction is rolled back. The
+    function is called after the commit, when the session can't run any
+    more queries, so it has to use its own connection if it needs one.
+
+    Arguments:
+        callback: Function that takes no arguments
+    '''
+    db.session.info.setdefault('on_commit', []).append(callback)
+
+@sqlalchemy.event.listens_for(sqlalchemy.orm.Session, 'after_commit')
+def run_on_commit(session):
+    if session.transaction is not None and session.transaction.nested:
+        return
+    for callback in session.info.pop('on_commit', []):
+        try:
+            callback()
+        except Exception:
+            current_app.logger.exception('Could not run {} after commit'.format(callback))
+
+@sqlalchemy.event.listens_for(sqlalchemy.orm.Session, 'after_transaction_end')
+def discard_on_commit(session, transaction):
+    # whatever is left wasn't committed: the transaction was rolled back
+    # or the session was closed
+    if transaction._parent is None:
+        session.info.pop('on_commit', None)
+
 class SurrogatePK(object):
     """A mixin that adds a surrogate integer 'primary key' column named
     ``id`` to any declarative-mapped class.
@@ -184,3 +221,195 @@ def get_or_create(session, model, create_method='', create_method_kwargs=None, *
 class SplitPart(GenericFunction):
     package = 'string'
     name = 'split_part'
+
+class StringAgg(ColumnElement):
+    '''Sorted, de-duplicated ``string_agg`` of a text column
+
+    Renders as ``string_agg(DISTINCT col, sep ORDER BY col)``, with ``col``
+    cast to text in the "C" collation.
+    The "C" collation sorts the same way as Python's ``sorted``, so the
+    result matches :py:func:`~beacon.utils.build_downloadable_groups`.
+
+    Arguments:
+        column: Text column to aggregate
+        separator: String to put between the values
+    '''
+    type = sqlalchemy.types.Text()
+
+    def __init__(self, column, separator):
+        self.column = column
+        self.separator = separator
+
+@compiles(StringAgg)
+def compile_string_agg(element, compiler, **kwargs):
+    column = 'CAST({} AS TEXT) COLLATE "C"'.format(compiler.process(element.column, **kwargs))
+    return 'string_agg(DISTINCT {column}, {separator} ORDER BY {column})'.format(
+        column=column,
+        separator=compiler.process(sqlalchemy.literal(element.separator), **kwargs)
+    )
+
+def localize_today_sql():
+    '''SQL expression for today's date in the configured display timezone
+
+    The SQL counterpart to :py:func:`~beacon.utils.localize_today`, so that
+    date comparisons can be evaluated by Postgres instead of per-row in Python.
+    '''
+    return db.cast(
+        db.func.timezone(current_app.config['DISPLAY_TIMEZONE'].zone, db.func.now()),
+        db.Date
+    )
+
+def utcnow_sql():
+    '''SQL expression for the current naive UTC timestamp
+
+    All of our DateTime columns are stored as naive UTC, so this is what they
+    should be compared against.
+    '''
+    return db.func.timezone('UTC', db.func.now())
+
+class KeysetPagination(object):
+    '''Keyset ("seek") pagination over a query
+
+    Instead of an OFFSET, which makes the database walk and throw away every
+    skipped row, each page is fetched by filtering on the sort key of the
+    row at the edge of the neighbouring page. As long as there is an index
+    on the sort key, every page costs the same as the first one.
+
+    Arguments:
+        query: The base query to paginate
+        columns: Tuple of model columns to sort by. Together they must be
+            unique (generally the last column should be the primary key)
+        per_page: Number of items on each page
+
+    Keyword Arguments:
+        after: Cursor of the row that this page should start after
+        before: Cursor of the row that this page should end before
+        descending: Sort the columns in descending instead of ascending order
+
+    Attributes:
+        items: List of items on the current page
+        has_next: True if there is a page after this one
+        has_prev: True if there is a page before this one
+        next_cursor: Cursor to pass as ``after`` to get the next page
+        prev_cursor: Cursor to pass as ``before`` to get the previous page
+    '''
+    def __init__(self, query, columns, per_page, after=None, before=None, descending=False):
+        self.columns = columns
+        self.per_page = per_page
+        self.descending = descending
+
+        after, before = self.decode_cursor(columns, after), self.decode_cursor(columns, before)
+        backwards = after is None and before is not None
+        cursor = before if backwards else after
+
+        # walking backwards flips both the comparison and the sort order
+        desc = not descending if backwards else descending
+        if cursor is not None:
+            key, values = db.tuple_(*columns), db.tuple_(*cursor)
+            query = query.filter(key < values if desc else key > values)
+
+        query = query.order_by(*[i.desc() if desc else i.asc() for i in columns])
+
+        items = query.limit(per_page + 1).all()
+        has_more = len(items) > per_page
+        items = items[:per_page]
+
+        if backwards:
+            items.reverse()
+            self.has_prev, self.has_next = has_more, True
+        else:
+            self.has_prev, self.has_next = cursor is not None, has_more
+
+        self.items = items
+        self.prev_cursor = self.encode_cursor(items[0]) if items and self.has_prev else None
+        self.next_cursor = self.encode_cursor(items[-1]) if items and self.has_next else None
+
+    def encode_cursor(self, item):
+        '''Build an opaque, url-safe cursor from an item's sort key
+        '''
+        values = []
+        for column in self.columns:
+            value = getattr(item, column.key)
+            if isinstance(value, (datetime.datetime, datetime.date)):
+                value = value.isoformat()
+            values.append(value)
+        return base64.urlsafe_b64encode(json.dumps(values))
+
+    @classmethod
+    def page_key(cls, columns, after=None, before=None):
+        '''Build a key for the page that a pair of cursors points at
+
+        The key is built from the decoded sort key values rather than the
+        cursors themselves, so differently spelled cursors for the same
+        page share a key, and ``before`` is dropped when ``after`` wins.
+
+        Arguments:
+            columns: The columns the pagination sorts by
+
+        Keyword Arguments:
+            after: Cursor of the row that the page starts after
+            before: Cursor of the row that the page ends before
+
+        Returns:
+            Tuple of the decoded ``after`` and ``before`` values, or None
+            if either cursor is malformed
+        '''
+        decoded = [cls.decode_cursor(columns, after), cls.decode_cursor(columns, before)]
+        if (after and decoded[0] is None) or (before and decoded[1] is None):
+            return None
+        if decoded[0] is not None:
+            decoded[1] = None
+        return tuple(tuple(i) if i is not None else None for i in decoded)
+
+    @classmethod
+    def decode_cursor(cls, columns, cursor):
+        '''Turn a cursor back into sort key values
+
+        Cursors come straight from the query string, so each value is
+        checked against its column's type before it gets anywhere near
+        the database.
+
+        Arguments:
+            columns: The columns the cursor's values belong to
+            cursor: Cursor from the query string
+
+        Returns:
+            List of values, one for each column, or None if the cursor is
+            missing or malformed
+        '''
+        if not cursor:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(str(cursor)))
+            if not isinstance(values, list) or len(values) != len(columns):
+                return None
+            return [
+                cls.coerce(column, value)
+                for column, value in zip(columns, values)
+            ]
+        except (TypeError, ValueError, AttributeError, OverflowError):
+            return None
+
+    @staticmethod
+    def coerce(column, value):
+        '''Convert a value from a cursor to its column's type
+
+        Raises:
+            TypeError or ValueError if the value doesn't fit the column
+        '''
+        if isinstance(column.type, (db.DateTime, db.Date)):
+            if not isinstance(value, basestring):
+                raise TypeError('Expected a date, got {!r}'.format(value))
+            return dateutil.parser.parse(value)
+
+        if isinstance(column.type, db.Integer):
+            if isinstance(value, bool) or not isinstance(value, (int, long, basestring)):
+                raise TypeError('Expected an integer, got {!r}'.format(value))
+            value = int(value)
+            if not isinstance(column.type, db.BigInteger) and not -2 ** 31 <= value < 2 ** 31:
+                raise ValueError('{} is out of range'.format(value))
+            return value
+
+        if isinstance(column.type, db.String) and not isinstance(value, basestring):
+            raise TypeError('Expected a string, got {!r}'.format(value))
+        return value
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+'''Serialize streams of rows for bulk downloads
+
+Each format is a generator function that takes a header (a list of column
+names) and an iterable of rows (lists of values in the same order as the
+header), and yields chunks of the serialized file, so a download can be
+streamed straight from a database cursor. :py:func:`gzipped` compresses
+any of those streams as it goes.
+'''
+
+import csv
+import json
+import zlib
+import datetime
+import cStringIO
+import collections
+
+import pytz
+import dateutil.parser
+
+def _encode(value):
+    if value is None:
+        return ''
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return str(value)
+
+def _serialize(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError('{} is not JSON serializable'.format(repr(value)))
+
+def to_tsv(header, rows, quoted=()):
+    '''Tab-separated rows
+
+    Keyword Arguments:
+        quoted: Names of columns whose values should be wrapped in double
+            quotes, for lists that are joined into one value
+    '''
+    quoted = [i in quoted for i in header]
+
+    yield u'\t'.join(header) + u'\n'
+    for row in rows:
+        yield u'\t'.join([
+            u'"{}"'.format(value) if quote else unicode(value)
+            for value, quote in zip(row, quoted)
+        ]) + u'\n'
+
+def to_csv(header, rows, quoted=()):
+    '''Comma-separated rows, quoted by the :py:mod:`csv` module'''
+    buf = cStringIO.StringIO()
+    writer = csv.writer(buf)
+
+    writer.writerow([_encode(i) for i in header])
+    for row in rows:
+        writer.writerow([_encode(i) for i in row])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    yield buf.getvalue()
+
+def to_jsonl(header, rows, quoted=()):
+    '''One JSON object per line, keyed by the header'''
+    for row in rows:
+        yield json.dumps(
+            collections.OrderedDict(zip(header, row)), default=_serialize
+        ) + '\n'
+
+EXPORT_FORMATS = {
+    'tsv': (to_tsv, 'text/tsv'),
+    'csv': (to_csv, 'text/csv'),
+    'jsonl': (to_jsonl, 'application/x-ndjson'),
+}
+
+def gzipped(chunks, level=6):
+    '''Gzip a stream of chunks as they are generated
+
+    Arguments:
+        chunks: Iterable of strings. Unicode chunks are encoded as utf-8
+
+    Keyword Arguments:
+        level: zlib compression level
+
+    Yields:
+        Chunks of a gzip file
+    '''
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        if isinstance(chunk, unicode):
+            chunk = chunk.encode('utf-8')
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def parse_since(value):
+    '''Parse the timestamp of an incremental export
+
+    Timestamps are stored as naive UTC, so timestamps with a timezone are
+    converted to UTC and timestamps without one are taken to already be UTC.
+
+    Returns:
+        Naive UTC datetime
+
+    Raises:
+        ValueError: If the value can't be parsed as a timestamp
+    '''
+    since = dateutil.parser.parse(value)
+    if since.tzinfo is not None:
+        since = since.astimezone(pytz.UTC).replace(tzinfo=None)
+    return since
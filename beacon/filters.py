@@ -28,10 +28,22 @@ PARAGRAPH = re.compile(r'(?:\r\n|\r|\n){2,}')
 def format_currency(value):
     return "${:,.2f}".format(value)
 
-def url_for_other_page(page):
+def url_for_other_page(page=None, **kwargs):
+    '''Build a link to a different page of the current view
+
+    Arguments:
+        page: Page number to link to, left out for keyset-paginated views
+
+    Keyword Arguments:
+        **kwargs: Additional query arguments to set, like the ``after`` or
+            ``before`` cursors of a :py:class:`~beacon.database.KeysetPagination`.
+            Arguments set to None are removed from the link.
+    '''
     args = dict(request.view_args.items() + request.args.to_dict().items())
-    args['page'] = page
-    return url_for(request.endpoint, **args)
+    if page is not None:
+        args['page'] = page
+    args.update(kwargs)
+    return url_for(request.endpoint, **dict((k, v) for k, v in args.items() if v is not None))
 
 def thispage():
     try:
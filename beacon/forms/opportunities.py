@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 import os
+import re
 import json
 import pytz
 
@@ -17,6 +18,8 @@ from wtforms.validators import DataRequired, Email, Optional
 
 from wtforms.ext.sqlalchemy.fields import QuerySelectField, QuerySelectMultipleField
 
+from beacon.database import db
+from beacon.cache_util import VersionedCache
 from beacon.models.opportunities.base import Opportunity
 from beacon.models.opportunities.documents import RequiredBidDocument
 from beacon.models.vendors import Category
@@ -34,6 +37,65 @@ from beacon.forms.extras import (
 
 from beacon.utils import connect_to_s3, _get_aggressive_cache_headers
 
+def group_categories(all_categories):
+    '''Group subcategories under their parent categories
+
+    Arguments:
+        all_categories: A list of :py:class:`~purchasing.models.front.Category`
+            objects, or rows with ``id``, ``category``, and
+            ``category_friendly_name`` attributes
+
+    Returns:
+        Two-tuple of (choices for the parent category select field, dictionary
+        with top-level parent category names as keys and list of that parent's
+        subcategories as values)
+    '''
+    categories, subcategories = set(), defaultdict(list)
+    for category in all_categories:
+        categories.add(category.category)
+        subcategories['Select All'].append((category.id, '{} - {}'.format(
+            category.category_friendly_name, category.category
+        )))
+        subcategories[category.category].append(
+            (category.id, category.category_friendly_name)
+        )
+
+    choices = list(sorted(zip(categories, categories))) + [('Select All', 'Select All')]
+    choices.insert(0, ('', '-- Choose One --'))
+    return choices, subcategories
+
+def build_category_tree(all_categories=None):
+    '''Build everything the :py:class:`CategoryForm` needs to render categories
+
+    Arguments:
+        all_categories: A list of :py:class:`~purchasing.models.front.Category` objects,
+            or None. If None, loads all Categories.
+
+    Returns:
+        A dictionary with the parent category ``choices``, the
+        ``subcategories`` of each parent category, and the JSON-encoded
+        display ``categories`` used by the templates
+    '''
+    if all_categories is None:
+        all_categories = db.session.query(
+            Category.id, Category.category, Category.category_friendly_name
+        ).all()
+
+    choices, subcategories = group_categories(all_categories)
+    display_categories = [i for i in subcategories.keys() if i != 'Select All']
+
+    return {
+        'choices': choices,
+        'subcategories': dict(subcategories),
+        'categories': json.dumps(sorted(display_categories))
+    }
+
+#: Shared cache of :py:func:`build_category_tree` for all categories.
+#: Categories only change on import, which invalidates it. Category
+#: typeahead results are cached along with it, see
+#: :py:meth:`~beacon.cache_util.VersionedCache.get_derived`.
+category_tree = VersionedCache('category-tree', build_category_tree)
+
 class CategoryForm(Form):
     '''Base form for anything involving Beacon categories
 
@@ -68,7 +130,8 @@ class CategoryForm(Form):
         return self._categories
 
     def get_subcategories(self):
-        '''Getter for the form's subcategories
+        '''Getter for the form's subcategories, as a dictionary of parent
+        category names to lists of (id, name) pairs
         '''
         return self._subcategories
 
@@ -105,19 +168,8 @@ class CategoryForm(Form):
             A dictionary with top-level parent category names as keys and
                 list of that parent's subcategories as values.
         '''
-        categories, subcategories = set(), defaultdict(list)
-        for category in all_categories:
-            categories.add(category.category)
-            subcategories['Select All'].append((category.id, '{} - {}'.format(
-                category.category_friendly_name, category.category
-            )))
-            subcategories[category.category].append(
-                (category.id, category.category_friendly_name)
-            )
-
-        self.categories.choices = list(sorted(zip(categories, categories))) + [('Select All', 'Select All')]
-        self.categories.choices.insert(0, ('', '-- Choose One --'))
-
+        choices, subcategories = group_categories(all_categories)
+        self.categories.choices = choices
         self.subcategories.choices = []
         return subcategories
 
@@ -130,22 +182,22 @@ class CategoryForm(Form):
 
         Arguments:
             all_categories: A list of :py:class:`~purchasing.models.front.Category` objects,
-            or None. If None, defaults to all Categories.
+            or None. If None, defaults to all Categories, read from the
+            :py:data:`category_tree` cache.
         '''
-        all_categories = all_categories if all_categories else Category.query.all()
-        subcategories = self.build_categories(all_categories)
-        self._subcategories = json.dumps(subcategories)
-        display_categories = subcategories.keys()
-
-        if 'Select All' in display_categories:
-            display_categories.remove('Select All')
-        self._categories = json.dumps(sorted(display_categories))
+        tree = build_category_tree(all_categories) if all_categories else category_tree.get()
+        # copy the choices so that validation can't modify the cached list
+        self.categories.choices = list(tree['choices'])
+        self.subcategories.choices = []
+        self._subcategories = tree['subcategories']
+        self._categories = tree['categories']
 
     def process(self, formdata=None, obj=None, data=None, **kwargs):
         '''Process the form and append data to the ``categories``
 
-        Manually iterates through the flask Request.form, appending valid
-        Categories to the form's ``categories`` data
+        Manually iterates through the flask Request.form, collecting the ids of
+        all checked subcategories. These are then looked up in a single query,
+        and the valid Categories are appended to the form's ``categories`` data.
 
         See Also:
             For more information about parameters, see the `Wtforms base form
@@ -154,22 +206,34 @@ class CategoryForm(Form):
         super(CategoryForm, self).process(formdata, obj, data, **kwargs)
 
         self.categories.data = obj.categories if obj and hasattr(obj, 'categories') else set()
-        subcats = set()
+        subcat_ids = set()
 
         for k, v in request.form.iteritems():
             if not k.startswith('subcategories-'):
                 continue
-            else:
-                subcat_id = int(k.split('-')[1])
-                # make sure the field is checked (or 'on') and we don't have it already
-                if v == 'on' and subcat_id not in subcats:
-                    subcats.add(subcat_id)
-                    subcat = Category.query.get(subcat_id)
-                    # make sure it's a valid category_friendly_name
-                    if subcat is None:
-                        self.errors['subcategories'] = ['{} is not a valid choice!'.format(subcat)]
-                        break
-                    self.categories.data.add(subcat)
+            # make sure the field is checked (or 'on')
+            if v == 'on':
+                subcat_ids.add(k.split('-', 1)[1])
+
+        if len(subcat_ids) == 0:
+            return
+
+        # anything that isn't a plain integer that fits in the id column
+        # is reported as invalid below, without going to the database
+        int_ids = [
+            int(i) for i in subcat_ids
+            if re.match(r'^[0-9]+$', i) and int(i) <= 2 ** 31 - 1
+        ]
+        subcats = Category.query.filter(Category.id.in_(int_ids)).all() if int_ids else []
+
+        # make sure they are all valid categories
+        invalid = subcat_ids.difference(set([str(i.id) for i in subcats]))
+        if invalid:
+            self.errors['subcategories'] = [
+                u'{} is not a valid choice!'.format(i) for i in sorted(invalid)
+            ]
+
+        self.categories.data.update(subcats)
 
 class VendorSignupForm(CategoryForm):
     '''Signup form vendors use to sign up for Beacon updates
@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 
 from flask import flash, redirect, url_for
-from sqlalchemy.orm.exc import NoResultFound
 
 from flask_wtf import Form
 from wtforms import fields
@@ -23,12 +22,10 @@ class QuestionForm(Form):
     submit = fields.SubmitField()
 
     def post_validate_action(self, opportunity):
-        try:
-            vendor = Vendor.query.filter(
-                Vendor.email == self.email.data
-            ).one()
+        vendor = Vendor.for_email(self.email.data)
+        if vendor:
             vendor.update(business_name=self.business_name.data)
-        except NoResultFound:
+        else:
             vendor = Vendor.create(
                 email=self.email.data,
                 business_name=self.business_name.data
@@ -47,6 +44,7 @@ class QuestionForm(Form):
             html_template='beacon/emails/new_question.html',
             question=question
         ).send(multi=True)
+        db.session.commit()
 
         flash('''
             Thank you! Your question has been submitted
@@ -16,7 +16,7 @@ def email_present(form, field):
     '''Checks that we have a vendor with that email address
     '''
     if field.data:
-        vendor = Vendor.query.filter(Vendor.email == field.data).first()
+        vendor = Vendor.for_email(field.data)
         if vendor is None:
             raise ValidationError("We can't find the email {}!".format(field.data))
 
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+'''Probes of the services that the app depends on
+
+Each probe is a function that takes a timeout in seconds, checks one
+dependency, and returns a two-tuple of a problem (a string, or None if the
+dependency is healthy) and a dictionary of resources to report. Probes are
+run at the same time in their own threads by :py:func:`check`, and their
+results are kept in memory for ``STATUS_PROBE_TTL`` seconds, so a busy
+uptime monitor doesn't cause a round-trip to every dependency on each poll.
+
+Errors that the app serves are collected by :py:data:`errors`, which
+writes a summary of them to :py:class:`~beacon.models.public.AppStatus`.
+'''
+
+import time
+import json
+import urllib
+import urllib2
+import datetime
+import threading
+import collections
+
+import redis
+from flask import current_app
+
+from beacon.database import db
+from beacon.models.public import AppStatus
+
+class ErrorAggregator(object):
+    '''Count errors in memory, and write a summary of them to
+    :py:class:`~beacon.models.public.AppStatus` at most once per interval
+
+    During an outage every failing request would otherwise write to the
+    same ``AppStatus`` row. Instead, the first error is written right away,
+    and the errors after it are coalesced until ``ERROR_FLUSH_INTERVAL``
+    seconds have passed since the last write. The app flushes at the end of
+    every request and when the process exits, so the coalesced errors are
+    written even if no more errors come in.
+
+    Attributes:
+        count: Number of errors that haven't been written yet
+        message: Message of the most recent error that hasn't been written
+        flushed_at: Unix timestamp of the last write
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.message = None
+        self.flushed_at = 0
+
+    def record(self, error, now=None):
+        '''Count an error, and write the summary if it is due
+
+        Arguments:
+            error: The exception, or a message describing the error
+
+        Keyword Arguments:
+            now: Unix timestamp of the error, defaults to the current time
+
+        Returns:
+            True if a summary was written, False otherwise
+        '''
+        with self.lock:
+            self.count += 1
+            self.message = str(error)
+        return self.flush(now=now)
+
+    def flush(self, force=False, now=None):
+        '''Write the errors counted since the last write to ``AppStatus``
+
+        The write uses its own connection, so that it works even when the
+        error left the request's session in a failed transaction. If it
+        fails, the errors are kept for the next write.
+
+        Keyword Arguments:
+            force: Write any pending errors, even if the interval since
+                the last write hasn't passed
+            now: Unix timestamp to check the interval against, defaults
+                to the current time
+
+        Returns:
+            True if a summary was written, False otherwise
+        '''
+        now = now or time.time()
+        with self.lock:
+            if not self.count or (
+                not force and
+                now - self.flushed_at < current_app.config['ERROR_FLUSH_INTERVAL']
+            ):
+                return False
+            count, message = self.count, self.message
+            self.count, self.message, self.flushed_at = 0, None, now
+
+        table = AppStatus.__table__
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(table.update().values(
+                    status='error', message=message,
+                    last_updated=datetime.datetime.utcnow(),
+                    error_count=db.func.coalesce(table.c.error_count, 0) + count
+                ))
+        except Exception:
+            current_app.logger.exception('Could not write errors to AppStatus')
+            with self.lock:
+                self.count += count
+                self.message = self.message or message
+            return False
+
+        return True
+
+    def clear(self):
+        '''Forget every pending error
+        '''
+        with self.lock:
+            self.count, self.message, self.flushed_at = 0, None, 0
+
+#: Errors served by this process, see :py:class:`ErrorAggregator`
+errors = ErrorAggregator()
+
+def probe_sendgrid(timeout):
+    '''Check how much of our monthly Sendgrid quota has been used
+    '''
+    url = '{}?{}'.format(
+        current_app.config['SENDGRID_STATS_URL'], urllib.urlencode([
+            ('api_user', current_app.config['MAIL_USERNAME']),
+            ('api_key', current_app.config['MAIL_PASSWORD']),
+            ('days', datetime.date.today().day)
+        ])
+    )
+
+    stats = json.loads(urllib2.urlopen(url, timeout=timeout).read())
+    sent = sum([m['delivered'] + m['repeat_bounces'] for m in stats])
+    return None, {'Sendgrid': '{}% used'.format((100 * float(sent)) / int(
+        current_app.config.get('SENDGRID_MONTHLY_LIMIT', 12000)
+    ))}
+
+def probe_redis(timeout):
+    '''Check that Redis answers a ``PING``
+    '''
+    client = redis.StrictRedis.from_url(
+        current_app.config['STATUS_REDIS_URL'],
+        socket_timeout=timeout, socket_connect_timeout=timeout
+    )
+    if not client.ping():
+        return 'Redis is down or unavailable', {}
+    return None, {}
+
+def probe_database(timeout):
+    '''Check that Postgres is up, and report the status that our jobs
+    and :py:data:`errors` have recorded in
+    :py:class:`~beacon.models.public.AppStatus`
+    '''
+    # errors from this process that are still waiting for their interval
+    errors.flush(force=True)
+
+    status = AppStatus.query.first()
+    if status.status != 'ok':
+        problem = '{}: {}'.format(status.status, status.message)
+        if status.error_count:
+            problem += ' ({} errors)'.format(status.error_count)
+        return problem, {}
+    return None, {}
+
+#: Probes, from the most to the least serious outage, with the name that
+#: each one reports problems under
+PROBES = collections.OrderedDict([
+    ('Database', probe_database),
+    ('Redis', probe_redis),
+    ('Sendgrid', probe_sendgrid),
+])
+
+_results = {}
+
+def _run(app, name, probe, timeout, results):
+    with app.app_context():
+        try:
+            results[name] = probe(timeout)
+        except Exception, e:
+            results[name] = ('{} is unavailable: {}'.format(name, e), {})
+
+def run_probes(names, timeout):
+    '''Run probes at the same time, waiting at most ``timeout`` seconds
+
+    Arguments:
+        names: Names of the probes in :py:data:`PROBES` to run
+        timeout: Seconds to wait for all of the probes to finish
+
+    Returns:
+        Dictionary of each probe's name to its result. Probes that don't
+        finish in time report that they timed out.
+    '''
+    results = {}
+    app = current_app._get_current_object()
+    threads = []
+    for name in names:
+        thread = threading.Thread(
+            target=_run, args=(app, name, PROBES[name], timeout, results)
+        )
+        # a hung probe shouldn't keep the worker from shutting down
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+
+    deadline = time.time() + timeout
+    for thread in threads:
+        thread.join(max(deadline - time.time(), 0))
+
+    return dict([
+        (name, results.get(name, (
+            '{} timed out after {} seconds'.format(name, timeout), {}
+        ))) for name in names
+    ])
+
+def check(now=None):
+    '''Get the result of every probe, running the ones that are out of date
+
+    Keyword Arguments:
+        now: Unix timestamp to check expiry against, defaults to the
+            current time
+
+    Returns:
+        List of (name, problem, resources) tuples, in the order of
+        :py:data:`PROBES`
+    '''
+    now = now or time.time()
+    stale = [name for name in PROBES if _results.get(name, (0, ))[0] <= now]
+
+    if stale:
+        expires = now + current_app.config['STATUS_PROBE_TTL']
+        fresh = run_probes(stale, current_app.config['STATUS_PROBE_TIMEOUT'])
+        for name, result in fresh.iteritems():
+            _results[name] = (expires, result)
+
+    return [(name, ) + _results[name][1] for name in PROBES]
+
+def clear():
+    '''Forget every cached probe result
+    '''
+    _results.clear()
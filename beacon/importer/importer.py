@@ -24,15 +24,11 @@ def extract(file_target, first_row_headers=[]):
         first_row_headers: An optional list of headers that can
             be used as the keys in the returned DictReader
 
-    Returns:
-        A :py:class:`~csv.DictReader` object.
+    Yields:
+        Rows of the file as dictionaries, read one at a time
     '''
-    data = []
-
     with open(file_target, 'rU') as f:
         fieldnames = first_row_headers if len(first_row_headers) > 0 else None
         reader = csv.DictReader(f, fieldnames=fieldnames)
         for row in reader:
-            data.append(row)
-
-    return data
\ No newline at end of file
+            yield row
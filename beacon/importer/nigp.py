@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+import csv
+
 from beacon.database import db, get_or_create
 from beacon.models.vendors import Category
 from beacon.importer import extract, convert_empty_to_none
@@ -21,11 +23,81 @@ def parse_examples_tsv(examples):
     else:
         return db.func.to_tsvector(' '.join([i.strip() for i in examples.split('|')]))
 
-def main(file_target='./files/2015-05-27-nigp-cleaned.csv'):
-    data = extract(file_target)
+def _nullable(header, column):
+    '''SQL for a column of the import table, with the same empty values
+    as :py:func:`~beacon.importer.convert_empty_to_none`
+    '''
+    if column not in header:
+        return 'NULL'
+    return '''NULLIF(NULLIF("{}", ''), 'None')'''.format(column)
+
+def bulk_import(file_target):
+    '''Import NIGP categories from a csv with a few set-wise statements
+
+    The csv is streamed into a temporary table with ``COPY``, then parsed
+    and inserted into the ``category`` table with one ``INSERT``. Like the
+    row-by-row import, categories that exactly match an existing category
+    are skipped, so re-importing the same file is safe.
+
+    Arguments:
+        file_target: Path to the csv file. The first row must be the header
+
+    Returns:
+        Number of new categories
+    '''
+    with open(file_target, 'rU') as f:
+        header = next(csv.reader(f))
+
+    db.session.execute('CREATE TEMPORARY TABLE nigp_import ({}) ON COMMIT DROP'.format(
+        ', '.join(['"{}" text'.format(i.replace('"', '""')) for i in header])
+    ))
+
+    cursor = db.session.connection().connection.cursor()
+    with open(file_target, 'rb') as f:
+        cursor.copy_expert('COPY nigp_import FROM STDIN WITH CSV HEADER', f)
+
+    result = db.session.execute(r'''
+        INSERT INTO category (
+            nigp_codes, category, subcategory, category_friendly_name,
+            examples, examples_tsv, created_at
+        )
+        SELECT
+            nigp_codes, category, subcategory, category_friendly_name, examples,
+            to_tsvector(regexp_replace(examples, '\s*\|\s*', ' ', 'g')),
+            timezone('utc', now())
+        FROM (
+            SELECT DISTINCT
+                CAST(string_to_array({code}, '|') AS integer[]) AS nigp_codes,
+                {parent_category} AS category,
+                {category} AS subcategory,
+                {category_friendly_name} AS category_friendly_name,
+                {examples} AS examples
+            FROM nigp_import
+        ) AS parsed
+        WHERE NOT EXISTS (
+            SELECT 1 FROM category
+            WHERE category.nigp_codes IS NOT DISTINCT FROM parsed.nigp_codes
+            AND category.category IS NOT DISTINCT FROM parsed.category
+            AND category.subcategory IS NOT DISTINCT FROM parsed.subcategory
+            AND category.category_friendly_name IS NOT DISTINCT FROM parsed.category_friendly_name
+            AND category.examples IS NOT DISTINCT FROM parsed.examples
+        )
+    '''.format(**{
+        i: _nullable(header, i) for i in
+        ('code', 'parent_category', 'category', 'category_friendly_name', 'examples')
+    }))
+
+    return result.rowcount
+
+def row_import(file_target):
+    '''Import NIGP categories from a csv one row at a time
 
-    for row in data:
-        subcat, new_subcat = get_or_create(
+    Returns:
+        Number of new categories
+    '''
+    created = 0
+    for row in extract(file_target):
+        subcat, found = get_or_create(
             db.session, Category,
             nigp_codes=parse_codes(convert_empty_to_none(row.get('code'))),
             category=convert_empty_to_none(row.get('parent_category')),
@@ -35,7 +107,27 @@ def main(file_target='./files/2015-05-27-nigp-cleaned.csv'):
             examples_tsv=parse_examples_tsv(convert_empty_to_none(row.get('examples')))
         )
 
-        if new_subcat:
-            db.session.add(subcat)
+        if not found:
+            created += 1
+
+    return created
+
+def main(file_target='./files/2015-05-27-nigp-cleaned.csv', bulk=True):
+    '''Import NIGP categories from a csv
+
+    Keyword Arguments:
+        file_target: Path to the csv file
+        bulk: Whether to use :py:func:`bulk_import`, or to fall back
+            to :py:func:`row_import`
+
+    Returns:
+        Number of new categories
+    '''
+    created = bulk_import(file_target) if bulk else row_import(file_target)
 
     db.session.commit()
+
+    from beacon.forms.opportunities import category_tree
+    category_tree.invalidate()
+
+    return created
@@ -5,3 +5,5 @@ from job_base import JobBase
 from beacon_nightly import (
     BeaconNewOppotunityOpenJob, BeaconBiweeklyDigestJob
 )
+
+from outbox import OutboxPurgeJob
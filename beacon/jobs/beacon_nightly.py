@@ -1,13 +1,18 @@
 # -*- coding: utf-8 -*-
 
+import hashlib
 import datetime
-from flask import current_app
+import collections
+
+from flask import current_app, render_template
+from jinja2 import Markup
 
 from beacon.extensions import db
+from beacon.database import localize_today_sql
 from beacon.notifications import Notification
 from beacon.jobs.job_base import JobBase, EmailJobBase
 
-from beacon.models.vendors import Vendor, Category
+from beacon.models.vendors import Vendor
 from beacon.models.opportunities.base import Opportunity
 from beacon.models.public import AppStatus
 
@@ -19,45 +24,48 @@ class BeaconNewOppotunityOpenJob(EmailJobBase):
     def build_notifications(self):
         '''Implements EmailJobBase build_notifications method
 
-        Returns:
-            list of :py:class:`~purchasing.notifications.Notification` objects, one
-            for each new Opportunity. For each Opportunity, the ``to_email`` field
-            is the union of all followers of the opportunity and any followers of
-            any categories that the Opportunity has
+        Each Opportunity's subscribers are sent to in checkpointed chunks
+        (see :py:meth:`~beacon.jobs.job_base.EmailJobBase.recipient_chunks`),
+        and the Opportunity is only marked as notified once every chunk
+        was sent, so a run that fails partway picks up where it stopped
+        when it is run again.
+
+        Yields:
+            :py:class:`~purchasing.notifications.Notification` objects, one
+            for each chunk of each new Opportunity's subscribers. For each
+            Opportunity, the subscribers are the union of all followers of the
+            opportunity and any followers of any categories that the
+            Opportunity has
         '''
-        notifications = []
         for opportunity in self.get_opportunities():
-            category_vendors = Vendor.query.filter(
-                Vendor.categories.any(Category.id.in_(opportunity.get_category_ids()))
-            ).all()
-
-            notifications.append(
-                Notification(
-                    to_email=set([i.email for i in category_vendors] + [i.email for i in opportunity.vendors]),
+            chunks = self.recipient_chunks(
+                'opportunity-{}'.format(opportunity.id),
+                lambda after, limit: opportunity.get_subscriber_emails(after=after, limit=limit)
+            )
+            for chunk in chunks:
+                yield Notification(
+                    to_email=chunk,
                     cc_email=list(),
                     from_email=current_app.config['BEACON_SENDER'],
                     subject='A new opportunity from Beacon!',
                     html_template='beacon/emails/newopp.html',
                     opportunity=opportunity
                 )
-            )
             opportunity.raw_update(publish_notification_sent=True)
 
-        return notifications
-
     def get_opportunities(self):
         '''Get new opportunities to send to businesses
 
         Returns:
             list of :py:class:`~purchasing.models.front.Opportunity` objects
-            that are approved (``is_public == True``), have not had notification emails
+            that are published (``Opportunity.is_published``), have not had notification emails
             sent yet (``publish_notification_sent == False``), and are set to
-            publish today (``db.func.DATE(Opportunity.planned_publish) == datetime.date.today()``)
+            publish today (``db.func.DATE(Opportunity.planned_publish) == localize_today_sql()``)
         '''
         return Opportunity.query.filter(
-            db.func.DATE(Opportunity.planned_publish) == datetime.date.today(),
+            db.func.DATE(Opportunity.planned_publish) == localize_today_sql(),
             Opportunity.publish_notification_sent == False,
-            Opportunity.is_public == True
+            Opportunity.is_published
         ).all()
 
 @JobBase.register
@@ -80,25 +88,105 @@ class BeaconBiweeklyDigestJob(EmailJobBase):
     def build_notifications(self):
         '''Implements EmailJobBase build_notifications method
 
-        Returns:
-            list of :py:class:`~purchasing.notifications.Notification` objects, one
-            for each non-expired opportunity that has been published since the last
-            Beacon newsletter was sent out
+        Subscribers are paged through in checkpointed chunks (see
+        :py:meth:`~beacon.jobs.job_base.EmailJobBase.recipient_chunks`).
+        Each subscriber's digest only lists the opportunities in the
+        categories they follow, and subscribers who don't follow any
+        category get every opportunity. The list for each category is
+        rendered once per run, see
+        :py:meth:`~beacon.jobs.beacon_nightly.BeaconBiweeklyDigestJob.render_section`,
+        and subscribers in a chunk who follow the same categories share
+        one notification. Each of those notifications is checkpointed on
+        its own (see :py:meth:`~beacon.jobs.job_base.EmailJobBase.send_once`),
+        so a rerun after a failed send skips the groups that already went
+        out.
+
+        Yields:
+            :py:class:`~purchasing.notifications.Notification` objects, one
+            for each group of subscribers in a chunk that follow the same
+            categories, of the non-expired opportunities that have been
+            published since the last Beacon newsletter was sent out
         '''
-        notifications = []
-
         opportunities = self.get_opportunities()
+        by_category = self.group_by_category(opportunities)
+        sections = {}
 
-        notifications.append(
-            Notification(
-                to_email=set([i.email for i in Vendor.newsletter_subscribers()]),
-                from_email=current_app.config['BEACON_SENDER'],
-                subject='Your biweekly Beacon opportunity summary',
-                html_template='beacon/emails/biweeklydigest.html',
-                opportunities=opportunities
-            )
+        chunks = self.recipient_chunks(
+            'digest', lambda after, limit: Vendor.newsletter_subscriber_emails(after=after, limit=limit)
         )
-        return notifications
+        for chunk in chunks:
+            followed = Vendor.followed_category_ids(chunk)
+
+            groups = collections.OrderedDict()
+            for email in chunk:
+                if email in followed:
+                    key = tuple(i for i in by_category if i in followed[email])
+                else:
+                    key = None
+                groups.setdefault(key, []).append(email)
+
+            for key, emails in groups.iteritems():
+                if key is None:
+                    ids = [None] if opportunities else []
+                else:
+                    ids = key
+
+                for i in ids:
+                    if i not in sections:
+                        category, listed = by_category.get(i, (None, opportunities))
+                        sections[i] = self.render_section(category, listed)
+
+                # a rerun builds the same groups from the same subscribers
+                item = 'digest-{}'.format(hashlib.md5('\n'.join(emails).encode('utf-8')).hexdigest())
+                for emails in self.send_once(item, emails):
+                    yield Notification(
+                        to_email=emails,
+                        from_email=current_app.config['BEACON_SENDER'],
+                        subject='Your biweekly Beacon opportunity summary',
+                        html_template='beacon/emails/biweeklydigest.html',
+                        sections=[sections[i] for i in ids],
+                        personalized=key is not None
+                    )
+
+    def group_by_category(self, opportunities):
+        '''Group the digest's opportunities by their categories
+
+        Arguments:
+            opportunities: List of :py:class:`~purchasing.models.front.Opportunity`
+                objects, from :py:meth:`get_opportunities`
+
+        Returns:
+            OrderedDict of category ids to two-tuples of the
+            :py:class:`~purchasing.models.front.Category` and the list of
+            its opportunities, ordered by the category's name. Opportunities
+            in several categories are listed under each of them
+        '''
+        grouped = {}
+        for opportunity in opportunities:
+            for category in opportunity.categories:
+                grouped.setdefault(category.id, (category, []))[1].append(opportunity)
+
+        return collections.OrderedDict(sorted(
+            grouped.iteritems(), key=lambda i: (i[1][0].category_friendly_name, i[0])
+        ))
+
+    def render_section(self, category, opportunities):
+        '''Render the part of the digest that lists some opportunities
+
+        Arguments:
+            category: :py:class:`~purchasing.models.front.Category` that
+                the opportunities are in, or None for a list of every
+                opportunity without a heading
+            opportunities: List of :py:class:`~purchasing.models.front.Opportunity`
+                objects to list
+
+        Returns:
+            Rendered HTML, safe to include in the digest template
+        '''
+        return Markup(render_template(
+            'beacon/emails/digest_category.html',
+            category=category, opportunities=opportunities
+        ))
 
     def get_opportunities(self):
         '''Get bulk opportunities to send to businesses
@@ -106,12 +194,12 @@ class BeaconBiweeklyDigestJob(EmailJobBase):
         Returns:
             list of :py:class:`~purchasing.models.front.Opportunity` objects
             that have a ``published_at`` date after the last newsletter was sent out
-            and expire on or after today
+            and are not yet closed to submissions
         '''
         current_status = AppStatus.query.first()
         return Opportunity.query.filter(
             Opportunity.published_at > db.func.coalesce(
                 current_status.last_beacon_newsletter, datetime.date(2010, 1, 1)
-            ), Opportunity.is_public == True,
-            Opportunity.planned_submission_end >= datetime.date.today()
-        ).all()
+            ), Opportunity.is_published,
+            db.not_(Opportunity.is_submission_end)
+        ).options(db.subqueryload(Opportunity.categories)).all()
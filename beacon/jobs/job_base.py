@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
 
+import time
 import datetime
+
+from flask import current_app
+
 from beacon.database import Model, db, get_or_create
 
 import pytz
@@ -20,6 +24,17 @@ class JobStatus(Model):
             set to 'started', 'success', 'failure', or 'skipped'
         info: Any additional reporting about the job status,
             such as an error message if the job fails
+        locked_by: Name of the :py:class:`~beacon.jobs.worker.Worker`
+            that last claimed the job
+        locked_until: Naive UTC datetime when the worker's lease on the
+            job runs out, or when a failed job can be retried, or None
+        attempts: Number of times a worker has claimed the job
+        started_at: Naive UTC datetime when the job started running
+        finished_at: Naive UTC datetime when the job finished running
+        build_seconds: Seconds spent building the job's notifications
+        send_seconds: Seconds spent sending the job's notifications
+        notification_count: Number of notifications the job built
+        recipient_count: Number of addresses the notifications were sent to
     '''
     __tablename__ = 'job_status'
 
@@ -27,6 +42,103 @@ class JobStatus(Model):
     date = db.Column(db.DateTime, primary_key=True)
     status = db.Column(db.String, default='new')
     info = db.Column(db.Text)
+    locked_by = db.Column(db.String(255))
+    locked_until = db.Column(db.DateTime)
+    attempts = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    build_seconds = db.Column(db.Float)
+    send_seconds = db.Column(db.Float)
+    notification_count = db.Column(db.Integer)
+    recipient_count = db.Column(db.Integer)
+
+    @property
+    def duration(self):
+        '''Seconds the job took to run, or None if it hasn't finished
+        '''
+        if self.started_at and self.finished_at:
+            return (self.finished_at - self.started_at).total_seconds()
+        return None
+
+    def as_dict(self):
+        return dict(super(JobStatus, self).as_dict(), duration=self.duration)
+
+    @classmethod
+    def history(cls, name=None, days=30):
+        '''Query for recent runs of the nightly jobs, newest first
+
+        Keyword Arguments:
+            name: Only include runs of the job with this name
+            days: Only include runs scheduled within this many days
+
+        Returns:
+            Query of :py:class:`~beacon.jobs.job_base.JobStatus` objects
+        '''
+        query = cls.query.filter(
+            cls.date >= datetime.date.today() - datetime.timedelta(days=days)
+        )
+        if name:
+            query = query.filter(cls.name == name)
+        return query.order_by(cls.date.desc(), cls.name)
+
+class JobCheckpoint(Model):
+    '''Model to track which chunks of recipients a job has sent to
+
+    A run of an email job sends about one or more items, like each new
+    opportunity, and splits each item's recipients into chunks. A chunk
+    is ``pending`` while it is being sent and ``sent`` once it was handed
+    off to the outbox, so a rerun of the same job can skip every chunk
+    that was already sent.
+
+    Attributes:
+        id: Primary key
+        job_name: Name of the :py:class:`~beacon.jobs.job_base.JobStatus`
+        job_date: Date of the :py:class:`~beacon.jobs.job_base.JobStatus`
+        item: Name of what is being sent, like ``opportunity-12``
+        chunk: Position of the chunk among the item's chunks
+        status: ``pending`` or ``sent``
+        last_recipient: The chunk's last email address. Recipients are
+            sent to in order, so a rerun picks up after this address
+        recipient_count: Number of addresses in the chunk
+    '''
+    __tablename__ = 'job_checkpoint'
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_name = db.Column(db.String(255), nullable=False)
+    job_date = db.Column(db.DateTime, nullable=False)
+    item = db.Column(db.String(255), nullable=False)
+    chunk = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(255), default='pending', nullable=False)
+    last_recipient = db.Column(db.String(255))
+    recipient_count = db.Column(db.Integer)
+
+    __table_args__ = (
+        db.ForeignKeyConstraint(
+            ['job_name', 'job_date'], ['job_status.name', 'job_status.date'],
+            ondelete='CASCADE'
+        ),
+        db.UniqueConstraint('job_name', 'job_date', 'item', 'chunk'),
+    )
+
+    @classmethod
+    def for_job(cls, job, item):
+        '''Query for the checkpoints of one item of a job run, in order
+        '''
+        return cls.query.filter(
+            cls.job_name == job.name, cls.job_date == job.date, cls.item == item
+        ).order_by(cls.chunk)
+
+def _chunked(recipients, after, size):
+    # each chunk is its own query, so that nothing is left streaming
+    # from the database while the chunk is sent and checkpointed
+    while True:
+        chunk = list(recipients(after, size))
+        if not chunk:
+            return
+        yield chunk
+        if len(chunk) < size:
+            return
+        after = chunk[-1]
 
 class JobBase(object):
     '''Base model for nightly jobs
@@ -172,12 +284,15 @@ class EmailJobBase(JobBase):
         To run an email job, we do the following things:
 
         1. Set the job status to "started"
-        2. Call the :py:func:`~purchasing.jobs.job_base.EmailJobBase.build_notifications`
-           method to get a list of notification batches to send
-        3. For each batches of notifications to send, try to send them
-        4. If at any point we fail, update the status to 'failed',
-           and provide additional information
-        5. If all notifications send successfully, update the status to 'success'
+        2. Take the next notification from
+           :py:func:`~purchasing.jobs.job_base.EmailJobBase.build_notifications`
+           and send it, one notification at a time
+        3. If a notification fails to send, update the status to 'failed',
+           provide additional information, and stop without building
+           any more notifications
+        4. If all notifications send successfully, update the status to 'success'
+        5. Record when the job finished, how long building and sending
+           took, and how many notifications and recipients there were
 
         Arguments:
             job: :py:class:`~purchasing.jobs.job_base.JobStatus` object
@@ -188,26 +303,141 @@ class EmailJobBase(JobBase):
         '''
         if self.should_run():
             if job:
+                self.job = job
                 success = True
-                job.update(status='started')
-                notifications = self.build_notifications()
-                for notification in notifications:
+                job.update(status='started', started_at=datetime.datetime.utcnow())
+
+                metrics = dict(
+                    build_seconds=0, send_seconds=0,
+                    notification_count=0, recipient_count=0
+                )
+                notifications = iter(self.build_notifications())
+                while True:
+                    started = time.time()
+                    notification = next(notifications, None)
+                    metrics['build_seconds'] += time.time() - started
+                    if notification is None:
+                        break
+
+                    metrics['notification_count'] += 1
+                    metrics['recipient_count'] += len(notification.to_email) + len(notification.cc_email)
+
+                    started = time.time()
                     try:
                         notification.send(multi=True)
                     except Exception, e:
                         job.update(status='failed', info=str(e))
                         success = False
+                        break
+                    finally:
+                        metrics['send_seconds'] += time.time() - started
+
+                metrics['finished_at'] = datetime.datetime.utcnow()
                 if success:
-                    job.update(status='success')
+                    metrics['status'] = 'success'
+                job.update(**metrics)
 
             return job
         else:
             job.update(status='skipped')
             return job
 
+    def recipient_chunks(self, item, recipients):
+        '''Split an item's recipients into chunks, checkpointing each one
+
+        Meant to be used from
+        :py:meth:`~beacon.jobs.job_base.EmailJobBase.build_notifications`,
+        with one notification yielded per chunk. A
+        :py:class:`~beacon.jobs.job_base.JobCheckpoint` is stored for each
+        chunk, and marked as sent once the notification for it was sent.
+        If the job is run again, it picks up after the last chunk that
+        was sent, so nobody gets the same email twice. Jobs that split a
+        chunk into several notifications should also checkpoint each of
+        them with :py:meth:`~beacon.jobs.job_base.EmailJobBase.send_once`,
+        or a chunk that fails partway through is sent again in full.
+
+        Arguments:
+            item: Name of what is being sent, unique within the job
+            recipients: Function that takes the last email address that
+                was already sent to (or None) and a limit, and returns at
+                most that many of the addresses after it, in order
+
+        Yields:
+            Lists of at most ``MAIL_CHUNK_SIZE`` email addresses
+        '''
+        job = getattr(self, 'job', None)
+        size = current_app.config['MAIL_CHUNK_SIZE']
+        if job is None:
+            for chunk in _chunked(recipients, None, size):
+                yield chunk
+            return
+
+        checkpoints = JobCheckpoint.for_job(job, item).all()
+        sent = [i for i in checkpoints if i.status == 'sent']
+        after = sent[-1].last_recipient if sent else None
+
+        for position, chunk in enumerate(_chunked(recipients, after, size), len(sent)):
+            checkpoint = next((i for i in checkpoints if i.chunk == position), None)
+            if checkpoint is None:
+                checkpoint = JobCheckpoint(
+                    job_name=job.name, job_date=job.date, item=item, chunk=position
+                )
+            checkpoint.update(
+                status='pending', last_recipient=chunk[-1], recipient_count=len(chunk)
+            )
+
+            yield chunk
+            # only reached once the chunk's notification was sent
+            checkpoint.update(status='sent')
+
+    def send_once(self, item, recipients):
+        '''Checkpoint one of several notifications sent for a chunk
+
+        Meant to wrap a ``yield`` in
+        :py:meth:`~beacon.jobs.job_base.EmailJobBase.build_notifications`:
+
+        .. code-block:: python
+
+            for emails in self.send_once(item, emails):
+                yield Notification(to_email=emails, ...)
+
+        The body runs unless a notification with the same ``item`` was
+        already sent by an earlier run of the job, and the item is marked
+        as sent once the job comes back for the next notification.
+
+        Arguments:
+            item: Name of the notification, unique within the job
+            recipients: List of the notification's email addresses
+
+        Yields:
+            ``recipients``, once, or not at all if it was already sent
+        '''
+        job = getattr(self, 'job', None)
+        if job is None:
+            yield recipients
+            return
+
+        checkpoint = JobCheckpoint.for_job(job, item).first()
+        if checkpoint is not None and checkpoint.status == 'sent':
+            return
+        if checkpoint is None:
+            checkpoint = JobCheckpoint(
+                job_name=job.name, job_date=job.date, item=item, chunk=0
+            )
+        checkpoint.update(
+            status='pending', last_recipient=recipients[-1], recipient_count=len(recipients)
+        )
+
+        yield recipients
+        checkpoint.update(status='sent')
+
     def build_notifications(self):
         '''Method to build Notification objects to send
 
+        Implement this as a generator: each notification is sent before the
+        next one is built, so only one is held in memory at a time, and
+        code after a ``yield`` only runs once that notification was sent.
+
         Raises
             NotImplementedError
         '''
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+
+from flask import current_app
+
+from beacon.jobs.job_base import JobBase
+from beacon.models.outbox import OutboxMessage
+
+@JobBase.register
+class OutboxPurgeJob(JobBase):
+    '''Delete outbox messages that were fully sent more than
+    ``OUTBOX_RETENTION_DAYS`` days ago
+
+    See Also:
+        :py:meth:`~beacon.models.outbox.OutboxMessage.purge`
+    '''
+    def run_job(self, job):
+        '''Purge the outbox and record how many messages were deleted
+        '''
+        deleted = OutboxMessage.purge(current_app.config['OUTBOX_RETENTION_DAYS'])
+        job.update(status='success', info='Deleted {} messages'.format(deleted))
+        return job
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+'''Run scheduled jobs from any number of worker processes
+
+Jobs are scheduled as :py:class:`~beacon.jobs.job_base.JobStatus` rows by
+:py:func:`schedule`. A :py:class:`Worker` claims one row at a time with
+``SELECT ... FOR UPDATE SKIP LOCKED``, so two workers never pick the same
+job, and holds a lease on it while the job runs. The lease is renewed in
+the background; if the worker dies, the lease runs out and another worker
+picks the job up again, up to ``JOB_MAX_ATTEMPTS`` times. Jobs that fail
+are picked up again the same way, ``JOB_RETRY_DELAY`` seconds later, and
+email jobs carry on from their last checkpoint (see
+:py:meth:`~beacon.jobs.job_base.EmailJobBase.recipient_chunks`).
+'''
+
+import os
+import time
+import socket
+import datetime
+import threading
+
+from flask import current_app
+
+from beacon.database import db
+from beacon.jobs.job_base import JobBase, JobStatus
+
+_REAP = db.text('''
+    UPDATE job_status SET
+        status = 'failed', locked_until = NULL,
+        info = 'Gave up after ' || attempts || ' attempts'
+    WHERE status = 'started' AND (locked_until IS NULL OR locked_until < :now)
+        AND attempts >= :max_attempts
+''')
+
+_CLAIM = db.text('''
+    UPDATE job_status SET
+        status = 'started', locked_by = :worker, locked_until = :until,
+        attempts = coalesce(attempts, 0) + 1
+    FROM (
+        SELECT name, date FROM job_status
+        WHERE name IN :names AND (
+            status = 'new' OR (
+                status = 'started' AND (locked_until IS NULL OR locked_until < :now)
+            ) OR (
+                status = 'failed' AND attempts < :max_attempts AND
+                (locked_until IS NULL OR locked_until < :now)
+            )
+        )
+        ORDER BY date, name
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    ) AS claimed
+    WHERE job_status.name = claimed.name AND job_status.date = claimed.date
+    RETURNING job_status.name, job_status.date
+''')
+
+_RENEW = db.text('''
+    UPDATE job_status SET locked_until = :until
+    WHERE name = :name AND date = :date AND locked_by = :worker
+''')
+
+_RELEASE = db.text('''
+    UPDATE job_status SET
+        locked_until = CASE WHEN status = 'failed' THEN :retry_at ELSE NULL END
+    WHERE name = :name AND date = :date AND locked_by = :worker
+''')
+
+def schedule(ignore_time=False, jobs=None):
+    '''Schedule every registered job that is due
+
+    Safe to run from several workers at once: each job is only scheduled
+    once per day, see :py:meth:`~beacon.jobs.job_base.JobBase.schedule_job`.
+
+    Keyword Arguments:
+        ignore_time: Schedule jobs even if their ``start_time`` hasn't
+            passed yet
+        jobs: List of job classes, defaults to ``JobBase.jobs``
+    '''
+    for job in (JobBase.jobs if jobs is None else jobs):
+        job(time_override=ignore_time).schedule_job()
+        db.session.commit()
+
+class Worker(object):
+    '''Claims scheduled jobs and runs them
+
+    Arguments:
+        name: Name that the worker's leases are held under, defaults to
+            the host name and process id
+        lease: Seconds that a claimed job is held for without a renewal,
+            defaults to ``JOB_LEASE``
+        concurrency: Number of jobs to run at the same time, defaults
+            to ``JOB_CONCURRENCY``
+        ignore_time: Passed to the jobs as ``time_override``
+        jobs: List of job classes to run, defaults to ``JobBase.jobs``
+    '''
+    def __init__(
+        self, name=None, lease=None, concurrency=None,
+        ignore_time=False, jobs=None
+    ):
+        self.name = name or '{}:{}'.format(socket.gethostname(), os.getpid())
+        self.lease = lease or current_app.config['JOB_LEASE']
+        self.concurrency = concurrency or current_app.config['JOB_CONCURRENCY']
+        self.ignore_time = ignore_time
+        self.jobs = dict([
+            (i.__name__, i) for i in (JobBase.jobs if jobs is None else jobs)
+        ])
+
+    def claim(self, now=None):
+        '''Claim the oldest job that is new, whose lease ran out, or that
+        failed and is due to be retried
+
+        Started jobs without a lease, like ones left behind by a worker
+        from before leases, count as having run out. Jobs whose lease ran
+        out after ``JOB_MAX_ATTEMPTS`` claims are marked as failed instead,
+        and failed jobs aren't retried after ``JOB_MAX_ATTEMPTS`` claims.
+
+        Keyword Arguments:
+            now: Naive UTC datetime, defaults to the current time
+
+        Returns:
+            The claimed :py:class:`~beacon.jobs.job_base.JobStatus`, with
+            a status of ``started``, or None if there is nothing to claim
+        '''
+        if not self.jobs:
+            return None
+
+        now = now or datetime.datetime.utcnow()
+        db.session.execute(_REAP, dict(
+            now=now, max_attempts=current_app.config['JOB_MAX_ATTEMPTS']
+        ))
+        claimed = db.session.execute(_CLAIM, dict(
+            worker=self.name, now=now, names=tuple(self.jobs),
+            max_attempts=current_app.config['JOB_MAX_ATTEMPTS'],
+            until=now + datetime.timedelta(seconds=self.lease)
+        )).first()
+        db.session.commit()
+
+        if claimed is None:
+            return None
+        return JobStatus.query.get((claimed.name, claimed.date))
+
+    def run(self, job):
+        '''Run a claimed job, renewing its lease until it is done
+
+        A job that raises is marked as failed. Either way, the lease is
+        released afterwards, and a failed job is held back from being
+        claimed again for ``JOB_RETRY_DELAY`` seconds.
+
+        Arguments:
+            job: :py:class:`~beacon.jobs.job_base.JobStatus` returned
+                by :py:meth:`claim`
+        '''
+        key = dict(name=job.name, date=job.date, worker=self.name)
+        done = threading.Event()
+        renewal = threading.Thread(
+            target=self._renew, args=(db.engine, key, done)
+        )
+        renewal.daemon = True
+        renewal.start()
+
+        try:
+            self.jobs[job.name](time_override=self.ignore_time).run_job(job)
+        except Exception, e:
+            current_app.logger.exception('Job {} failed'.format(job.name))
+            db.session.rollback()
+            JobStatus.query.get((key['name'], key['date'])).update(
+                status='failed', info=str(e)
+            )
+        finally:
+            done.set()
+            renewal.join()
+            db.session.execute(_RELEASE, dict(key, retry_at=(
+                datetime.datetime.utcnow() +
+                datetime.timedelta(seconds=current_app.config['JOB_RETRY_DELAY'])
+            )))
+            db.session.commit()
+
+    def _renew(self, engine, key, done):
+        while not done.wait(self.lease / 3.0):
+            with engine.begin() as connection:
+                connection.execute(_RENEW, dict(key, until=(
+                    datetime.datetime.utcnow() + datetime.timedelta(seconds=self.lease)
+                )))
+
+    def _drain(self, app, ran):
+        with app.app_context():
+            try:
+                job = self.claim()
+                while job is not None:
+                    self.run(job)
+                    ran.append(job.name)
+                    job = self.claim()
+            finally:
+                db.session.remove()
+
+    def work(self):
+        '''Run claimable jobs, ``concurrency`` at a time, until there
+        aren't any left
+
+        Returns:
+            List of the names of the jobs that were run
+        '''
+        app = current_app._get_current_object()
+        ran = []
+        threads = [
+            threading.Thread(target=self._drain, args=(app, ran))
+            for i in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return ran
+
+    def serve(self, poll=None):
+        '''Schedule and run jobs forever
+
+        Keyword Arguments:
+            poll: Seconds to wait between rounds, defaults to
+                ``JOB_POLL_INTERVAL``
+        '''
+        poll = poll or current_app.config['JOB_POLL_INTERVAL']
+        while True:
+            schedule(self.ignore_time, self.jobs.values())
+            ran = self.work()
+            if ran:
+                current_app.logger.info(
+                    'JOBS - {} ran {}'.format(self.name, ', '.join(ran))
+                )
+            time.sleep(poll)
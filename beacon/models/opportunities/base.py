@@ -6,16 +6,25 @@ import datetime
 from flask import current_app
 from jinja2 import Markup
 
-from beacon.database import Column, Model, db, ReferenceCol
+from beacon.database import (
+    Column, Model, db, ReferenceCol, localize_today_sql, utcnow_sql
+)
 from beacon.utils import localize_today, localize_now
 
+import sqlalchemy
 from sqlalchemy.schema import Table
 from sqlalchemy.orm import backref
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.dialects.postgres import ARRAY, JSON
+from sqlalchemy.dialects.postgresql import TSVECTOR
 
 from beacon.notifications import Notification
+from beacon.cache_util import VersionedCache
 from beacon.utils import random_id
-from beacon.models.vendors import Vendor, Category
+from beacon.models.vendors import (
+    Vendor, Category, category_vendor_association_table,
+    opportunity_vendor_association_table
+)
 from beacon.models.users import User, Role
 from beacon.models.questions import Question
 from beacon.models.opportunities.documents import RequiredBidDocument, OpportunityDocument
@@ -26,6 +35,14 @@ category_opportunity_association_table = Table(
     Column('opportunity_id', db.Integer, db.ForeignKey('opportunity.id', ondelete='SET NULL'), index=True)
 )
 
+SEARCH_CONFIG = 'english'
+
+#: Version stamp for the cached fragments of the public opportunity pages.
+#: Invalidated whenever an opportunity, its documents or its answered
+#: questions change, see
+#: :py:func:`~beacon.blueprints.view_util.cached_fragment`
+opportunity_pages = VersionedCache('opportunity-pages')
+
 class Opportunity(Model):
     '''Base Opportunity Model -- the central point for Beacon
 
@@ -72,7 +89,13 @@ class Opportunity(Model):
             to implement different submission and response instruction behavior
         submission_data: JSON field used to handle additional data for
             submissions based on the type of the opportunity
+        search_tsv: TSVECTOR of the title, description, and the names and
+            examples of the categories, kept up to date whenever any of
+            them change; see :py:meth:`search`
 
+    The lifecycle checks (:py:attr:`is_published`, :py:attr:`is_upcoming`,
+    :py:attr:`is_submission_start`, and :py:attr:`is_submission_end`) are
+    hybrid properties, so they can also be used directly as query filters.
 
     See Also:
         For more on the Conductor <--> Beacon relationship, look at the
@@ -122,11 +145,24 @@ class Opportunity(Model):
     type = Column(db.String(255))
     submission_data = Column(JSON)
 
+    search_tsv = db.deferred(Column(TSVECTOR))
+
     __mapper_args__ = {
         'polymorphic_on': type,
         'polymorphic_identity': 'Opportunity'
     }
 
+    __table_args__ = (
+        db.Index(
+            'ix_opportunity_planned_submission_end_id',
+            'planned_submission_end', 'id'
+        ),
+        db.Index(
+            'ix_opportunity_search_tsv', 'search_tsv',
+            postgresql_using='gin'
+        ),
+    )
+
     @property
     def accepting_questions(self):
         if self.qa_start is None or self.qa_end is None:
@@ -185,6 +221,7 @@ class Opportunity(Model):
 
         opportunity._handle_uploads(documents)
         opportunity._publish(publish)
+        opportunity_pages.invalidate()
 
         return opportunity
 
@@ -226,6 +263,139 @@ class Opportunity(Model):
 
         self._handle_uploads(documents)
         self._publish(publish)
+        opportunity_pages.invalidate()
+
+    @classmethod
+    def listing_query(cls):
+        '''Query for rendering lists of opportunities
+
+        Returns:
+            Opportunity query with the relationships that are rendered
+            for each row in the listing templates eagerly loaded
+        '''
+        return cls.query.options(db.joinedload(cls.department))
+
+    @classmethod
+    def search_vector(cls):
+        '''SQL expression that builds each opportunity's ``search_tsv``
+
+        Titles are weighted highest, then descriptions, then the names and
+        examples of the opportunity's categories.
+        '''
+        categories = db.select([
+            db.func.string_agg(
+                db.func.concat_ws(' ', Category.category_friendly_name, Category.examples), ' '
+            )
+        ]).where(db.and_(
+            category_opportunity_association_table.c.opportunity_id == cls.id,
+            category_opportunity_association_table.c.category_id == Category.id
+        )).as_scalar()
+
+        weighted = [
+            db.func.setweight(db.func.to_tsvector(SEARCH_CONFIG, db.func.coalesce(text, '')), weight)
+            for text, weight in ((cls.title, 'A'), (cls.description, 'B'), (categories, 'C'))
+        ]
+        return weighted[0].op('||')(weighted[1]).op('||')(weighted[2])
+
+    @classmethod
+    def refresh_search_tsv(cls, ids=None, category_ids=None, session=None):
+        '''Rebuild ``search_tsv`` in the database
+
+        If neither ``ids`` nor ``category_ids`` are passed, every
+        opportunity is rebuilt.
+
+        Keyword Arguments:
+            ids: Ids of the opportunities to rebuild
+            category_ids: Ids of categories; the opportunities in any of
+                these categories are rebuilt as well
+            session: Session to run the update in, defaults to ``db.session``
+        '''
+        table = cls.__table__
+        update = table.update().values(search_tsv=cls.search_vector())
+
+        if ids is not None or category_ids is not None:
+            conditions = []
+            if ids:
+                conditions.append(table.c.id.in_(list(ids)))
+            if category_ids:
+                conditions.append(table.c.id.in_(
+                    db.select([category_opportunity_association_table.c.opportunity_id]).where(
+                        category_opportunity_association_table.c.category_id.in_(list(category_ids))
+                    )
+                ))
+            if not conditions:
+                return
+            update = update.where(db.or_(*conditions))
+
+        (session or db.session).execute(update)
+
+    @classmethod
+    def search(cls, terms):
+        '''Full-text search over published opportunities
+
+        Arguments:
+            terms: Search terms, as typed by a user
+
+        Returns:
+            Query of published opportunities that match all of the terms,
+            best matches first
+        '''
+        query = db.func.plainto_tsquery(SEARCH_CONFIG, terms)
+        return cls.listing_query().filter(
+            cls.is_published,
+            cls.search_tsv.op('@@')(query)
+        ).order_by(db.func.ts_rank_cd(cls.search_tsv, query).desc(), cls.id)
+
+    @classmethod
+    def listing_version(cls):
+        '''Summarize the published opportunities, for HTTP validators
+
+        The summary changes whenever an opportunity listing could render
+        differently: when a published opportunity is created, edited or
+        unpublished, and when opportunities move between upcoming, open
+        and closed as time passes.
+
+        Returns:
+            Two-tuple of a key that changes along with the listings, and the
+            naive UTC time that they last changed
+        '''
+        count, changed, ended = db.session.query(
+            db.func.count(cls.id),
+            db.func.max(db.func.coalesce(cls.updated_at, cls.created_at)),
+            db.func.max(db.case([(cls.is_submission_end, cls.planned_submission_end)]))
+        ).filter(cls.is_published).one()
+
+        return _page_version((count, changed, ended), changed, ended)
+
+    def detail_version(self):
+        '''Summarize this opportunity, its documents and its answered
+        questions, for HTTP validators
+
+        See Also:
+            :py:meth:`listing_version`
+        '''
+        answers, answered = db.session.query(
+            db.func.count(Question.id),
+            db.func.max(db.func.greatest(Question.answered_at, Question.edited_at))
+        ).filter(
+            Question.opportunity_id == self.id,
+            Question.answer_text != None
+        ).one()
+
+        documents, uploaded = db.session.query(
+            db.func.count(OpportunityDocument.id),
+            db.func.max(db.func.coalesce(
+                OpportunityDocument.updated_at, OpportunityDocument.created_at
+            ))
+        ).filter(OpportunityDocument.opportunity_id == self.id).one()
+
+        changed = self.updated_at or self.created_at
+        ended = self.planned_submission_end if self.is_submission_end else None
+
+        return _page_version(
+            (self.id, changed, ended, answers, answered, documents, uploaded),
+            changed, ended, answered, uploaded
+        )
 
     @classmethod
     def get_opp_class(cls, form_type):
@@ -260,7 +430,7 @@ class Opportunity(Model):
     def get_help_block(cls):
         raise NotImplementedError
 
-    @property
+    @hybrid_property
     def is_published(self):
         '''Determine if an opportunity can be displayed
 
@@ -270,7 +440,14 @@ class Opportunity(Model):
         '''
         return self.coerce_to_date(self.planned_publish) <= localize_today() and self.is_public
 
-    @property
+    @is_published.expression
+    def is_published(cls):
+        return db.and_(
+            db.cast(cls.planned_publish, db.Date) <= localize_today_sql(),
+            cls.is_public == True
+        )
+
+    @hybrid_property
     def is_upcoming(self):
         '''Determine if an opportunity is upcoming
 
@@ -281,7 +458,15 @@ class Opportunity(Model):
         return self.coerce_to_date(self.planned_publish) <= localize_today() and \
             not self.is_submission_start and not self.is_submission_end and self.is_public
 
-    @property
+    @is_upcoming.expression
+    def is_upcoming(cls):
+        return db.and_(
+            cls.is_published,
+            db.cast(cls.planned_submission_start, db.Date) > localize_today_sql(),
+            db.not_(cls.is_submission_end)
+        )
+
+    @hybrid_property
     def is_submission_start(self):
         '''Determine if the oppportunity is accepting submissions
 
@@ -294,7 +479,15 @@ class Opportunity(Model):
             self.coerce_to_date(self.planned_publish) <= localize_today() and \
             not self.is_submission_end and self.is_public
 
-    @property
+    @is_submission_start.expression
+    def is_submission_start(cls):
+        return db.and_(
+            cls.is_published,
+            db.cast(cls.planned_submission_start, db.Date) <= localize_today_sql(),
+            db.not_(cls.is_submission_end)
+        )
+
+    @hybrid_property
     def is_submission_end(self):
         '''Determine if an opportunity is closed to new submissions
 
@@ -307,6 +500,13 @@ class Opportunity(Model):
         ) <= localize_now() and \
             self.is_public
 
+    @is_submission_end.expression
+    def is_submission_end(cls):
+        return db.and_(
+            cls.planned_submission_end <= utcnow_sql(),
+            cls.is_public == True
+        )
+
     @property
     def has_docs(self):
         '''True if the opportunity has at least one document, False otherwise
@@ -472,6 +672,50 @@ class Opportunity(Model):
         '''
         return [i.id for i in self.categories]
 
+    def get_subscriber_emails(self, batch_size=1000, after=None, limit=None):
+        '''Stream the email addresses of everyone who should hear about this opportunity
+
+        Builds a single UNION query of the vendors who follow any of the
+        opportunity's categories and the vendors who follow the opportunity
+        directly, so duplicates are removed by the database and only the
+        email addresses are ever loaded.
+
+        Arguments:
+            batch_size: Number of rows fetched from the database at a time
+            after: If passed, only stream the addresses that sort after it
+            limit: If passed, stop after this many addresses
+
+        Returns:
+            Generator of distinct email addresses, in order
+        '''
+        category_followers = db.session.query(Vendor.email).join(
+            category_vendor_association_table,
+            category_vendor_association_table.c.vendor_id == Vendor.id
+        ).join(
+            category_opportunity_association_table,
+            category_opportunity_association_table.c.category_id == category_vendor_association_table.c.category_id
+        ).filter(
+            category_opportunity_association_table.c.opportunity_id == self.id
+        )
+
+        opportunity_followers = db.session.query(Vendor.email).join(
+            opportunity_vendor_association_table,
+            opportunity_vendor_association_table.c.vendor_id == Vendor.id
+        ).filter(
+            opportunity_vendor_association_table.c.opportunity_id == self.id
+        )
+
+        if after is not None:
+            category_followers = category_followers.filter(Vendor.email > after)
+            opportunity_followers = opportunity_followers.filter(Vendor.email > after)
+
+        return (
+            row[0] for row in
+            category_followers.union(opportunity_followers).order_by(
+                Vendor.email
+            ).limit(limit).yield_per(batch_size)
+        )
+
     def send_publish_email(self):
         '''Sends the "new opportunity available" email to subscribed vendors
 
@@ -479,16 +723,13 @@ class Opportunity(Model):
         on today's date, it will trigger an immediate publish email send. This
         operates in a very similar way to the nightly
         :py:class:`~purchasing.jobs.beacon_nightly.BeaconNewOppotunityOpenJob`.
-        It will build a list of all vendors signed up to the Opportunity
-        or to any of the categories that describe the Opportunity.
+        It will send to all vendors signed up to the Opportunity
+        or to any of the categories that describe the Opportunity,
+        see :py:meth:`get_subscriber_emails`.
         '''
         if self.is_published and not self.publish_notification_sent:
-            vendors = db.session.query(Vendor).filter(
-                Vendor.categories.any(Category.id.in_(self.get_category_ids()))
-            ).all()
-
             Notification(
-                to_email=[i.email for i in vendors],
+                to_email=self.get_subscriber_emails(),
                 subject='A new opportunity from Beacon!',
                 html_template='beacon/emails/newopp.html',
                 opportunity=self
@@ -545,3 +786,51 @@ class Opportunity(Model):
         '''Render submissions link in navbar
         '''
         raise NotImplementedError
+
+def _changed(instance, *attrs):
+    state = db.inspect(instance)
+    return any(state.attrs[i].history.has_changes() for i in attrs)
+
+def _page_version(key, *timestamps):
+    '''Add today's date to a page's key and last changed time
+
+    Whether an opportunity is upcoming, open or published depends on
+    today's date in the display timezone, so pages change at local
+    midnight even when none of their rows do.
+    '''
+    today = localize_today()
+    midnight = current_app.config['DISPLAY_TIMEZONE'].localize(
+        datetime.datetime.combine(today, datetime.time())
+    ).astimezone(pytz.UTC).replace(tzinfo=None)
+
+    return (key, today), max([midnight] + [i for i in timestamps if i is not None])
+
+@sqlalchemy.event.listens_for(Opportunity, 'before_update', propagate=True)
+def touch_opportunity(mapper, connection, instance):
+    '''Bump ``updated_at`` when only an opportunity's categories change
+
+    The base model only tracks column changes, but the categories are
+    rendered on the opportunity's detail page.
+    '''
+    if _changed(instance, 'categories'):
+        instance.updated_at = datetime.datetime.utcnow()
+
+@sqlalchemy.event.listens_for(sqlalchemy.orm.Session, 'after_flush')
+def refresh_search_tsv(session, flush_context):
+    '''Keep ``search_tsv`` up to date with the rows that were just flushed
+    '''
+    ids, category_ids = set(), set()
+    for instance in session.new:
+        if isinstance(instance, Opportunity):
+            ids.add(instance.id)
+
+    for instance in session.dirty:
+        if isinstance(instance, Opportunity) and \
+                _changed(instance, 'title', 'description', 'categories'):
+            ids.add(instance.id)
+        elif isinstance(instance, Category) and \
+                _changed(instance, 'category_friendly_name', 'examples'):
+            category_ids.add(instance.id)
+
+    if ids or category_ids:
+        Opportunity.refresh_search_tsv(ids=ids, category_ids=category_ids, session=session)
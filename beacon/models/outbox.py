@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+
+import copy
+import datetime
+import itertools
+
+from flask_mail import Message, Attachment
+from sqlalchemy.dialects.postgres import ARRAY
+
+from beacon.database import Column, Model, db, ReferenceCol
+from beacon.utils import make_msgid
+
+class OutboxMessage(Model):
+    '''Model of a rendered email that is waiting to be sent
+
+    A :py:class:`~beacon.notifications.Notification` is rendered once and
+    stored here, with one :py:class:`~beacon.models.outbox.OutboxRecipient`
+    row per recipient. The celery ``send_email`` task only gets the outbox
+    id and a range of recipient positions, so the message bodies don't have
+    to be passed through the broker.
+
+    Attributes:
+        id: Primary key
+        subject: Subject line of the email
+        sender: From email address
+        reply_to: Reply-to email address
+        cc: List of email addresses to cc
+        html_body: Rendered HTML body
+        txt_body: Rendered text body
+        multi: If True, each recipient gets their own email. If False,
+            one email is sent with all recipients on the ``to`` line.
+        recipient_count: Number of recipients
+        recipients: Dynamic relationship to the message's
+            :py:class:`~beacon.models.outbox.OutboxRecipient` rows
+        attachments: Relationship to the message's
+            :py:class:`~beacon.models.outbox.OutboxAttachment` rows
+    '''
+    __tablename__ = 'outbox_message'
+
+    id = Column(db.Integer, primary_key=True)
+    subject = Column(db.Text)
+    sender = Column(db.String(255))
+    reply_to = Column(db.String(255))
+    cc = Column(ARRAY(db.String(255)))
+    html_body = Column(db.Text)
+    txt_body = Column(db.Text)
+    multi = Column(db.Boolean, default=False, nullable=False)
+    recipient_count = Column(db.Integer, default=0, nullable=False)
+
+    recipients = db.relationship(
+        'OutboxRecipient', lazy='dynamic', cascade='all, delete-orphan',
+        order_by='OutboxRecipient.position'
+    )
+    attachments = db.relationship(
+        'OutboxAttachment', lazy='subquery', cascade='all, delete-orphan'
+    )
+
+    @classmethod
+    def queue(cls, recipients, attachments=None, batch_size=1000, **kwargs):
+        '''Store a rendered message and its recipients
+
+        The rows are only flushed, so they are committed, or rolled back,
+        along with whatever else the caller is doing. Recipients are
+        inserted ``batch_size`` at a time with executemany rather than one
+        ORM object per recipient, so a generator of recipients is never
+        held in memory all at once.
+
+        Arguments:
+            recipients: List or generator of recipient email addresses
+            attachments: List of Flask-Mail ``Attachment`` objects
+            batch_size: Number of recipients to insert at once
+            **kwargs: Columns of the outbox message
+
+        Returns:
+            The new :py:class:`~beacon.models.outbox.OutboxMessage`
+        '''
+        outbox = cls(**kwargs)
+        for attachment in attachments or []:
+            outbox.attachments.append(OutboxAttachment(
+                filename=attachment.filename,
+                content_type=attachment.content_type,
+                data=attachment.data
+            ))
+        db.session.add(outbox)
+        db.session.flush()
+
+        recipients, count = iter(recipients), 0
+        while True:
+            batch = list(itertools.islice(recipients, batch_size))
+            if not batch:
+                break
+            db.session.execute(OutboxRecipient.__table__.insert(), [
+                dict(outbox_message_id=outbox.id, position=position, email=email)
+                for position, email in enumerate(batch, count)
+            ])
+            count += len(batch)
+
+        outbox.recipient_count = count
+        db.session.flush()
+        return outbox
+
+    @classmethod
+    def purge(cls, days):
+        '''Delete the messages that were sent to every recipient a while ago
+
+        Messages that still have unsent recipients are kept, so that they
+        can be looked into or sent again. Recipients that failed count as
+        done as of when they failed. Their recipients and attachments
+        are deleted along with them.
+
+        Arguments:
+            days: Number of days to keep messages for after their last
+                recipient was sent to or failed
+
+        Returns:
+            Number of messages deleted
+        '''
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+        done_at = db.func.coalesce(OutboxRecipient.sent_at, OutboxRecipient.failed_at)
+        recent = db.session.query(OutboxRecipient.outbox_message_id).filter(
+            OutboxRecipient.outbox_message_id == cls.id,
+            db.or_(done_at == None, done_at >= cutoff)
+        )
+
+        deleted = cls.query.filter(
+            cls.created_at < cutoff, ~recent.exists()
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+    def chunks(self, size):
+        '''Split the recipients into ranges of positions
+
+        Messages sent to all recipients at once can't be split up, so
+        they are always a single chunk.
+
+        Arguments:
+            size: Maximum number of recipients in a chunk
+
+        Returns:
+            List of (start, stop) two-tuples of recipient positions
+        '''
+        if not self.multi:
+            return [(0, self.recipient_count)]
+        return [
+            (start, min(start + size, self.recipient_count))
+            for start in range(0, self.recipient_count, size)
+        ]
+
+    def pending_recipients(self, start, stop):
+        '''Get the recipients in a chunk that haven't been sent or failed
+
+        Arguments:
+            start: First recipient position of the chunk
+            stop: Recipient position the chunk stops before
+
+        Returns:
+            List of :py:class:`~beacon.models.outbox.OutboxRecipient` objects
+        '''
+        return self.recipients.filter(
+            OutboxRecipient.position >= start,
+            OutboxRecipient.position < stop,
+            OutboxRecipient.sent_at == None,
+            OutboxRecipient.failed_at == None
+        ).all()
+
+    def build_msg(self, recipients):
+        '''Build a `Message`_ for some of the recipients
+
+        Arguments:
+            recipients: List of email addresses
+
+        Returns:
+            `Message`_ object
+        '''
+        return Message(
+            subject=self.subject, html=self.html_body, body=self.txt_body,
+            sender=self.sender, reply_to=self.reply_to,
+            recipients=recipients, cc=self.cc or [],
+            attachments=[
+                Attachment(
+                    filename=attachment.filename,
+                    content_type=attachment.content_type,
+                    data=attachment.data
+                ) for attachment in self.attachments
+            ]
+        )
+
+    def iter_msgs(self, recipients):
+        '''Build the `Message`_ objects for a chunk of recipients
+
+        For multi messages, one `Message`_ is built and then copied for each
+        recipient, sharing the bodies and attachments.
+
+        Arguments:
+            recipients: List of :py:class:`~beacon.models.outbox.OutboxRecipient`
+                objects
+
+        Yields:
+            Two-tuples of (`Message`_, list of the
+            :py:class:`~beacon.models.outbox.OutboxRecipient` objects it is
+            addressed to)
+        '''
+        if not self.multi:
+            yield self.build_msg([i.email for i in recipients]), recipients
+            return
+
+        template = self.build_msg([])
+        for recipient in recipients:
+            envelope = copy.copy(template)
+            envelope.recipients = [recipient.email]
+            envelope.msgId = make_msgid()
+            yield envelope, [recipient]
+
+class OutboxRecipient(Model):
+    '''Model of one recipient of an :py:class:`~beacon.models.outbox.OutboxMessage`
+
+    OutboxRecipient has a primary compound key of outbox_message_id + position
+
+    Attributes:
+        outbox_message_id: Foreign key to
+            :py:class:`~beacon.models.outbox.OutboxMessage`
+        position: Zero-based position of the recipient in the message's
+            recipient list, used to split sends into chunks
+        email: Recipient email address
+        sent_at: Datetime that the email was handed to the mail server,
+            or None if it hasn't been sent yet
+        failed_at: Datetime that the mail server refused the email, or it
+            couldn't be sent at all. Failed recipients aren't tried again.
+        error: The error the email failed with
+    '''
+    __tablename__ = 'outbox_recipient'
+
+    outbox_message_id = ReferenceCol('outbox_message', ondelete='CASCADE', primary_key=True)
+    position = Column(db.Integer, primary_key=True, autoincrement=False)
+    email = Column(db.String(255), nullable=False)
+    sent_at = Column(db.DateTime)
+    failed_at = Column(db.DateTime)
+    error = Column(db.Text)
+
+    def mark_sent(self):
+        self.sent_at = datetime.datetime.utcnow()
+
+    def mark_failed(self, error):
+        self.failed_at = datetime.datetime.utcnow()
+        self.error = repr(error)
+
+class OutboxAttachment(Model):
+    '''Model of a file attached to an :py:class:`~beacon.models.outbox.OutboxMessage`
+
+    Attributes:
+        id: Primary key
+        outbox_message_id: Foreign key to
+            :py:class:`~beacon.models.outbox.OutboxMessage`
+        filename: Name of the attached file
+        content_type: Mimetype of the attached file
+        data: Contents of the attached file
+    '''
+    __tablename__ = 'outbox_attachment'
+
+    id = Column(db.Integer, primary_key=True)
+    outbox_message_id = ReferenceCol('outbox_message', ondelete='CASCADE')
+    filename = Column(db.String(255))
+    content_type = Column(db.String(255))
+    data = Column(db.LargeBinary)
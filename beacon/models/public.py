@@ -13,6 +13,8 @@ class AppStatus(Model):
             was updated
         message: If the status is an error, the message will have more
             information about the nature of the error
+        error_count: Number of errors the app has served, written in
+            batches by :py:class:`~beacon.health.ErrorAggregator`
         last_beacon_newsletter: Datetime of the last time a beacon
             newsletter was sent
     '''
@@ -23,6 +25,7 @@ class AppStatus(Model):
     last_updated = Column(db.DateTime)
     county_max_deadline = Column(db.DateTime)
     message = Column(db.Text)
+    error_count = Column(db.Integer, default=0)
     last_beacon_newsletter = Column(db.DateTime)
 
 class AcceptedEmailDomains(Model):
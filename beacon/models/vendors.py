@@ -1,7 +1,14 @@
 # -*- coding: utf-8 -*-
 
-from beacon.database import Column, Model, db
+import re
+import datetime
 
+import sqlalchemy
+from flask import _request_ctx_stack
+
+from beacon.database import Column, Model, db, StringAgg
+
+from sqlalchemy.orm import validates
 from sqlalchemy.schema import Table
 from sqlalchemy.dialects.postgres import ARRAY
 from sqlalchemy.dialects.postgresql import TSVECTOR
@@ -51,6 +58,14 @@ class Category(Model):
     examples = Column(db.Text)
     examples_tsv = Column(TSVECTOR)
 
+    __table_args__ = (
+        db.Index(
+            'ix_category_friendly_name_prefix',
+            db.text('lower(category_friendly_name) text_pattern_ops')
+        ),
+        db.Index('ix_category_examples_tsv', 'examples_tsv', postgresql_using='gin'),
+    )
+
     def __unicode__(self):
         return '{sub} (in {main})'.format(sub=self.category_friendly_name, main=self.category)
 
@@ -66,6 +81,41 @@ class Category(Model):
         '''
         return cls.query
 
+    @classmethod
+    def typeahead(cls, terms, limit=10):
+        '''Find the subcategories that best match a partially typed search
+
+        Subcategories whose names start with the search come first, then
+        subcategories whose examples have words starting with each word
+        of the search, best matches first.
+
+        Arguments:
+            terms: What the user has typed so far
+
+        Keyword Arguments:
+            limit: Maximum number of subcategories to return
+
+        Returns:
+            List of rows with ``id``, ``category``, and
+            ``category_friendly_name`` attributes
+        '''
+        words = re.findall(r'[^\W_]+', terms.lower(), re.UNICODE)
+        if not words:
+            return []
+
+        name_match = db.func.lower(cls.category_friendly_name).startswith(' '.join(words))
+        query = db.func.to_tsquery(' & '.join([i + ':*' for i in words]))
+
+        return db.session.query(
+            cls.id, cls.category, cls.category_friendly_name
+        ).filter(
+            db.or_(name_match, cls.examples_tsv.op('@@')(query))
+        ).order_by(
+            db.case([(name_match, 0)], else_=1),
+            db.func.coalesce(db.func.ts_rank(cls.examples_tsv, query), 0).desc(),
+            cls.category_friendly_name
+        ).limit(limit).all()
+
 class Vendor(Model):
     '''Base Vendor model for businesses interested in Beacon
 
@@ -95,6 +145,10 @@ class Vendor(Model):
             describes what opportunities the vendor is subscribed to
         subscribed_to_newsletter: Whether the vendor is subscribed to
             receive the biweekly newsletter of all opportunities
+
+    Emails are stored stripped and lower-cased (see
+    :py:meth:`~beacon.models.vendors.Vendor.normalize_email`), so the
+    same address can't sign up twice with different capitalization.
     '''
     __tablename__ = 'vendor'
 
@@ -124,25 +178,266 @@ class Vendor(Model):
 
     subscribed_to_newsletter = Column(db.Boolean(), default=False, nullable=False)
 
+    __table_args__ = (
+        db.Index('ix_vendor_created_at', 'created_at'),
+        db.Index('ix_vendor_updated_at', 'updated_at'),
+        db.Index('ix_vendor_email_lower', db.text('lower(email)'), unique=True),
+    )
+
+    @staticmethod
+    def normalize_email(email):
+        '''Strip and lower-case an email address, so that it matches
+        how vendor emails are stored
+        '''
+        return email.strip().lower() if email else email
+
+    @validates('email')
+    def validate_email(self, key, email):
+        return self.normalize_email(email)
+
+    @classmethod
+    def for_email(cls, email):
+        '''Find the vendor with an email address, regardless of case
+
+        Vendors are remembered for the rest of the request, so the views,
+        forms, and validators that each need the vendor for the same email
+        share a single query.
+
+        Arguments:
+            email: Email address of the vendor
+
+        Returns:
+            The :py:class:`~beacon.models.vendors.Vendor`, or None if there
+            isn't one with that email
+        '''
+        email = cls.normalize_email(email)
+        if not email:
+            return None
+
+        vendors = _request_vendors()
+        if vendors is not None and email in vendors:
+            return vendors[email]
+
+        vendor = cls.query.filter(db.func.lower(cls.email) == email).first()
+        if vendors is not None:
+            vendors[email] = vendor
+        return vendor
+
     @classmethod
     def newsletter_subscribers(cls):
         '''Query to return all vendors signed up to the newsletter
         '''
         return cls.query.filter(cls.subscribed_to_newsletter == True).all()
 
+    @classmethod
+    def newsletter_subscriber_emails(cls, after=None, limit=None, batch_size=1000):
+        '''Stream the email addresses of the newsletter subscribers, in order
+
+        Keyword Arguments:
+            after: If passed, only stream the addresses that sort after it
+            limit: If passed, stop after this many addresses
+            batch_size: Number of rows fetched from the database at a time
+
+        Returns:
+            Generator of email addresses
+        '''
+        query = db.session.query(cls.email).filter(cls.subscribed_to_newsletter == True)
+        if after is not None:
+            query = query.filter(cls.email > after)
+        return (
+            row[0] for row in
+            query.order_by(cls.email).limit(limit).yield_per(batch_size)
+        )
+
+    @classmethod
+    def followed_category_ids(cls, emails):
+        '''Find the categories that each of a group of vendors follows
+
+        Arguments:
+            emails: List of vendor email addresses
+
+        Returns:
+            Dictionary of each passed email to the set of ids of the
+            :py:class:`~purchasing.models.front.Category` objects that the
+            vendor follows. Vendors that don't follow any category are
+            left out
+        '''
+        if not emails:
+            return {}
+
+        followed = db.session.query(
+            cls.email, category_vendor_association_table.c.category_id
+        ).join(
+            category_vendor_association_table,
+            category_vendor_association_table.c.vendor_id == cls.id
+        ).filter(
+            cls.email.in_(emails),
+            category_vendor_association_table.c.category_id != None
+        )
+
+        categories = {}
+        for email, category_id in followed:
+            categories.setdefault(email, set()).add(category_id)
+        return categories
+
+    @classmethod
+    def subscribed_opportunity_ids(cls, email, opportunity_ids):
+        '''Find which of the passed opportunities a vendor is subscribed to
+
+        Arguments:
+            email: Email address of the vendor
+            opportunity_ids: List of :py:class:`~purchasing.models.front.Opportunity` ids
+
+        Returns:
+            Set of the passed opportunity ids that the vendor with
+            the passed email is subscribed to
+        '''
+        if not email or not opportunity_ids:
+            return set()
+
+        subscribed = db.session.query(
+            opportunity_vendor_association_table.c.opportunity_id
+        ).join(
+            cls, cls.id == opportunity_vendor_association_table.c.vendor_id
+        ).filter(
+            db.func.lower(cls.email) == cls.normalize_email(email),
+            opportunity_vendor_association_table.c.opportunity_id.in_(opportunity_ids)
+        )
+
+        return set([i.opportunity_id for i in subscribed])
+
+    DOWNLOADABLE_FIELDS = (
+        'first_name', 'last_name', 'business_name', 'email', 'phone_number',
+        'minority_owned', 'woman_owned', 'veteran_owned', 'disadvantaged_owned'
+    )
+    DOWNLOADABLE_GROUPS = ('categories', 'opportunities')
+    DOWNLOADABLE_HEADER = DOWNLOADABLE_FIELDS + DOWNLOADABLE_GROUPS
+
     def build_downloadable_row(self):
-        '''Take a Vendor object and build a list for a .tsv download
+        '''Take a Vendor object and build a list for a bulk download
+
+        The ``DOWNLOADABLE_GROUPS`` columns are the sorted, de-duplicated
+        names of the vendor's categories and opportunities joined with
+        semicolons.
+
+        See Also:
+            :py:meth:`~beacon.models.vendors.Vendor.downloadable_rows` to
+            build the rows for many vendors at once
 
         Returns:
-            List of all vendor fields in order for a bulk vendor download
+            List of all vendor fields in the order of ``DOWNLOADABLE_HEADER``
         '''
-        return [
-            self.first_name, self.last_name, self.business_name,
-            self.email, self.phone_number, self.minority_owned,
-            self.woman_owned, self.veteran_owned, self.disadvantaged_owned,
-            build_downloadable_groups('category_friendly_name', self.categories),
-            build_downloadable_groups('title', self.opportunities)
+        return [getattr(self, i) for i in self.DOWNLOADABLE_FIELDS] + [
+            build_downloadable_groups('category_friendly_name', self.categories, quote=False),
+            build_downloadable_groups('title', self.opportunities, quote=False)
         ]
 
+    @classmethod
+    def downloadable_query(cls, since=None):
+        '''Query for the bulk vendor download
+
+        Each vendor's category names and opportunity titles are aggregated
+        in the database, so the whole download takes one query.
+
+        Keyword Arguments:
+            since: Naive UTC datetime. If passed, only vendors created or
+                updated at or after it are included
+
+        Returns:
+            Query of one row per vendor with the ``DOWNLOADABLE_FIELDS``
+            columns plus ``categories`` and ``opportunities`` columns
+        '''
+        from beacon.models.opportunities.base import Opportunity
+
+        categories = db.session.query(
+            category_vendor_association_table.c.vendor_id,
+            StringAgg(Category.category_friendly_name, '; ').label('names')
+        ).join(
+            Category, Category.id == category_vendor_association_table.c.category_id
+        ).group_by(category_vendor_association_table.c.vendor_id).subquery()
+
+        opportunities = db.session.query(
+            opportunity_vendor_association_table.c.vendor_id,
+            StringAgg(Opportunity.title, '; ').label('names')
+        ).join(
+            Opportunity, Opportunity.id == opportunity_vendor_association_table.c.opportunity_id
+        ).group_by(opportunity_vendor_association_table.c.vendor_id).subquery()
+
+        query = db.session.query(
+            *[getattr(cls, i) for i in cls.DOWNLOADABLE_FIELDS] + [
+                db.func.coalesce(categories.c.names, '').label('categories'),
+                db.func.coalesce(opportunities.c.names, '').label('opportunities')
+            ]
+        ).outerjoin(
+            categories, categories.c.vendor_id == cls.id
+        ).outerjoin(
+            opportunities, opportunities.c.vendor_id == cls.id
+        )
+
+        if since is not None:
+            query = query.filter(db.or_(cls.created_at >= since, cls.updated_at >= since))
+
+        return query.order_by(cls.id)
+
+    @classmethod
+    def downloadable_rows(cls, since=None, batch_size=1000):
+        '''Stream the rows of the bulk vendor download
+
+        Rows are fetched ``batch_size`` at a time from a server-side cursor,
+        so memory use doesn't grow with the number of vendors.
+
+        Keyword Arguments:
+            since: Only include vendors created or updated since this
+                naive UTC datetime, see
+                :py:meth:`~beacon.models.vendors.Vendor.downloadable_query`
+            batch_size: Number of rows to fetch from the database at once
+
+        Returns:
+            Generator of lists in the same format as
+            :py:meth:`~beacon.models.vendors.Vendor.build_downloadable_row`
+        '''
+        for row in cls.downloadable_query(since).yield_per(batch_size):
+            yield list(row)
+
     def __unicode__(self):
         return self.email
+
+@sqlalchemy.event.listens_for(Vendor, 'before_update')
+def touch_vendor(mapper, connection, instance):
+    '''Bump ``updated_at`` when only a vendor's subscriptions change
+
+    The base model only tracks column changes, but a vendor's categories
+    and opportunities are part of its row in incremental downloads.
+    '''
+    if db.session.object_session(instance).is_modified(instance):
+        instance.updated_at = datetime.datetime.utcnow()
+
+def _request_vendors():
+    '''Vendors that :py:meth:`Vendor.for_email` has looked up during the
+    current request, by email, or None outside of a request
+    '''
+    ctx = _request_ctx_stack.top
+    if ctx is None:
+        return None
+    if not hasattr(ctx, 'vendors'):
+        ctx.vendors = {}
+    return ctx.vendors
+
+@sqlalchemy.event.listens_for(Vendor, 'after_insert')
+@sqlalchemy.event.listens_for(Vendor, 'after_update')
+def remember_vendor(mapper, connection, instance):
+    '''Keep :py:meth:`Vendor.for_email` from answering with a vendor that
+    was created or changed its email earlier in the request
+    '''
+    vendors = _request_vendors()
+    if vendors is not None:
+        for email, vendor in vendors.items():
+            if vendor is instance:
+                del vendors[email]
+        vendors[instance.email] = instance
+
+@sqlalchemy.event.listens_for(Vendor, 'after_delete')
+def forget_vendor(mapper, connection, instance):
+    vendors = _request_vendors()
+    if vendors is not None:
+        vendors.pop(instance.email, None)
@@ -1,15 +1,19 @@
 # -*- coding: utf-8 -*-
 
+import types
 import collections
+import copy
 
 from werkzeug import secure_filename
 from werkzeug.datastructures import FileStorage
 
 from flask import render_template, current_app
-from flask_mail import Message
+from flask_mail import Message, Attachment
 
 from beacon.compat import basestring
-from beacon.tasks import send_email
+from beacon.models.outbox import OutboxMessage
+from beacon.tasks import queue_chunks, deliver
+from beacon.utils import make_msgid
 
 import html2text
 
@@ -51,6 +55,7 @@ class Notification(object):
         self.html_body = self.build_msg_body(html_template, convert_args, *args, **kwargs)
         self.txt_body = html2text.html2text(self.html_body)
         self.attachments = attachments
+        self._attachment_data = None
 
     def build_msg_body(self, template, convert_args, *args, **kwargs):
         '''Build an HTML or text message body for an email
@@ -136,15 +141,22 @@ class Notification(object):
     def handle_recipients(self, recipient):
         '''Turns string/list/nested list of recipients into a list of recipient emails
 
+        Generators are passed through untouched, so that recipients can be
+        streamed straight from the database into the outbox. They should
+        already be distinct, like the ones from
+        :py:meth:`~purchasing.models.front.Opportunity.get_subscriber_emails`.
+
         Arguments:
             recipient: All sorts of forms of recipients (string, unicode, list,
-                list of lists)
+                list of lists, generator of strings)
 
         Returns:
-            List of recipients with depth one
+            List of recipients with depth one, or the passed generator
         '''
         if isinstance(recipient, str) or isinstance(recipient, unicode):
             recipient = [recipient]
+        elif isinstance(recipient, types.GeneratorType):
+            return recipient
         elif isinstance(recipient, collections.Iterable):
             recipient = set(recipient)
             recipient = self.flatten(recipient)
@@ -172,20 +184,10 @@ class Notification(object):
                 subject='[Beacon] {}'.format(self.subject),
                 html=self.html_body, body=self.txt_body,
                 sender=self.from_email, reply_to=self.reply_to,
-                recipients=self.handle_recipients(recipient), cc=self.cc_email
+                recipients=list(self.handle_recipients(recipient)), cc=self.cc_email,
+                attachments=self.get_attachments()
             )
 
-            for attachment in self.attachments:
-                if (
-                    isinstance(attachment, FileStorage) and
-                    secure_filename(attachment.filename) != ''
-                ):
-                        msg.attach(
-                            filename=secure_filename(attachment.filename),
-                            content_type=attachment.content_type,
-                            data=attachment.stream.read()
-                        )
-
             return msg
 
         except Exception, e:
@@ -196,6 +198,54 @@ class Notification(object):
             )
             return False
 
+    def get_attachments(self):
+        '''Read the attachments into memory once so they can be shared between messages
+
+        Returns:
+            List of Flask-Mail ``Attachment`` objects
+        '''
+        if self._attachment_data is None:
+            self._attachment_data = [
+                Attachment(
+                    filename=secure_filename(attachment.filename),
+                    content_type=attachment.content_type,
+                    data=attachment.stream.read()
+                ) for attachment in self.attachments if (
+                    isinstance(attachment, FileStorage) and
+                    secure_filename(attachment.filename) != ''
+                )
+            ]
+        return self._attachment_data
+
+    def iter_msgs(self, multi=False):
+        '''Lazily builds a single or collection of `Message`_ objects
+
+        For multi sends, one `Message`_ is built and then cheaply copied for
+        each recipient. The copies share the rendered bodies and attachments,
+        and only get their own recipients and Message-ID.
+
+        Keyword Arguments:
+            multi: If True, multi will build an individual Notification for each
+                recipient. If False, a single Notification will be created with
+                all of the recipients visible in the ``to`` line.
+
+        Yields:
+            `Message`_ objects
+        '''
+        if not multi:
+            yield self.build_msg(self.to_email)
+            return
+
+        template = self.build_msg([])
+        if template is False:
+            return
+
+        for to in self.to_email:
+            envelope = copy.copy(template)
+            envelope.recipients = [to]
+            envelope.msgId = make_msgid()
+            yield envelope
+
     def _build(self, multi=False):
         '''Builds a single or collection of `Message`_ objects
 
@@ -207,18 +257,35 @@ class Notification(object):
         Returns:
             List of `Message`_ objects
         '''
-        msgs = []
-        if multi:
-            for to in self.to_email:
-                msgs.append(self.build_msg(to))
-        else:
-            msgs.append(self.build_msg(self.to_email))
+        return list(self.iter_msgs(multi))
 
-        return msgs
+    def queue(self, multi=False):
+        '''Store the rendered notification in the outbox
+
+        Keyword Arguments:
+            multi: If True, multi will build an individual Notification for each
+                recipient. If False, a single Notification will be created with
+                all of the recipients visible in the ``to`` line.
+
+        Returns:
+            :py:class:`~beacon.models.outbox.OutboxMessage` object
+        '''
+        return OutboxMessage.queue(
+            self.to_email, attachments=self.get_attachments(),
+            subject='[Beacon] {}'.format(self.subject),
+            sender=self.from_email, reply_to=self.reply_to, cc=self.cc_email,
+            html_body=self.html_body, txt_body=self.txt_body, multi=multi
+        )
 
     def send(self, multi=False, async=True):
         '''Send a single or group of notifications
 
+        Asynchronous sends are stored in the outbox, and a Celery task is
+        queued for each chunk of ``MAIL_CHUNK_SIZE`` recipients, with at most
+        ``MAIL_SEND_CONCURRENCY`` chunks being sent at once. The tasks are
+        only queued once the caller commits the session, and nothing is sent
+        if it is rolled back instead.
+
         Keyword Arguments:
             multi: If True, multi will build an individual Notification for each
                 recipient. If False, a single Notification will be created with
@@ -226,10 +293,12 @@ class Notification(object):
             async: If True, the sending will be kicked out to a Celery worker
                 process. If False, the sending will occur on the main request thread
         '''
-        msgs = self._build(multi)
-
-        if async:
-            send_email.delay(msgs)
-        else:
-            send_email.run(msgs)
+        if not async:
+            deliver(self.iter_msgs(multi))
+            return True
+
+        queue_chunks(
+            self.queue(multi), current_app.config['MAIL_CHUNK_SIZE'],
+            current_app.config['MAIL_SEND_CONCURRENCY']
+        )
         return True
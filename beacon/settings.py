@@ -16,12 +16,30 @@ class Config(object):
     CACHE_TYPE = 'simple'  # Can be "memcached", "redis", etc.
     BROWSERID_URL = os_env.get('BROWSERID_URL')
     PER_PAGE = 50
+    EXPORT_WATERMARK_OVERLAP = int(os_env.get('EXPORT_WATERMARK_OVERLAP', 300))
+    CATEGORY_TYPEAHEAD_LIMIT = 10
+    CATEGORY_TYPEAHEAD_MAX_LENGTH = 100
+    CATEGORY_TYPEAHEAD_CACHE_LENGTH = 3
+    PUBLIC_PAGE_MAX_AGE = int(os_env.get('PUBLIC_PAGE_MAX_AGE', 60))
+    SENDGRID_STATS_URL = os_env.get('SENDGRID_STATS_URL', 'https://sendgrid.com/api/stats.get.json')
+    STATUS_REDIS_URL = os_env.get('REDIS_URL', 'redis://localhost:6379/0')
+    STATUS_PROBE_TIMEOUT = float(os_env.get('STATUS_PROBE_TIMEOUT', 5))
+    STATUS_PROBE_TTL = int(os_env.get('STATUS_PROBE_TTL', 30))
+    ERROR_FLUSH_INTERVAL = int(os_env.get('ERROR_FLUSH_INTERVAL', 60))
+    JOB_LEASE = int(os_env.get('JOB_LEASE', 300))
+    JOB_MAX_ATTEMPTS = int(os_env.get('JOB_MAX_ATTEMPTS', 3))
+    JOB_RETRY_DELAY = int(os_env.get('JOB_RETRY_DELAY', 300))
+    JOB_CONCURRENCY = int(os_env.get('JOB_CONCURRENCY', 2))
+    JOB_POLL_INTERVAL = int(os_env.get('JOB_POLL_INTERVAL', 60))
     MAIL_DEFAULT_SENDER = os_env.get('MAIL_DEFAULT_SENDER', 'no-reply@buildpgh.com')
     BEACON_SENDER = os_env.get('BEACON_SENDER', 'beaconbot@buildpgh.com')
     MAIL_USERNAME = os_env.get('MAIL_USERNAME')
     MAIL_PASSWORD = os_env.get('MAIL_PASSWORD')
     MAIL_PORT = 587
     MAIL_USE_TLS = True
+    MAIL_CHUNK_SIZE = int(os_env.get('MAIL_CHUNK_SIZE', 500))
+    MAIL_SEND_CONCURRENCY = int(os_env.get('MAIL_SEND_CONCURRENCY', 4))
+    OUTBOX_RETENTION_DAYS = int(os_env.get('OUTBOX_RETENTION_DAYS', 30))
     UPLOAD_S3 = True
     UPLOAD_DESTINATION = 'beacon-opportunities'
     MAX_CONTENT_LENGTH = int(os_env.get('MAX_CONTENT_LENGTH', 2 * 1024 * 1024))  # max file size, default 2mb
@@ -4,14 +4,30 @@
   var categoriesContainer = $('#js-categories-container');
   var addAnother = $('#js-add-category');
   var categoryId = 1;
+  var subcategoriesUrl = categoriesContainer.attr('data-subcategories-url');
+  var typeaheadUrl = categoriesContainer.attr('data-typeahead-url');
+  var subcategoryCache = {};
 
-  function displayNewSubcats (subcatGroup, category) {
-    var newSubcats = subcategories[category];
+  function escapeHtml (text) {
+    return $('<div>').text(text).html();
+  }
+
+  function subcategoryCheckbox (id, name) {
+    return '<div class="col-sm-12">' +
+      '<div class="checkbox signup-checkbox">' +
+        '<input id="subcategories-' + id + '" class="js-subcategory" name="subcategories-' + id +
+          '" type="checkbox" checked=true>' +
+        '<label for="subcategories-' + id + '">' + escapeHtml(name) + '</label>' +
+      '</div>' +
+    '</div>';
+  }
+
+  function renderSubcats (subcatGroup, newSubcats) {
     // remove the old radio boxes
     subcatGroup.children().remove();
 
     // return if we don't have any categories
-    if (!newSubcats) {
+    if (!newSubcats || newSubcats.length === 0) {
       return;
     }
 
@@ -24,22 +40,34 @@
     '</div>';
 
     for (var i = 0; i < newSubcats.length; i++) {
-      newCheckboxes += '<div class="col-sm-12">' +
-        '<div class="checkbox signup-checkbox">' +
-          '<input id="subcategories-' + newSubcats[i][0] + '" class="js-subcategory" name="subcategories-' + newSubcats[i][0] +
-            '" type="checkbox" checked=true>' +
-          '<label for="subcategories-' + newSubcats[i][0] + '">' + newSubcats[i][1] + '</label>' +
-        '</div>' +
-      '</div>';
+      newCheckboxes += subcategoryCheckbox(newSubcats[i][0], newSubcats[i][1]);
     }
 
     subcatGroup.append(newCheckboxes);
+    uncheckAll();
+  }
+
+  function displayNewSubcats (subcatGroup, category) {
+    if (!category) {
+      renderSubcats(subcatGroup, []);
+      return;
+    }
+
+    // subcategories are fetched for one parent category at a time,
+    // instead of shipping every category with the page
+    if (subcategoryCache[category]) {
+      renderSubcats(subcatGroup, subcategoryCache[category]);
+      return;
+    }
 
-    return true;
+    $.getJSON(subcategoriesUrl, { category: category }, function (data) {
+      subcategoryCache[category] = data.subcategories;
+      renderSubcats(subcatGroup, data.subcategories);
+    });
   }
 
   function uncheckAll () {
-    $('.js-uncheck-all').change(function () {
+    $('.js-uncheck-all').off('change').change(function () {
       var subcatGroup = $(this).parents('.form-group');
       var _this = $(this);
 
@@ -102,6 +130,57 @@
 
   });
 
+  var typeaheadInput = $('#js-category-typeahead');
+  var typeaheadResults = $('#js-typeahead-results');
+  var typeaheadSelected = $('#js-typeahead-selected');
+  var typeaheadTimer;
+
+  function showTypeaheadResults (results) {
+    typeaheadResults.children().remove();
+    for (var i = 0; i < results.length; i++) {
+      typeaheadResults.append(
+        '<a href="#" class="list-group-item js-typeahead-result" data-id="' + results[i].id + '">' +
+          escapeHtml(results[i].category_friendly_name) +
+          ' <small class="text-muted">' + escapeHtml(results[i].category) + '</small>' +
+        '</a>'
+      );
+    }
+  }
+
+  typeaheadInput.on('input', function () {
+    var terms = $.trim(typeaheadInput.val());
+    window.clearTimeout(typeaheadTimer);
+
+    if (terms.length < 2) {
+      showTypeaheadResults([]);
+      return;
+    }
+
+    // wait for a pause in typing before searching
+    typeaheadTimer = window.setTimeout(function () {
+      $.getJSON(typeaheadUrl, { q: terms }, function (data) {
+        if ($.trim(typeaheadInput.val()) === terms) {
+          showTypeaheadResults(data.results);
+        }
+      });
+    }, 200);
+  });
+
+  typeaheadResults.on('click', '.js-typeahead-result', function (e) {
+    e.preventDefault();
+    var id = $(this).attr('data-id');
+    var existing = $('#subcategories-' + id);
+
+    if (existing.length > 0) {
+      existing.prop('checked', true);
+    } else {
+      typeaheadSelected.append(subcategoryCheckbox(id, $(this).contents().first().text()));
+    }
+
+    typeaheadInput.val('');
+    showTypeaheadResults([]);
+  });
+
   var initCategorySelect = $('.js-category-select');
 
   if (initCategorySelect.length > 0 && initCategorySelect !== '---') {
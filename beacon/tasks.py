@@ -1,10 +1,138 @@
 # -*- coding: utf-8 -*-
 
+import socket
+import smtplib
+
+from celery import chain
+from flask import current_app
+from sqlalchemy.orm import Session
+
 from beacon.app import celery
+from beacon.database import db, on_commit
 from beacon.extensions import mail
+from beacon.models.outbox import OutboxMessage
+
+# errors that mean the connection to the mail server went away, rather
+# than that it refused a message, so trying again later might work
+CONNECTION_ERRORS = (
+    smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, socket.error
+)
 
-@celery.task
-def send_email(messages):
+def deliver(messages):
+    '''Send `Message`_ objects immediately over one mail connection
+
+    Arguments:
+        messages: Iterable of `Message`_ objects
+    '''
     with mail.connect() as conn:
         for message in messages:
             conn.send(message)
+
+def queue_chunks(outbox, chunk_size, concurrency):
+    '''Queue ``send_email`` tasks for every chunk of an outbox message
+
+    The chunks are dealt out into ``concurrency`` lanes, and each lane is
+    queued as a celery chain. This lets large sends be spread across
+    workers, while only sending ``concurrency`` chunks of the same message
+    at once. Nothing is queued until the session's transaction commits
+    (see :py:func:`~beacon.database.on_commit`), so the workers can always
+    find the message, and rolled back messages are never sent.
+
+    Arguments:
+        outbox: :py:class:`~beacon.models.outbox.OutboxMessage` to send
+        chunk_size: Maximum number of recipients in each chunk
+        concurrency: Maximum number of chunks to send at the same time
+    '''
+    # the message is expired once the transaction commits, so read
+    # everything we need from it up front
+    outbox_id, chunks = outbox.id, outbox.chunks(chunk_size)
+    concurrency = max(concurrency, 1)
+
+    def dispatch():
+        for lane in [chunks[i::concurrency] for i in range(concurrency)]:
+            if lane:
+                chain(*[
+                    send_email.si(outbox_id, start, stop) for start, stop in lane
+                ]).apply_async()
+
+    on_commit(dispatch)
+
+@celery.task(bind=True, max_retries=3, default_retry_delay=60)
+def send_email(self, outbox_id, start, stop):
+    '''Send one chunk of an :py:class:`~beacon.models.outbox.OutboxMessage`
+
+    The whole chunk is sent over one mail connection, which Flask-Mail
+    reopens every ``MAIL_MAX_EMAILS`` messages. Recipients are marked as
+    sent as they go out, and the marks are committed after every
+    ``MAIL_MAX_EMAILS`` messages, so if the chunk is retried only the
+    recipients that weren't reached are sent again.
+
+    Only losing the connection is retried. A message that the server
+    refuses, or that can't be sent at all, has its recipients marked as
+    failed and the rest of the chunk carries on. If the retries run out,
+    or anything else goes wrong, the remaining recipients are left unsent
+    in the outbox and the rest of the chunk's lane carries on.
+
+    The task uses its own database session rather than ``db.session``, so
+    when it runs eagerly it never commits anything of the caller's.
+
+    Arguments:
+        outbox_id: Primary key of the outbox message
+        start: First recipient position of the chunk
+        stop: Recipient position the chunk stops before
+    '''
+    session = Session(bind=db.engine)
+    try:
+        outbox = session.query(OutboxMessage).get(outbox_id)
+        if outbox is None:
+            return
+
+        recipients = outbox.pending_recipients(start, stop)
+        if not recipients:
+            return
+
+        batch_size = current_app.config.get('MAIL_MAX_EMAILS') or 100
+        try:
+            with mail.connect() as conn:
+                messages = outbox.iter_msgs(recipients)
+                for count, (message, sent_to) in enumerate(messages, 1):
+                    try:
+                        conn.send(message)
+                    except CONNECTION_ERRORS:
+                        raise
+                    except Exception, e:
+                        for recipient in sent_to:
+                            recipient.mark_failed(e)
+                        current_app.logger.info(
+                            'EMAILFAIL | Error: {}\nOutbox: {}\nRecipients: {}'.format(
+                                e, outbox_id, ', '.join(i.email for i in sent_to)
+                            )
+                        )
+                    else:
+                        for recipient in sent_to:
+                            recipient.mark_sent()
+
+                    if count % batch_size == 0:
+                        session.commit()
+        except CONNECTION_ERRORS, e:
+            session.commit()
+            if self.request.retries >= self.max_retries:
+                current_app.logger.info(
+                    'EMAILFAIL | Error: {}\nOutbox: {}\nRecipients: {} to {}'.format(
+                        e, outbox_id, start, stop
+                    )
+                )
+                return
+            raise self.retry(exc=e)
+        except Exception, e:
+            session.commit()
+            current_app.logger.exception(
+                'EMAILFAIL | Error: {}\nOutbox: {}\nRecipients: {} to {}'.format(
+                    e, outbox_id, start, stop
+                )
+            )
+            return
+
+        session.commit()
+    finally:
+        session.close()
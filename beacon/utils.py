@@ -8,6 +8,8 @@ import random
 import string
 import time
 import email
+import socket
+import uuid
 import pytz
 
 from boto.s3.connection import S3Connection
@@ -25,6 +27,19 @@ PUNC_REGEX = re.compile(r'[{}]'.format(re.escape(string.punctuation)))
 # taken from python-titlecase: https://github.com/ppannuto/python-titlecase/blob/master/titlecase/__init__.py#L27
 UC_INITIALS = re.compile(r'^(?:[A-Z]{1}\.{1}|[A-Z]{1}\.{1}[A-Z]{1})+$', re.I)
 
+_MSGID_DOMAIN = []
+
+def make_msgid():
+    '''Build a unique Message-ID header value
+
+    ``email.utils.make_msgid`` looks up the fully qualified domain name on
+    every call, which adds up when sending thousands of messages, so we
+    only look it up once.
+    '''
+    if not _MSGID_DOMAIN:
+        _MSGID_DOMAIN.append(socket.getfqdn())
+    return '<{}@{}>'.format(uuid.uuid4().hex, _MSGID_DOMAIN[0])
+
 def random_id(n):
     '''Returns random id of length n
 
@@ -78,14 +93,16 @@ def _get_aggressive_cache_headers(key):
 
     return metadata
 
-def build_downloadable_groups(val, iterable):
+def build_downloadable_groups(val, iterable, quote=True):
     '''Sorts and dedupes related lists
 
-    Handles quoting, deduping, and sorting
+    Handles quoting, deduping, and sorting. Pass ``quote=False`` to leave
+    the quoting to the output format.
     '''
-    return '"' + '; '.join(
+    joined = '; '.join(
         sorted(list(set([i.__dict__[val] for i in iterable])))
-    ) + '"'
+    )
+    return '"' + joined + '"' if quote else joined
 
 def localize_now():
     return pytz.UTC.localize(datetime.datetime.now()).astimezone(current_app.config['DISPLAY_TIMEZONE'])
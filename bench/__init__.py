@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+'''Benchmarks for Beacon's hot paths
+
+The benchmarks are run with ``python manage.py bench``. They fill a
+separate database with synthetic data built from the test factories
+(:py:mod:`bench.data`), then time each scenario in
+:py:mod:`bench.scenarios` and report latency percentiles, query counts
+and peak memory (:py:mod:`bench.runner`).
+'''
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+'''Synthetic data for the benchmarks, built on the test factories'''
+
+import random
+import datetime
+
+from beacon.database import db
+from beacon.models.public import AppStatus
+from beacon.models.vendors import (
+    category_vendor_association_table, opportunity_vendor_association_table
+)
+from beacon.models.opportunities.base import category_opportunity_association_table
+
+from test.factories import (
+    DepartmentFactory, UserFactory, RoleFactory, CategoryFactory,
+    OpportunityFactory, VendorFactory
+)
+
+BATCH_SIZE = 500
+
+def _in_batches(factory, count, build_kwargs):
+    '''Create ``count`` objects with a factory, committing every BATCH_SIZE
+
+    Returns:
+        List of the ids of the created objects
+    '''
+    ids = []
+    for start in range(0, count, BATCH_SIZE):
+        batch = [
+            factory.create(**build_kwargs(i))
+            for i in range(start, min(start + BATCH_SIZE, count))
+        ]
+        db.session.flush()
+        ids.extend(i.id for i in batch)
+        db.session.commit()
+    return ids
+
+def _insert(table, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(table.insert(), rows[start:start + BATCH_SIZE])
+    db.session.commit()
+
+def opportunity_dates(i, rand, now):
+    '''Spread opportunities across the stages of their lifecycle
+
+    One in twenty publishes today, two are upcoming, eight are open and
+    the rest are closed.
+
+    Returns:
+        Dictionary of date columns for the ``i``-th opportunity
+    '''
+    bucket = i % 20
+    if bucket == 0:
+        publish, start, end = now, now, now + datetime.timedelta(days=14)
+    elif bucket < 3:
+        publish = now - datetime.timedelta(days=2)
+        start = now + datetime.timedelta(days=rand.randint(1, 10))
+        end = start + datetime.timedelta(days=30)
+    elif bucket < 11:
+        publish = now - datetime.timedelta(days=rand.randint(5, 20))
+        start = publish + datetime.timedelta(days=1)
+        end = now + datetime.timedelta(days=rand.randint(1, 40))
+    else:
+        end = now - datetime.timedelta(days=rand.randint(1, 365))
+        start = end - datetime.timedelta(days=30)
+        publish = start - datetime.timedelta(days=1)
+
+    return dict(
+        planned_publish=publish, published_at=publish,
+        planned_submission_start=start, planned_submission_end=end,
+        publish_notification_sent=bucket != 0
+    )
+
+def generate(vendors=1000, categories=200, opportunities=500, subscriptions=5, seed=0):
+    '''Fill the database with synthetic data
+
+    Keyword Arguments:
+        vendors: Number of vendors to create
+        categories: Number of categories to create
+        opportunities: Number of opportunities to create
+        subscriptions: Number of categories each vendor follows
+        seed: Seed for the random number generator, so runs with the
+            same arguments generate the same data
+
+    Returns:
+        Dictionary with the ``admin_id`` of a user that can see the admin
+        pages, and the ``opportunity_id`` of an open opportunity
+    '''
+    rand = random.Random(seed)
+    now = datetime.datetime.utcnow()
+
+    AppStatus.create(status='ok')
+    department = DepartmentFactory.create(name='bench')
+    admin = UserFactory.create(
+        email='admin@bench.beacon', department=department,
+        roles=[RoleFactory.create(name='admin')]
+    )
+    db.session.commit()
+
+    category_ids = _in_batches(CategoryFactory, categories, lambda i: dict(
+        category='Category {}'.format(i % 25),
+        subcategory='Subcategory {}'.format(i),
+        category_friendly_name='Category {} - Subcategory {}'.format(i % 25, i),
+        examples='examples of subcategory {}'.format(i),
+        nigp_codes=[i]
+    ))
+
+    def build_opportunity(i):
+        kwargs = dict(
+            department=department, created_by=admin, contact=admin,
+            title='Opportunity {}'.format(i),
+            description='Description of opportunity {}'.format(i),
+            is_public=True, is_archived=False
+        )
+        kwargs.update(opportunity_dates(i, rand, now))
+        return kwargs
+    opportunity_ids = _in_batches(OpportunityFactory, opportunities, build_opportunity)
+
+    vendor_ids = _in_batches(VendorFactory, vendors, lambda i: dict(
+        email='vendor{}@bench.beacon'.format(i),
+        business_name='Vendor {}'.format(i),
+        subscribed_to_newsletter=rand.random() < 0.5
+    ))
+
+    _insert(category_opportunity_association_table, [
+        dict(opportunity_id=opportunity_id, category_id=category_id)
+        for opportunity_id in opportunity_ids
+        for category_id in rand.sample(category_ids, min(3, len(category_ids)))
+    ])
+    _insert(category_vendor_association_table, [
+        dict(vendor_id=vendor_id, category_id=category_id)
+        for vendor_id in vendor_ids
+        for category_id in rand.sample(category_ids, min(subscriptions, len(category_ids)))
+    ])
+    _insert(opportunity_vendor_association_table, [
+        dict(vendor_id=vendor_id, opportunity_id=rand.choice(opportunity_ids))
+        for vendor_id in vendor_ids if opportunity_ids and rand.random() < 0.2
+    ])
+
+    return dict(
+        admin_id=admin.id,
+        opportunity_id=opportunity_ids[3] if len(opportunity_ids) > 3 else None
+    )
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+'''Time benchmark scenarios and report on them'''
+
+import math
+import time
+import Queue
+import resource
+import traceback
+import multiprocessing
+
+from sqlalchemy import event
+
+from beacon.database import db
+from bench.scenarios import SCENARIOS, BenchContext
+
+class QueryCounter(object):
+    '''Context manager that counts the queries run by the database engine
+
+    Attributes:
+        count: Number of queries run inside the block
+    '''
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(db.engine, 'before_cursor_execute', self)
+        return self
+
+    def __exit__(self, *args):
+        event.remove(db.engine, 'before_cursor_execute', self)
+
+def percentile(values, percent):
+    '''Nearest-rank percentile of a list of numbers
+
+    Arguments:
+        values: List of numbers
+        percent: Percentile to get, from 0 to 100
+
+    Returns:
+        The smallest value that at least ``percent`` percent of the values
+        are less than or equal to, or None if there are no values
+    '''
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = int(math.ceil(percent / 100.0 * len(ordered)))
+    return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+def peak_rss():
+    '''Peak resident memory of this process, in kilobytes'''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def measure(name, context, iterations=10, warmup=1):
+    '''Run one scenario and measure it
+
+    Arguments:
+        name: Name of a registered scenario
+        context: :py:class:`~bench.scenarios.BenchContext` to run it with
+
+    Keyword Arguments:
+        iterations: Number of timed runs
+        warmup: Number of untimed runs before the timed ones
+
+    Returns:
+        Dictionary of the scenario's latency percentiles in milliseconds,
+        average query count, and how much the peak memory of the process
+        grew in kilobytes
+
+    Raises:
+        ValueError if ``iterations`` is less than one
+    '''
+    if iterations < 1:
+        raise ValueError('iterations must be at least 1, not {}'.format(iterations))
+
+    func, setup = SCENARIOS[name]
+    start_rss = peak_rss()
+    timings, queries = [], []
+
+    for i in range(warmup + iterations):
+        if setup:
+            setup(context)
+        db.session.expire_all()
+
+        with QueryCounter() as counter:
+            started = time.time()
+            func(context)
+            elapsed = (time.time() - started) * 1000
+
+        db.session.rollback()
+        if i >= warmup:
+            timings.append(elapsed)
+            queries.append(counter.count)
+
+    return dict(
+        name=name, iterations=iterations,
+        p50=percentile(timings, 50), p90=percentile(timings, 90),
+        p99=percentile(timings, 99), max=max(timings) if timings else None,
+        queries=sum(queries) / float(len(queries)) if queries else None,
+        peak_memory=peak_rss() - start_rss
+    )
+
+def _measure_in_child(results, name, context_args, iterations, warmup):
+    try:
+        results.put(measure(name, BenchContext(**context_args), iterations, warmup))
+    except Exception:
+        results.put(traceback.format_exc())
+
+def _wait_for_result(child, results, timeout):
+    deadline = time.time() + timeout if timeout else None
+    while True:
+        try:
+            return results.get(timeout=1)
+        except Queue.Empty:
+            pass
+
+        if not child.is_alive():
+            # a result put just before the child exited may still be on its way
+            try:
+                return results.get(timeout=1)
+            except Queue.Empty:
+                return 'The process exited with code {}'.format(child.exitcode)
+        if deadline and time.time() > deadline:
+            child.terminate()
+            return 'Timed out after {} seconds'.format(timeout)
+
+def measure_isolated(name, context_args, iterations=10, warmup=1, timeout=None):
+    '''Run :py:func:`~bench.runner.measure` in a forked process
+
+    Peak memory can only go up over the life of a process, so running each
+    scenario in its own process keeps one scenario's memory use from hiding
+    the next one's.
+
+    Keyword Arguments:
+        timeout: Seconds to wait for the scenario before stopping it,
+            defaults to waiting for as long as it runs
+
+    Raises:
+        RuntimeError if the scenario raises, the process dies, or it
+        runs out of time
+    '''
+    # the child can't share the parent's database connections
+    db.session.remove()
+    db.engine.dispose()
+
+    results = multiprocessing.Queue()
+    child = multiprocessing.Process(
+        target=_measure_in_child,
+        args=(results, name, context_args, iterations, warmup)
+    )
+    child.start()
+    result = _wait_for_result(child, results, timeout)
+    child.join()
+
+    if not isinstance(result, dict):
+        raise RuntimeError('Scenario {} failed:\n{}'.format(name, result))
+    return result
+
+def run(context_args, names=None, iterations=10, warmup=1, isolate=True, timeout=None):
+    '''Run benchmark scenarios
+
+    Arguments:
+        context_args: Keyword arguments for
+            :py:class:`~bench.scenarios.BenchContext`, as returned by
+            :py:func:`bench.data.generate`
+
+    Keyword Arguments:
+        names: List of scenario names to run, defaults to all of them
+        iterations: Number of timed runs of each scenario
+        warmup: Number of untimed runs of each scenario
+        isolate: Whether to run each scenario in its own process
+        timeout: Seconds to wait for each isolated scenario, see
+            :py:func:`~bench.runner.measure_isolated`
+
+    Returns:
+        List of result dictionaries, one per scenario
+    '''
+    results = []
+    for name in names or SCENARIOS.keys():
+        if isolate:
+            results.append(measure_isolated(name, context_args, iterations, warmup, timeout))
+        else:
+            results.append(measure(name, BenchContext(**context_args), iterations, warmup))
+    return results
+
+def report(results):
+    '''Format benchmark results as a table
+
+    Returns:
+        String of the table
+    '''
+    columns = [
+        ('scenario', 'name', '{}'), ('n', 'iterations', '{}'),
+        ('p50 ms', 'p50', '{:.1f}'), ('p90 ms', 'p90', '{:.1f}'),
+        ('p99 ms', 'p99', '{:.1f}'), ('max ms', 'max', '{:.1f}'),
+        ('queries', 'queries', '{:.1f}'), ('peak mem kb', 'peak_memory', '{}')
+    ]
+    rows = [[header for header, _, _ in columns]] + [
+        [
+            '-' if result[key] is None else fmt.format(result[key])
+            for _, key, fmt in columns
+        ] for result in results
+    ]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(columns))]
+    return '\n'.join(
+        '  '.join(cell.ljust(width) for cell, width in zip(row, widths))
+        for row in rows
+    )
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+'''The hot paths that are benchmarked
+
+Each scenario is a function that takes a :py:class:`~bench.scenarios.BenchContext`
+and does one unit of work. A scenario can also have a setup function, which
+runs untimed before every iteration to put the data back into the state the
+scenario expects.
+'''
+
+import collections
+
+from flask import current_app
+
+from beacon.database import db, localize_today_sql
+from beacon.models.public import AppStatus
+from beacon.models.opportunities.base import Opportunity
+from beacon.jobs.beacon_nightly import (
+    BeaconNewOppotunityOpenJob, BeaconBiweeklyDigestJob
+)
+
+SCENARIOS = collections.OrderedDict()
+
+class BenchContext(object):
+    '''Everything a scenario needs to run
+
+    Arguments:
+        admin_id: Id of a user with the admin role
+        opportunity_id: Id of an open opportunity
+
+    Attributes:
+        client: Anonymous Flask test client
+        admin_client: Flask test client logged in as the admin user
+    '''
+    def __init__(self, admin_id, opportunity_id):
+        self.admin_id = admin_id
+        self.opportunity_id = opportunity_id
+        self.client = current_app.test_client()
+        self.admin_client = current_app.test_client()
+        with self.admin_client.session_transaction() as session:
+            session['user_id'] = str(admin_id)
+            session['_fresh'] = True
+
+def scenario(name, setup=None):
+    '''Decorator to register a scenario
+
+    Arguments:
+        name: Name to report the scenario under
+
+    Keyword Arguments:
+        setup: Function that takes the context and runs untimed before
+            each iteration
+    '''
+    def decorator(func):
+        SCENARIOS[name] = (func, setup)
+        return func
+    return decorator
+
+def get(client, url):
+    response = client.get(url)
+    # read streamed responses to the end
+    response.get_data()
+    assert response.status_code == 200, '{} returned {}'.format(url, response.status_code)
+    return response
+
+def send_all(job):
+    for notification in job.build_notifications():
+        notification.send(multi=True)
+
+@scenario('front.browse')
+def browse(context):
+    get(context.client, '/opportunities')
+
+@scenario('front.detail')
+def detail(context):
+    get(context.client, '/opportunities/{}'.format(context.opportunity_id))
+
+@scenario('front.signup')
+def signup(context):
+    get(context.client, '/signup')
+
+@scenario('beacon_admin.signups')
+def signups(context):
+    get(context.admin_client, '/beacon/admin/signups')
+
+def reset_new_opportunities(context):
+    Opportunity.query.filter(
+        db.func.DATE(Opportunity.planned_publish) == localize_today_sql()
+    ).update({'publish_notification_sent': False}, synchronize_session=False)
+    db.session.commit()
+
+@scenario('jobs.BeaconNewOppotunityOpenJob', setup=reset_new_opportunities)
+def new_opportunity_job(context):
+    send_all(BeaconNewOppotunityOpenJob(time_override=True))
+
+def reset_last_newsletter(context):
+    AppStatus.query.update({'last_beacon_newsletter': None})
+    db.session.commit()
+
+@scenario('jobs.BeaconBiweeklyDigestJob', setup=reset_last_newsletter)
+def biweekly_digest_job(context):
+    send_all(BeaconBiweeklyDigestJob(time_override=True))
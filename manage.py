@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import argparse
 import datetime
 import os
 from flask import current_app
@@ -27,6 +28,17 @@ def _make_context():
     """
     return {'app': app, 'db': db}
 
+def _positive_int(value):
+    """Argument type for options that need a whole number of at least one
+    """
+    try:
+        value = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError('{} is not a whole number'.format(value))
+    if value < 1:
+        raise argparse.ArgumentTypeError('{} is less than 1'.format(value))
+    return value
+
 @manager.option('-e', '--email', dest='email', default=None)
 @manager.option('-r', '--role', dest='role', default=None)
 @manager.option('-d', '--department', dest='dept', default='Other')
@@ -74,16 +86,18 @@ def create_domain(domain):
     default='./beacon/importer/files/2015-07-01-nigp-cleaned.csv'
 )
 @manager.option('-r', '--replace', dest='replace', default=False)
-def import_nigp(filepath, replace=False):
+@manager.option('--row-by-row', dest='row_by_row', action='store_true', default=False)
+def import_nigp(filepath, replace=False, row_by_row=False):
     if replace:
         print 'Deleting current categories...'
         db.session.execute(
             'DELETE FROM category'
         )
-        db.session.commit
+        db.session.commit()
     from beacon.importer.nigp import main
     print 'Importing data from {filepath}\n'.format(filepath=filepath)
-    main(filepath)
+    created = main(filepath, bulk=not row_by_row)
+    print '{} new categories'.format(created)
     print 'Import finished!'
     return
 
@@ -186,18 +200,76 @@ def seed(user=None, secret=None, bucket=None):
 
 @manager.command
 def schedule_work(ignore_time=False):
-    from beacon.jobs import JobBase
-    for job in JobBase.jobs:
-        job(time_override=ignore_time).schedule_job()
-        db.session.commit()
+    from beacon.jobs.worker import schedule
+    schedule(ignore_time=ignore_time)
 
 @manager.command
 def do_work(ignore_time=False):
-    from beacon.jobs.job_base import JobStatus
-    jobs = JobStatus.query.filter(JobStatus.status == 'new').all()
-    for job in jobs:
-        task = getattr(nightly_jobs, job.name)(time_override=ignore_time)
-        task.run_job(job)
+    from beacon.jobs.worker import Worker
+    Worker(ignore_time=ignore_time).work()
+
+@manager.option('-c', '--concurrency', dest='concurrency', default=None, type=int)
+@manager.option('-p', '--poll', dest='poll', default=None, type=int)
+@manager.option('-i', '--ignore-time', dest='ignore_time', action='store_true', default=False)
+def run_worker(concurrency, poll, ignore_time):
+    '''Schedules and runs nightly jobs until stopped
+
+    Any number of workers can run at once, on any number of machines.
+    '''
+    from beacon.jobs.worker import Worker
+    Worker(concurrency=concurrency, ignore_time=ignore_time).serve(poll=poll)
+
+@manager.option('-d', '--days', dest='days', default=None, type=int)
+def purge_outbox(days):
+    '''Deletes outbox messages that were sent to every recipient more than
+    ``days`` days ago, defaulting to ``OUTBOX_RETENTION_DAYS``
+    '''
+    from beacon.models.outbox import OutboxMessage
+    days = days if days is not None else app.config['OUTBOX_RETENTION_DAYS']
+    print 'Deleted {} outbox messages'.format(OutboxMessage.purge(days))
+
+@manager.option('-d', '--database', dest='database', default=os.environ.get('BENCH_DATABASE_URL'))
+@manager.option('-v', '--vendors', dest='vendors', default=1000, type=int)
+@manager.option('-c', '--categories', dest='categories', default=200, type=int)
+@manager.option('-o', '--opportunities', dest='opportunities', default=500, type=int)
+@manager.option('-s', '--subscriptions', dest='subscriptions', default=5, type=int)
+@manager.option('-n', '--iterations', dest='iterations', default=10, type=_positive_int)
+@manager.option('-t', '--timeout', dest='timeout', default=600, type=_positive_int)
+@manager.option('--scenario', dest='scenarios', action='append')
+@manager.option('--output', dest='output', default=None)
+def bench(database, vendors, categories, opportunities, subscriptions, iterations, timeout, scenarios, output):
+    '''Benchmarks the hot paths against a separate database of synthetic data
+
+    All tables in the benchmark database are dropped and recreated.
+    '''
+    import json
+    from sqlalchemy.engine.url import make_url
+    from beacon.app import celery
+    from bench import data, runner
+
+    if not database or make_url(database) == make_url(app.config['SQLALCHEMY_DATABASE_URI']):
+        print 'Pass a --database (or set BENCH_DATABASE_URL) that is not the app database'
+        return
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = database
+    app.extensions['mail'].suppress = True
+    celery.conf.CELERY_ALWAYS_EAGER = True
+
+    print 'Generating data in {}...'.format(make_url(database).database)
+    db.drop_all()
+    db.create_all()
+    context_args = data.generate(
+        vendors=vendors, categories=categories, opportunities=opportunities,
+        subscriptions=subscriptions
+    )
+
+    print 'Running scenarios...\n'
+    results = runner.run(context_args, names=scenarios, iterations=iterations, timeout=timeout)
+    print runner.report(results)
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
 
 manager.add_command('server', Server(port=os.environ.get('PORT', 9000)))
 manager.add_command('shell', Shell(make_context=_make_context))
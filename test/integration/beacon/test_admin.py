@@ -1,5 +1,10 @@
 # -*- coding: utf-8 -*-
 
+import csv
+import gzip
+import json
+import base64
+import dateutil.parser
 import datetime
 
 from os import listdir
@@ -17,10 +22,12 @@ from beacon.models.opportunities.documents import OpportunityDocument
 from beacon.models.vendors import Vendor, Category
 
 from beacon.models.questions import Question
+from beacon.jobs.job_base import JobStatus
 from beacon.forms.opportunities import OpportunityDocumentForm
 
 from test.factories import (
-    OpportunityDocumentFactory, VendorFactory, QuestionFactory
+    OpportunityDocumentFactory, VendorFactory, QuestionFactory,
+    OpportunityFactory
 )
 
 from test.integration.beacon.test_base import TestOpportunitiesAdminBase
@@ -284,6 +291,95 @@ class TestOpportunityAdmin(TestOpportunitiesAdminBase):
         for row in tsv_data:
             self.assertEquals(len(row.split('\t')), 11)
 
+    def test_signup_download_rows(self):
+        categories = Category.query.all()
+        VendorFactory.create(
+            business_name=u'bü', categories=categories[:2],
+            opportunities=set([self.opportunity1, self.opportunity2])
+        )
+        VendorFactory.create(categories=(categories[-1],))
+        db.session.commit()
+
+        vendors = Vendor.query.order_by(Vendor.id).all()
+        self.assertEquals(
+            list(Vendor.downloadable_rows(batch_size=1)),
+            [i.build_downloadable_row() for i in vendors]
+        )
+
+    def test_signup_download_since(self):
+        categories = Category.query.all()
+        old_vendor = VendorFactory.create(categories=categories[:1])
+        new_vendor = VendorFactory.create()
+        db.session.commit()
+
+        # bulk updates skip the timestamp listeners
+        Vendor.query.update(
+            {'created_at': datetime.datetime(2015, 1, 1), 'updated_at': None},
+            synchronize_session=False
+        )
+        Vendor.query.filter(Vendor.id == new_vendor.id).update(
+            {'created_at': datetime.datetime(2015, 6, 1)}, synchronize_session=False
+        )
+        db.session.commit()
+        emails = lambda since: [
+            i[3] for i in Vendor.downloadable_rows(since=since)
+        ]
+        self.assertEquals(emails(datetime.datetime(2015, 3, 1)), [new_vendor.email])
+
+        # collection-only changes still bump updated_at
+        old_vendor.categories.add(categories[-1])
+        db.session.commit()
+        self.assertEquals(
+            emails(datetime.datetime(2015, 3, 1)),
+            [old_vendor.email, new_vendor.email]
+        )
+
+        self.login_user(self.staff)
+        request = self.client.get('/beacon/admin/signups?since=2015-03-01T00:00:00Z&format=jsonl')
+        self.assertEquals(request.mimetype, 'application/x-ndjson')
+        self.assertTrue(request.headers.get('X-Export-Timestamp'))
+        self.assertEquals(len(request.data.splitlines()), 2)
+
+        self.assert400(self.client.get('/beacon/admin/signups?since=not-a-date'))
+        self.assert400(self.client.get('/beacon/admin/signups?format=xls'))
+
+    def test_signup_download_watermark(self):
+        self.login_user(self.staff)
+        overlap = datetime.timedelta(seconds=current_app.config['EXPORT_WATERMARK_OVERLAP'])
+        watermark = dateutil.parser.parse(
+            self.client.get('/beacon/admin/signups?format=jsonl').headers['X-Export-Timestamp']
+        )
+        self.assertTrue(abs(datetime.datetime.utcnow() - overlap - watermark) < datetime.timedelta(seconds=60))
+
+        # saved by a transaction that started before the download but
+        # committed after it
+        late = VendorFactory.create()
+        late.created_at = watermark + overlap - datetime.timedelta(seconds=1)
+        db.session.commit()
+
+        response = self.client.get('/beacon/admin/signups?format=jsonl&since={}'.format(watermark.isoformat()))
+        self.assertTrue(late.email in [json.loads(i)['email'] for i in response.data.splitlines()])
+
+    def test_signup_download_formats(self):
+        VendorFactory.create(business_name=u'bü, inc', categories=Category.query.all()[:2])
+        db.session.commit()
+        self.login_user(self.staff)
+
+        request = self.client.get('/beacon/admin/signups?format=csv')
+        self.assertEquals(request.mimetype, 'text/csv')
+        rows = list(csv.reader(StringIO(request.data)))
+        self.assertEquals(rows[0], list(Vendor.DOWNLOADABLE_HEADER))
+        self.assertTrue(any(row[2] == u'bü, inc'.encode('utf-8') for row in rows[1:]))
+
+        tsv = self.client.get('/beacon/admin/signups').data
+        request = self.client.get('/beacon/admin/signups?gzip=1')
+        self.assertEquals(request.mimetype, 'application/gzip')
+        self.assertEquals(
+            request.headers.get('Content-Disposition'),
+            'attachment; filename=vendors-{}.tsv.gz'.format(datetime.date.today())
+        )
+        self.assertEquals(gzip.GzipFile(fileobj=StringIO(request.data)).read(), tsv)
+
 class TestOpportunityPublic(TestOpportunitiesAdminBase):
     def setUp(self):
         super(TestOpportunityPublic, self).setUp()
@@ -497,6 +593,50 @@ class TestExpiredOpportunities(TestOpportunitiesAdminBase):
         self.assert200(self.client.get('/opportunities/expired'))
         self.assertEquals(len(self.get_context_variable('expired')), 1)
 
+    def test_expired_pagination(self):
+        current_app.config['PER_PAGE'] = 2
+        older = [
+            OpportunityFactory.create(
+                contact=self.admin, created_by=self.staff, is_public=True,
+                planned_publish=datetime.date.today() - datetime.timedelta(10),
+                planned_submission_start=datetime.date.today() - datetime.timedelta(10),
+                planned_submission_end=datetime.datetime.today() - datetime.timedelta(days=i)
+            ) for i in range(2, 5)
+        ]
+        expected = [self.opportunity3] + older
+
+        self.assert200(self.client.get('/opportunities/expired'))
+        first_page = self.get_context_variable('pagination')
+        self.assertEquals(first_page.items, expected[:2])
+        self.assertFalse(first_page.has_prev)
+        self.assertTrue(first_page.has_next)
+
+        self.assert200(self.client.get('/opportunities/expired?after={}'.format(first_page.next_cursor)))
+        second_page = self.get_context_variable('pagination')
+        self.assertEquals(second_page.items, expected[2:])
+        self.assertTrue(second_page.has_prev)
+        self.assertFalse(second_page.has_next)
+
+        self.assert200(self.client.get('/opportunities/expired?before={}'.format(second_page.prev_cursor)))
+        self.assertEquals(self.get_context_variable('expired'), expected[:2])
+
+        self.assert200(self.client.get('/opportunities/expired?after=garbage'))
+        self.assertEquals(self.get_context_variable('expired'), expected[:2])
+
+    def test_expired_tampered_cursor(self):
+        self.assert200(self.client.get('/opportunities/expired'))
+        first_page = self.get_context_variable('expired')
+
+        today = datetime.datetime.today().isoformat()
+        for values in (
+            [today, 'abc'], [today, 2 ** 40], [today, 1.5], [today, None], [today, True],
+            [12, 1], [{}, 1], {'a': today, 'b': 1}, [today], 'abc', 7
+        ):
+            cursor = base64.urlsafe_b64encode(json.dumps(values))
+            for direction in ('after', 'before'):
+                self.assert200(self.client.get('/opportunities/expired?{}={}'.format(direction, cursor)))
+                self.assertEquals(self.get_context_variable('expired'), first_page)
+
 class TestOpportunityQuestions(TestOpportunitiesAdminBase):
     render_templates = True
 
@@ -577,3 +717,44 @@ class TestOpportunityQuestions(TestOpportunitiesAdminBase):
         self.assertEquals(self.client.get(self.question_url).status_code, 302)
         self.assertEquals(self.client.get(self.answer_url).status_code, 302)
         self.assertEquals(self.client.get(self.answer_url + '/delete').status_code, 302)
+
+class TestJobHistory(TestOpportunitiesAdminBase):
+    def setUp(self):
+        super(TestJobHistory, self).setUp()
+        today = datetime.datetime.today().replace(hour=0, minute=0, second=0, microsecond=0)
+        JobStatus.create(
+            name='BeaconNewOppotunityOpenJob', date=today, status='success',
+            started_at=datetime.datetime(2015, 10, 1, 11), finished_at=datetime.datetime(2015, 10, 1, 11, 2),
+            build_seconds=30.5, send_seconds=89.5, notification_count=3, recipient_count=120
+        )
+        JobStatus.create(name='BeaconBiweeklyDigestJob', date=today, status='skipped')
+        JobStatus.create(name='BeaconBiweeklyDigestJob', date=today - datetime.timedelta(days=45))
+
+    def test_jobs_permissions(self):
+        self.assertEquals(self.client.get('/beacon/admin/jobs').status_code, 302)
+        self.login_user(self.staff)
+        self.assertEquals(self.client.get('/beacon/admin/jobs').status_code, 302)
+        self.assertEquals(self.client.get('/beacon/admin/jobs.json').status_code, 302)
+
+    def test_jobs(self):
+        self.login_user(self.admin)
+        self.assert200(self.client.get('/beacon/admin/jobs'))
+        self.assert_template_used('beacon/admin/jobs.html')
+        self.assertEquals(len(self.get_context_variable('jobs')), 2)
+
+        self.assert200(self.client.get('/beacon/admin/jobs?name=BeaconBiweeklyDigestJob&days=60'))
+        self.assertEquals(len(self.get_context_variable('jobs')), 2)
+        self.assert400(self.client.get('/beacon/admin/jobs?days=many'))
+
+    def test_jobs_json(self):
+        self.login_user(self.admin)
+        jobs = self.client.get('/beacon/admin/jobs.json?name=BeaconNewOppotunityOpenJob').json['jobs']
+        self.assertEquals(len(jobs), 1)
+        self.assertEquals(jobs[0]['duration'], 120)
+        self.assertEquals(jobs[0]['started_at'], '2015-10-01T11:00:00')
+        self.assertEquals(
+            (jobs[0]['build_seconds'], jobs[0]['send_seconds']), (30.5, 89.5)
+        )
+        self.assertEquals(
+            (jobs[0]['notification_count'], jobs[0]['recipient_count']), (3, 120)
+        )
@@ -1,13 +1,18 @@
 # -*- coding: utf-8 -*-
 
 import json
+import base64
 import datetime
+import sqlalchemy
+from mock import patch
 from flask import current_app, url_for, Markup
 from werkzeug.datastructures import MultiDict
 
-from beacon.extensions import mail, db
-from beacon.models.vendors import Vendor
+from beacon.extensions import mail, db, cache
+from beacon.models.vendors import Vendor, Category
 from beacon.models.questions import Question
+from beacon.models.opportunities.base import Opportunity, opportunity_pages
+from beacon.forms.opportunities import category_tree
 
 from test.integration.beacon.test_base import (
     TestOpportunitiesFrontBase, TestOpportunitiesAdminBase
@@ -68,12 +73,22 @@ class TestOpportunities(TestOpportunitiesFrontBase):
 
         response = self.client.get('/signup')
         self.assert200(response)
-        subcats = json.loads(self.get_context_variable('subcategories'))
-
-        # assert three categories (plus the total category)
-        self.assertEquals(len(subcats.keys()), 4)
-        # assert five total subcatgories (plus 5 in the total field)
-        self.assertEquals(len([item for sublist in subcats.values() for item in sublist]), 10)
+        # assert three categories
+        categories = json.loads(self.get_context_variable('categories'))
+        self.assertEquals(len(categories), 3)
+        # subcategories aren't shipped with the page
+        self.assertFalse('var subcategories' in response.data)
+
+        # assert five total subcatgories
+        subcats = self.client.get('/categories/subcategories?category=Select+All')
+        self.assertEquals(len(subcats.json['subcategories']), 5)
+        subcats = self.client.get('/categories/subcategories', query_string={
+            'category': categories[0]
+        })
+        self.assertTrue(len(subcats.json['subcategories']) > 0)
+        self.assertEquals(
+            self.client.get('/categories/subcategories?category=foo').json['subcategories'], []
+        )
 
         # assert email, business, categories needed
         no_email_post = self.client.post('/signup', data=dict(
@@ -338,6 +353,23 @@ class TestOpportunitiesSubscriptions(TestOpportunitiesAdminBase):
             self.assertEquals(session['email'], 'new@foo.com')
             self.assertEquals(session['business_name'], 'NEW NAME')
 
+    def test_browse_subscribed_checkboxes(self):
+        self.client.post('/opportunities', data={
+            'business_name': 'foo',
+            'email': 'new@foo.com',
+            'opportunity': self.opportunity4.id
+        })
+
+        self.assert200(self.client.get('/opportunities'))
+        self.assertEquals(self.get_context_variable('subscribed'), set([self.opportunity4.id]))
+
+        self.assertEquals(
+            Vendor.subscribed_opportunity_ids(
+                'new@foo.com', [self.opportunity2.id, self.opportunity4.id]
+            ), set([self.opportunity4.id])
+        )
+        self.assertEquals(Vendor.subscribed_opportunity_ids(None, [self.opportunity4.id]), set())
+
     def test_opportunity_subscription_different_business_name(self):
         with self.client.session_transaction() as session:
             session['email'] = self.vendor.email
@@ -352,6 +384,24 @@ class TestOpportunitiesSubscriptions(TestOpportunitiesAdminBase):
             self.assertEquals(Vendor.query.count(), 1)
             self.assertEquals(Vendor.query.first().business_name, 'NEW NAME')
 
+class TestOpportunityLifecycleQueries(TestOpportunitiesAdminBase):
+    def test_lifecycle_filters_match_properties(self):
+        for opportunity in Opportunity.query.all():
+            for prop in ['is_published', 'is_upcoming', 'is_submission_start', 'is_submission_end']:
+                in_query = Opportunity.query.filter(
+                    getattr(Opportunity, prop), Opportunity.id == opportunity.id
+                ).count() == 1
+                self.assertEquals(in_query, bool(getattr(opportunity, prop)))
+
+    def test_lifecycle_filters(self):
+        _open = Opportunity.query.filter(Opportunity.is_submission_start).all()
+        upcoming = Opportunity.query.filter(Opportunity.is_upcoming).all()
+        closed = Opportunity.query.filter(Opportunity.is_submission_end).all()
+
+        self.assertEquals(_open, [self.opportunity4])
+        self.assertEquals(upcoming, [self.opportunity2])
+        self.assertEquals(closed, [self.opportunity3])
+
 class TestOpportunityQuestions(TestOpportunitiesAdminBase):
     def setUp(self):
         super(TestOpportunityQuestions, self).setUp()
@@ -438,3 +488,341 @@ class TestOpportunityQuestions(TestOpportunitiesAdminBase):
             Vendor.query.get(self.vendor.id).business_name,
             'a very new name'
         )
+
+class TestVendorEmails(TestOpportunitiesAdminBase):
+    def count_queries(self):
+        queries = []
+        def record(conn, cursor, statement, *args):
+            if 'FROM vendor' in statement:
+                queries.append(statement)
+        sqlalchemy.event.listen(db.engine, 'before_cursor_execute', record)
+        self.addCleanup(sqlalchemy.event.remove, db.engine, 'before_cursor_execute', record)
+        return queries
+
+    def test_emails_normalized(self):
+        vendor = Vendor.create(email=' Mixed@Foo.com', business_name='foo')
+        self.assertEquals(vendor.email, 'mixed@foo.com')
+
+        self.client.post('/opportunities', data={
+            'business_name': 'foo', 'email': 'FOO@foo.com',
+            'opportunity': self.opportunity2.id
+        })
+        self.assertEquals(Vendor.query.count(), 2)
+        self.assertEquals(len(Vendor.query.get(self.vendor.id).opportunities), 1)
+        self.assertEquals(
+            Vendor.subscribed_opportunity_ids('Foo@Foo.com', [self.opportunity2.id]),
+            set([self.opportunity2.id])
+        )
+
+    def test_for_email_once_per_request(self):
+        queries = self.count_queries()
+        with self.app.test_request_context():
+            self.assertEquals(Vendor.for_email('FOO@foo.com').id, self.vendor.id)
+            self.assertEquals(Vendor.for_email('foo@foo.com').id, self.vendor.id)
+            self.assertEquals(Vendor.for_email('new@foo.com'), None)
+            self.assertEquals(Vendor.for_email('new@foo.com'), None)
+        self.assertEquals(len(queries), 2)
+
+        with self.app.test_request_context():
+            Vendor.for_email('foo@foo.com')
+        self.assertEquals(len(queries), 3)
+
+    def test_for_email_sees_new_vendors(self):
+        with self.app.test_request_context():
+            self.assertEquals(Vendor.for_email('new@foo.com'), None)
+            vendor = Vendor.create(email='New@foo.com', business_name='new')
+            self.assertEquals(Vendor.for_email('new@foo.com'), vendor)
+
+            vendor.update(email='newer@foo.com')
+            self.assertEquals(Vendor.for_email('newer@foo.com'), vendor)
+
+    def test_question_looks_up_vendor_once(self):
+        self.opportunity3.created_by = self.staff
+        self.opportunity3.save()
+        with self.client.session_transaction() as session:
+            session['email'] = self.vendor.email
+
+        queries = self.count_queries()
+        self.client.post('/opportunities/{}?form=question_form'.format(self.opportunity3.id), data=dict(
+            question='my question', business_name='foo2', email='Foo@Foo.com'
+        ))
+        self.assertEquals(Question.query.first().asked_by_id, self.vendor.id)
+        self.assertEquals(len([i for i in queries if 'lower(vendor.email)' in i]), 1)
+
+class TestOpportunitySearch(TestOpportunitiesAdminBase):
+    def search_ids(self, terms):
+        return [i.id for i in Opportunity.search(terms)]
+
+    def test_search_title_and_categories(self):
+        self.assertEquals(self.search_ids('test title'), [self.opportunity4.id])
+
+        # every opportunity is in the same category, but only
+        # published opportunities are searched
+        category_name = Category.query.first().category_friendly_name
+        self.assertEquals(
+            self.search_ids(category_name),
+            [self.opportunity2.id, self.opportunity3.id, self.opportunity4.id]
+        )
+
+        # a match in the title outranks a match in the categories
+        self.opportunity3.title = category_name
+        db.session.commit()
+        self.assertEquals(self.search_ids(category_name)[0], self.opportunity3.id)
+
+        self.assertEquals(self.search_ids('nothing like this'), [])
+
+    def test_search_tsv_follows_changes(self):
+        category = Category.query.filter(
+            Category.category_friendly_name == 'Public works related services'
+        ).first()
+        self.opportunity2.categories.add(category)
+        db.session.commit()
+        self.assertEquals(self.search_ids('graffiti removal'), [self.opportunity2.id])
+
+        category.examples = 'Snow plowing'
+        db.session.commit()
+        self.assertEquals(self.search_ids('graffiti removal'), [])
+        self.assertEquals(self.search_ids('plowed snow'), [self.opportunity2.id])
+
+        self.opportunity2.categories.remove(category)
+        db.session.commit()
+        self.assertEquals(self.search_ids('plowed snow'), [])
+
+    def test_search_view(self):
+        self.assert200(self.client.get('/opportunities/search'))
+        self.assertEquals(self.get_context_variable('pagination'), None)
+
+        self.assert200(self.client.get('/opportunities/search?q=test+title'))
+        self.assertEquals(
+            self.get_context_variable('pagination').items, [self.opportunity4]
+        )
+
+        current_app.config['PER_PAGE'] = 2
+        self.assert200(self.client.get('/opportunities/search', query_string={
+            'q': Category.query.first().category_friendly_name, 'page': 2
+        }))
+        pagination = self.get_context_variable('pagination')
+        self.assertEquals(pagination.items, [self.opportunity4])
+        self.assertEquals(pagination.total, 3)
+        self.assertTrue(pagination.has_prev)
+        current_app.config['PER_PAGE'] = 50
+
+class TestCategoryTypeahead(TestOpportunitiesFrontBase):
+    def names(self, terms):
+        return [i.category_friendly_name for i in Category.typeahead(terms)]
+
+    def test_typeahead(self):
+        # names that start with the search come first
+        self.assertEquals(self.names('a')[:2], [
+            'Abrasive equipment and materials', 'Agricultural equipment and parts'
+        ])
+        self.assertEquals(self.names('Abrasive'), ['Abrasive equipment and materials'])
+        # partial words in the examples match too
+        self.assertEquals(self.names('sandpa'), ['Abrasive equipment and materials'])
+        self.assertEquals(self.names('graffiti remov'), ['Public works related services'])
+        self.assertEquals(len(Category.typeahead('services', limit=1)), 1)
+        self.assertEquals(self.names(u'%_ &|!'), [])
+
+    def test_typeahead_view(self):
+        response = self.client.get('/categories/typeahead?q=Sandpa')
+        self.assert200(response)
+        self.assertEquals(
+            [i['category_friendly_name'] for i in response.json['results']],
+            ['Abrasive equipment and materials']
+        )
+        self.assertEquals(self.client.get('/categories/typeahead').json['results'], [])
+
+    def cached_keys(self):
+        return len([i for i in cache.cache._cache if i.startswith('versioned-cache:category-tree:')])
+
+    def test_typeahead_cached_until_import(self):
+        cached = self.client.get('/categories/typeahead?q=abr').json['results']
+        Category.query.filter(
+            Category.category_friendly_name == 'Abrasive equipment and materials'
+        ).update({'category_friendly_name': 'Sanding', 'examples': None, 'examples_tsv': None})
+        db.session.commit()
+
+        # same search, normalized, is still cached
+        response = self.client.get('/categories/typeahead?q=+ABR++')
+        self.assertEquals(response.json['results'], cached)
+
+        category_tree.invalidate()
+        response = self.client.get('/categories/typeahead?q=abr')
+        self.assertNotEquals(response.json['results'], cached)
+
+    def test_typeahead_only_caches_short_hits(self):
+        category_tree.invalidate()
+        before = self.cached_keys()
+        self.client.get('/categories/typeahead?q=abr')
+        self.assertEquals(self.cached_keys(), before + 1)
+
+        # longer searches, and searches that find nothing, aren't cached
+        response = self.client.get('/categories/typeahead?q=sandpa')
+        self.assertEquals(len(response.json['results']), 1)
+        self.client.get('/categories/typeahead?q=zqx')
+        self.assertEquals(self.cached_keys(), before + 1)
+
+    def test_typeahead_long_query(self):
+        response = self.client.get('/categories/typeahead?q=sandpa' + 'x' * 1000)
+        self.assert200(response)
+        self.assertEquals(response.json['results'], [])
+
+class TestConditionalRequests(TestOpportunitiesAdminBase):
+    def revalidate(self, url, response):
+        return self.client.get(url, headers={'If-None-Match': response.headers['ETag']})
+
+    def test_browse_not_modified(self):
+        response = self.client.get('/opportunities')
+        self.assert200(response)
+        self.assertTrue('public' in response.headers['Cache-Control'])
+        self.assertTrue('Last-Modified' in response.headers)
+
+        not_modified = self.revalidate('/opportunities', response)
+        self.assertEquals(not_modified.status_code, 304)
+        self.assertEquals(not_modified.data, '')
+        self.assertEquals(not_modified.headers['ETag'], response.headers['ETag'])
+
+        not_modified = self.client.get('/opportunities', headers={
+            'If-Modified-Since': response.headers['Last-Modified']
+        })
+        self.assertEquals(not_modified.status_code, 304)
+
+    def test_browse_modified(self):
+        response = self.client.get('/opportunities')
+
+        self.opportunity4.title = 'A new title'
+        db.session.commit()
+        self.assert200(self.revalidate('/opportunities', response))
+
+        response = self.client.get('/opportunities')
+        self.opportunity4.is_public = False
+        db.session.commit()
+        self.assert200(self.revalidate('/opportunities', response))
+
+        # expired opportunities are listed from the same data
+        response = self.client.get('/opportunities/expired')
+        self.assertEquals(self.revalidate('/opportunities/expired', response).status_code, 304)
+        self.opportunity3.description = 'Updated'
+        db.session.commit()
+        self.assert200(self.revalidate('/opportunities/expired', response))
+
+    def test_private_pages(self):
+        response = self.client.get('/opportunities')
+
+        with self.client.session_transaction() as session:
+            session['email'] = self.vendor.email
+        subscribed = self.revalidate('/opportunities', response)
+        self.assert200(subscribed)
+        self.assertTrue('private' in subscribed.headers['Cache-Control'])
+        self.assertFalse('Last-Modified' in subscribed.headers)
+        self.assertEquals(self.revalidate('/opportunities', subscribed).status_code, 304)
+
+        # subscribing changes how the page renders for this vendor
+        self.vendor.opportunities.add(self.opportunity4)
+        db.session.commit()
+        self.assert200(self.revalidate('/opportunities', subscribed))
+
+        self.login_user(self.admin)
+        self.assert200(self.revalidate('/opportunities', subscribed))
+
+    def test_flashed_pages_not_kept(self):
+        with self.client.session_transaction() as session:
+            session['_flashes'] = [('alert-success', 'Subscribed!')]
+        response = self.client.get('/opportunities')
+        self.assert200(response)
+        self.assertFalse('ETag' in response.headers)
+        self.assertTrue('no-store' in response.headers['Cache-Control'])
+
+    def test_detail_answered_questions(self):
+        url = '/opportunities/{}'.format(self.opportunity4.id)
+        response = self.client.get(url)
+        self.assertEquals(self.revalidate(url, response).status_code, 304)
+
+        question = Question.create(
+            question_text='Why?', opportunity_id=self.opportunity4.id
+        )
+        self.assertEquals(self.revalidate(url, response).status_code, 304)
+
+        question.update(answer_text='Because', answered_at=datetime.datetime.utcnow())
+        self.assert200(self.revalidate(url, response))
+
+    def test_detail_categories(self):
+        url = '/opportunities/{}'.format(self.opportunity4.id)
+        response = self.client.get(url)
+
+        self.opportunity4.categories.add(Category.query.filter(
+            ~Category.id.in_([i.id for i in self.opportunity4.categories])
+        ).first())
+        db.session.commit()
+        self.assert200(self.revalidate(url, response))
+
+class TestFragmentCache(TestOpportunitiesAdminBase):
+    render_templates = True
+
+    def fragments_rendered(self):
+        return [i.name for i, _ in self.templates if i.name.split('/')[-1].startswith('_')]
+
+    def test_anonymous_fragments_cached(self):
+        for url, fragment in (
+            ('/opportunities', 'beacon/_browse_listing.html'),
+            ('/opportunities/expired', 'beacon/front/_expired_listing.html'),
+            ('/opportunities/{}'.format(self.opportunity4.id), 'beacon/front/_detail_title.html')
+        ):
+            first = self.client.get(url)
+            self.assertTrue(fragment in self.fragments_rendered())
+            second = self.client.get(url)
+            self.assertEquals(self.fragments_rendered(), [])
+            self.assertEquals(first.data, second.data)
+
+    def test_expired_cursors_cached_by_page(self):
+        # junk cursors aren't cached, so they can't fill up the cache
+        for url in ('/opportunities/expired?after=junk', '/opportunities/expired?before=%5B1%5D'):
+            for i in range(2):
+                self.client.get(url)
+                self.assertEquals(
+                    self.fragments_rendered(), ['beacon/front/_expired_listing.html']
+                )
+
+        # a cursor that decodes to the same page shares its cache entry
+        cursor = base64.urlsafe_b64encode(json.dumps(['2015-01-01', 1]))
+        self.client.get('/opportunities/expired?after=' + cursor)
+        self.assertEquals(self.fragments_rendered(), ['beacon/front/_expired_listing.html'])
+        respelled = base64.urlsafe_b64encode(json.dumps(['2015-01-01T00:00:00', '1']))
+        self.client.get('/opportunities/expired?before=' + cursor + '&after=' + respelled)
+        self.assertEquals(self.fragments_rendered(), [])
+
+    def test_visitors_with_email_not_cached(self):
+        self.client.get('/opportunities')
+        with self.client.session_transaction() as session:
+            session['email'] = self.vendor.email
+        self.client.get('/opportunities')
+        self.assertEquals(self.fragments_rendered(), ['beacon/_browse_listing.html'])
+
+    def test_invalidated(self):
+        url = '/opportunities/{}'.format(self.opportunity4.id)
+        category = list(self.opportunity4.categories)[0]
+        old_name = category.category_friendly_name
+
+        self.assertTrue(old_name in self.client.get(url).data)
+        # changes to categories don't change the opportunity's version
+        category.category_friendly_name = 'Renamed category'
+        db.session.commit()
+        self.assertTrue(old_name in self.client.get(url).data)
+
+        opportunity_pages.invalidate()
+        self.assertTrue('Renamed category' in self.client.get(url).data)
+
+    @patch('beacon.blueprints.beacon_admin.opportunity_pages')
+    def test_admin_changes_invalidate(self, pages):
+        question = QuestionFactory.create(
+            opportunity=self.opportunity4, question_text='Why?', answer_text='Because'
+        )
+        self.login_user(self.admin)
+
+        self.client.post('/beacon/admin/opportunities/{}/questions/{}'.format(
+            self.opportunity4.id, question.id
+        ), data={'answer_text': 'Because!'})
+        self.assertEquals(pages.invalidate.call_count, 1)
+
+        self.client.get('/beacon/admin/opportunities/{}/archive'.format(self.opportunity1.id))
+        self.assertEquals(pages.invalidate.call_count, 2)
@@ -7,9 +7,40 @@ from beacon.importer.nigp import main
 from beacon.models.vendors import Category
 
 class TestNigpImport(BaseTestCase):
+    def setUp(self):
+        super(TestNigpImport, self).setUp()
+        self.file_target = current_app.config.get('PROJECT_ROOT') + '/test/mock/nigp.csv'
+
+    def snapshot(self):
+        return sorted([
+            (i.nigp_codes, i.category, i.subcategory, i.category_friendly_name,
+                i.examples, i.examples_tsv)
+            for i in Category.query.all()
+        ])
+
     def test_nigp_import(self):
-        main(current_app.config.get('PROJECT_ROOT') + '/test/mock/nigp.csv')
+        self.assertEquals(main(self.file_target), 5)
 
         categories = Category.query.all()
 
         self.assertEquals(len(categories), 5)
+        public_works = Category.query.filter(
+            Category.category_friendly_name == 'Public works related services'
+        ).first()
+        self.assertEquals(public_works.nigp_codes, [96800, 96100, 96200, 91800])
+        self.assertEquals(public_works.category, 'Technology supplies and services')
+        self.assertTrue(public_works.created_at is not None)
+
+    def test_nigp_reimport(self):
+        main(self.file_target)
+        self.assertEquals(main(self.file_target), 0)
+        self.assertEquals(main(self.file_target, bulk=False), 0)
+        self.assertEquals(Category.query.count(), 5)
+
+    def test_bulk_matches_row_import(self):
+        self.assertEquals(main(self.file_target, bulk=False), 5)
+        row = self.snapshot()
+
+        Category.query.delete()
+        main(self.file_target)
+        self.assertEquals(self.snapshot(), row)
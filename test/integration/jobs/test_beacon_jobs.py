@@ -9,7 +9,10 @@ from beacon.extensions import mail
 from beacon.models.public import AppStatus
 from beacon.models.opportunities.base import Opportunity
 from beacon.jobs.beacon_nightly import BeaconNewOppotunityOpenJob, BeaconBiweeklyDigestJob
-from beacon.jobs.job_base import JobStatus
+from beacon.jobs.job_base import JobStatus, JobCheckpoint
+from beacon.jobs.worker import Worker, schedule
+from beacon.models.vendors import Vendor
+from beacon.notifications import Notification
 
 from test.test_base import BaseTestCase
 from test.factories import OpportunityFactory, VendorFactory, CategoryFactory, UserFactory
@@ -64,6 +67,185 @@ class TestBeaconJobs(BaseTestCase):
             )
             self.assertTrue(Opportunity.query.get(opportunity_id).publish_notification_sent)
 
+        self.assertEquals(scheduled.status, 'success')
+        self.assertEquals(scheduled.notification_count, 1)
+        self.assertEquals(scheduled.recipient_count, 2)
+        self.assertTrue(scheduled.duration >= scheduled.build_seconds + scheduled.send_seconds - 0.01)
+
+    def test_beacon_new_opportunity_marked_once_sent(self):
+        opportunity_id = self.opportunity.id
+        nightly = BeaconNewOppotunityOpenJob(time_override=True)
+        scheduled, existing_job = nightly.schedule_job()
+
+        with patch('beacon.notifications.Notification.send', side_effect=Exception('Down')):
+            nightly.run_job(scheduled)
+
+        self.assertEquals((scheduled.status, scheduled.info), ('failed', 'Down'))
+        self.assertFalse(Opportunity.query.get(opportunity_id).publish_notification_sent)
+        self.assertEquals(nightly.get_opportunities(), [Opportunity.query.get(opportunity_id)])
+
+    def test_beacon_new_opportunity_resumes(self):
+        self.app.config['MAIL_CHUNK_SIZE'] = 1
+        opportunity_id = self.opportunity.id
+        emails = list(self.opportunity.get_subscriber_emails())
+        self.assertEquals(emails, sorted(emails))
+
+        nightly = BeaconNewOppotunityOpenJob(time_override=True)
+        scheduled, existing_job = nightly.schedule_job()
+
+        with patch('beacon.notifications.Notification.send', side_effect=[True, Exception('Down')]):
+            nightly.run_job(scheduled)
+
+        checkpoints = JobCheckpoint.for_job(scheduled, 'opportunity-{}'.format(opportunity_id)).all()
+        self.assertEquals(
+            [(i.chunk, i.status, i.last_recipient) for i in checkpoints],
+            [(0, 'sent', emails[0]), (1, 'pending', emails[1])]
+        )
+        self.assertFalse(Opportunity.query.get(opportunity_id).publish_notification_sent)
+
+        with mail.record_messages() as outbox:
+            nightly.run_job(scheduled)
+            self.assertEquals([i.recipients for i in outbox], [[emails[1]]])
+
+        self.assertEquals(scheduled.status, 'success')
+        self.assertEquals(
+            [i.status for i in JobCheckpoint.for_job(scheduled, 'opportunity-{}'.format(opportunity_id))],
+            ['sent', 'sent']
+        )
+        self.assertTrue(Opportunity.query.get(opportunity_id).publish_notification_sent)
+
+    def test_worker_resumes_failed_job(self):
+        self.app.config['MAIL_CHUNK_SIZE'] = 1
+        emails = sorted(self.opportunity.get_subscriber_emails())
+        worker = Worker(name='a', jobs=[BeaconNewOppotunityOpenJob], ignore_time=True)
+        schedule(ignore_time=True, jobs=[BeaconNewOppotunityOpenJob])
+
+        with patch('beacon.notifications.Notification.send', side_effect=[True, Exception('Down')]):
+            worker.run(worker.claim())
+        self.assertEquals(JobStatus.query.first().status, 'failed')
+
+        later = datetime.datetime.utcnow() + datetime.timedelta(
+            seconds=self.app.config['JOB_RETRY_DELAY'] + 1
+        )
+        with mail.record_messages() as outbox:
+            worker.run(worker.claim(now=later))
+            self.assertEquals([i.recipients for i in outbox], [[emails[1]]])
+
+        job = JobStatus.query.first()
+        self.assertEquals((job.status, job.attempts), ('success', 2))
+
+    def test_beacon_biweekly_resumes(self):
+        self.app.config['MAIL_CHUNK_SIZE'] = 2
+        for i in range(3):
+            VendorFactory.create(subscribed_to_newsletter=True)
+        AppStatus.create()
+        emails = list(Vendor.newsletter_subscriber_emails())
+
+        biweekly = BeaconBiweeklyDigestJob(time_override=True)
+        scheduled, existing_job = biweekly.schedule_job()
+        JobCheckpoint.create(
+            job_name=scheduled.name, job_date=scheduled.date, item='digest', chunk=0,
+            status='sent', last_recipient=emails[1], recipient_count=2
+        )
+
+        with mail.record_messages() as outbox:
+            biweekly.run_job(scheduled)
+            self.assertEquals([i.recipients for i in outbox], [[emails[2]]])
+
+        self.assertEquals(len(JobCheckpoint.for_job(scheduled, 'digest').all()), 2)
+
+    def test_beacon_biweekly_resumes_within_chunk(self):
+        water, parks = [CategoryFactory.create(category_friendly_name=i) for i in ('Water', 'Parks')]
+        vendors = [
+            VendorFactory.create(subscribed_to_newsletter=True, categories=set(i))
+            for i in ([water], [parks], [])
+        ]
+        AppStatus.create()
+
+        biweekly = BeaconBiweeklyDigestJob(time_override=True)
+        scheduled, existing_job = biweekly.schedule_job()
+
+        send, calls = Notification.send, []
+        def fail_second(notification, *args, **kwargs):
+            calls.append(notification)
+            if len(calls) == 2:
+                raise Exception('boom')
+            return send(notification, *args, **kwargs)
+
+        with mail.record_messages() as outbox:
+            with patch.object(Notification, 'send', autospec=True, side_effect=fail_second):
+                biweekly.run_job(scheduled)
+            self.assertEquals(scheduled.status, 'failed')
+            self.assertEquals(len(outbox), len(calls[0].to_email))
+
+            biweekly.run_job(scheduled)
+            self.assertEquals(scheduled.status, 'success')
+
+            # every subscriber got exactly one digest
+            self.assertEquals(
+                sorted(i.recipients[0] for i in outbox), sorted(i.email for i in vendors)
+            )
+
+    def test_beacon_biweekly_personalized(self):
+        today = datetime.datetime.today()
+        water, roads, parks = [
+            CategoryFactory.create(category_friendly_name=i) for i in ('Water', 'Roads', 'Parks')
+        ]
+        for title, categories in (('Pipes', [water]), ('Paving', [roads]), ('Bridges', [water, roads])):
+            OpportunityFactory.create(
+                title=title, is_public=True, planned_publish=self.yesterday,
+                planned_submission_start=today, planned_submission_end=today + datetime.timedelta(days=1),
+                publish_notification_sent=True, categories=set(categories),
+                created_by=self.admin, published_at=self.yesterday
+            )
+
+        water_vendor = VendorFactory.create(subscribed_to_newsletter=True, categories=set([water]))
+        both_vendor = VendorFactory.create(subscribed_to_newsletter=True, categories=set([water, roads]))
+        parks_vendor = VendorFactory.create(subscribed_to_newsletter=True, categories=set([parks]))
+        everything_vendor = VendorFactory.create(subscribed_to_newsletter=True)
+        AppStatus.create()
+
+        biweekly = BeaconBiweeklyDigestJob(time_override=True)
+        scheduled, existing_job = biweekly.schedule_job()
+
+        with patch.object(biweekly, 'render_section', wraps=biweekly.render_section) as render_section:
+            with mail.record_messages() as outbox:
+                biweekly.run_job(scheduled)
+
+        self.assertEquals(scheduled.status, 'success')
+        self.assertEquals(scheduled.notification_count, 4)
+        self.assertEquals(render_section.call_count, 3)
+
+        digests = dict([(i.recipients[0], i.html) for i in outbox])
+        self.assertEquals(len(digests), 4)
+
+        self.assertTrue('Pipes' in digests[water_vendor.email])
+        self.assertTrue('Bridges' in digests[water_vendor.email])
+        self.assertFalse('Paving' in digests[water_vendor.email])
+
+        self.assertTrue('Pipes' in digests[both_vendor.email])
+        self.assertTrue('Paving' in digests[both_vendor.email])
+        self.assertTrue(
+            digests[both_vendor.email].index('Roads') < digests[both_vendor.email].index('Water')
+        )
+
+        self.assertFalse('Pipes' in digests[parks_vendor.email])
+        self.assertTrue('categories you follow' in digests[parks_vendor.email])
+
+        for title in ('Pipes', 'Paving', 'Bridges', self.opportunity.title):
+            self.assertTrue(title in digests[everything_vendor.email])
+
+    def test_subscriber_emails(self):
+        both = VendorFactory.create(
+            opportunities=set([self.opportunity]), categories=set([self.category])
+        )
+        VendorFactory.create()
+
+        emails = list(self.opportunity.get_subscriber_emails())
+        self.assertEquals(len(emails), 3)
+        self.assertEquals(len(set(emails)), 3)
+        self.assertTrue(both.email in emails)
+
     def test_correct_nightly_opportunities_queried(self):
         nightly = BeaconNewOppotunityOpenJob(time_override=True)
         opportunities = nightly.get_opportunities()
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+import time
+import datetime
+import threading
+
+from beacon.database import db
+from beacon.jobs.job_base import JobBase, JobStatus
+from beacon.jobs.worker import Worker, schedule
+
+from test.test_base import BaseTestCase
+
+class SleepyJob(JobBase):
+    runs = []
+
+    @property
+    def start_time(self):
+        return None
+
+    def run_job(self, job):
+        self.runs.append((job.name, threading.current_thread().name))
+        time.sleep(0.4)
+        job.update(status='success')
+
+class OtherSleepyJob(SleepyJob):
+    pass
+
+class BrokenJob(SleepyJob):
+    def run_job(self, job):
+        raise Exception('Boom')
+
+class TestWorker(BaseTestCase):
+    def setUp(self):
+        super(TestWorker, self).setUp()
+        SleepyJob.runs = []
+        self.jobs = [SleepyJob, OtherSleepyJob, BrokenJob]
+
+    def worker(self, name, **kwargs):
+        return Worker(name=name, jobs=self.jobs, **kwargs)
+
+    def job(self, name):
+        db.session.expire_all()
+        return JobStatus.query.filter(JobStatus.name == name).first()
+
+    def test_schedule_once(self):
+        schedule(jobs=self.jobs)
+        schedule(jobs=self.jobs)
+        self.assertEquals(JobStatus.query.count(), 3)
+        self.assertEquals(set([i.status for i in JobStatus.query]), set(['new']))
+
+    def test_claim_once(self):
+        schedule(jobs=[SleepyJob])
+        job = self.worker('a').claim()
+        self.assertEquals((job.name, job.status, job.locked_by), ('SleepyJob', 'started', 'a'))
+        self.assertEquals(job.attempts, 1)
+        self.assertEquals(self.worker('b').claim(), None)
+
+    def test_claim_skips_locked(self):
+        schedule(jobs=[SleepyJob, OtherSleepyJob])
+        db.session.commit()
+
+        connection = db.engine.connect()
+        transaction = connection.begin()
+        connection.execute("SELECT * FROM job_status WHERE name = 'SleepyJob' FOR UPDATE")
+        try:
+            self.assertEquals(self.worker('a').claim().name, 'OtherSleepyJob')
+            self.assertEquals(self.worker('a').claim(), None)
+        finally:
+            transaction.rollback()
+            connection.close()
+
+    def test_expired_lease_reclaimed(self):
+        schedule(jobs=[SleepyJob])
+        self.worker('a', lease=60).claim()
+
+        later = datetime.datetime.utcnow() + datetime.timedelta(seconds=61)
+        job = self.worker('b').claim(now=later)
+        self.assertEquals((job.locked_by, job.attempts), ('b', 2))
+
+    def test_missing_lease_reclaimed(self):
+        schedule(jobs=[SleepyJob, OtherSleepyJob])
+        JobStatus.query.filter(JobStatus.name == 'SleepyJob').one().update(status='started')
+        JobStatus.query.filter(JobStatus.name == 'OtherSleepyJob').one().update(
+            status='started', attempts=3
+        )
+
+        job = self.worker('a').claim()
+        self.assertEquals((job.name, job.locked_by, job.attempts), ('SleepyJob', 'a', 1))
+        self.assertEquals(self.job('OtherSleepyJob').status, 'failed')
+
+    def test_failed_job_retried(self):
+        self.app.config['JOB_MAX_ATTEMPTS'] = 2
+        schedule(jobs=[BrokenJob])
+        worker = self.worker('a')
+        worker.run(worker.claim())
+        self.assertEquals(self.job('BrokenJob').status, 'failed')
+        self.assertEquals(worker.claim(), None)
+
+        later = datetime.datetime.utcnow() + datetime.timedelta(
+            seconds=self.app.config['JOB_RETRY_DELAY'] + 1
+        )
+        job = worker.claim(now=later)
+        self.assertEquals((job.name, job.status, job.attempts), ('BrokenJob', 'started', 2))
+        worker.run(job)
+        self.assertEquals(worker.claim(now=later + datetime.timedelta(days=1)), None)
+
+    def test_gives_up(self):
+        self.app.config['JOB_MAX_ATTEMPTS'] = 2
+        schedule(jobs=[SleepyJob])
+        now = datetime.datetime.utcnow()
+        for i in range(2):
+            now += datetime.timedelta(seconds=61)
+            self.assertTrue(self.worker('a', lease=60).claim(now=now))
+
+        now += datetime.timedelta(seconds=61)
+        self.assertEquals(self.worker('b').claim(now=now), None)
+        self.assertEquals(self.job('SleepyJob').status, 'failed')
+        self.assertEquals(self.job('SleepyJob').info, 'Gave up after 2 attempts')
+
+    def test_lease_renewed(self):
+        schedule(jobs=[SleepyJob])
+        worker = self.worker('a', lease=0.15)
+
+        def run():
+            with self.app.app_context():
+                worker.run(worker.claim())
+                db.session.remove()
+        thread = threading.Thread(target=run)
+        thread.start()
+
+        # the job outlives its first lease, but it is still held
+        time.sleep(0.3)
+        self.assertEquals(self.worker('b').claim(), None)
+        thread.join()
+
+        self.assertEquals(self.job('SleepyJob').status, 'success')
+        self.assertEquals(self.job('SleepyJob').locked_until, None)
+        self.assertEquals(self.worker('b').claim(), None)
+
+    def test_work_concurrently(self):
+        schedule(jobs=self.jobs)
+        started = time.time()
+        ran = self.worker('a', concurrency=3).work()
+        self.assertTrue(time.time() - started < 0.8)
+
+        self.assertEquals(sorted(ran), ['BrokenJob', 'OtherSleepyJob', 'SleepyJob'])
+        self.assertEquals(len(set([i[1] for i in SleepyJob.runs])), 2)
+        self.assertEquals(self.job('SleepyJob').status, 'success')
+        self.assertEquals(self.job('BrokenJob').status, 'failed')
+        self.assertEquals(self.job('BrokenJob').info, 'Boom')
+        self.assertEquals(self.worker('b').work(), [])
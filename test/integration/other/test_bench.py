@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+
+from bench import data, runner
+from bench.scenarios import SCENARIOS
+from beacon.models.vendors import Vendor
+from beacon.models.opportunities.base import Opportunity
+from test.test_base import BaseTestCase
+
+class TestBench(BaseTestCase):
+    def test_generate_and_run(self):
+        context_args = data.generate(
+            vendors=10, categories=5, opportunities=20, subscriptions=2
+        )
+        self.assertEquals(Vendor.query.count(), 10)
+        self.assertEquals(Opportunity.query.count(), 20)
+        self.assertTrue(Opportunity.query.get(context_args['opportunity_id']).is_submission_start)
+
+        results = runner.run(context_args, iterations=1, warmup=0, isolate=False)
+        self.assertEquals([i['name'] for i in results], SCENARIOS.keys())
+        for result in results:
+            self.assertTrue(result['queries'] > 0)
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+import smtpd
+import datetime
+import asyncore
+import threading
+
+from mock import patch
+
+from beacon.database import db
+from beacon.extensions import mail
+from beacon.models.public import AppStatus
+from beacon.notifications import Notification
+from beacon.models.outbox import OutboxMessage, OutboxRecipient
+from beacon.tasks import send_email
+from test.test_base import BaseTestCase
+
+class TestOutbox(BaseTestCase):
+    def setUp(self):
+        super(TestOutbox, self).setUp()
+        self.app.config['MAIL_CHUNK_SIZE'] = 2
+        self.emails = ['a@foo.com', 'b@foo.com', 'c@foo.com']
+
+    def test_send_multi_in_chunks(self):
+        with mail.record_messages() as outbox:
+            Notification(to_email=self.emails, subject='chunked', convert_args=True).send(multi=True)
+            self.assertEquals(len(outbox), 0)
+            db.session.commit()
+
+            self.assertEquals(len(outbox), 3)
+            self.assertEquals(
+                sorted(i.recipients[0] for i in outbox), self.emails
+            )
+            self.assertEquals(outbox[0].subject, '[Beacon] chunked')
+
+        message = OutboxMessage.query.first()
+        self.assertEquals(message.chunks(2), [(0, 2), (2, 3)])
+        self.assertEquals(
+            OutboxRecipient.query.filter(OutboxRecipient.sent_at == None).count(), 0
+        )
+
+    def test_send_single(self):
+        with mail.record_messages() as outbox:
+            Notification(to_email=self.emails, convert_args=True).send()
+            db.session.commit()
+
+            self.assertEquals(len(outbox), 1)
+            self.assertEquals(len(outbox[0].recipients), 3)
+
+    def test_sent_recipients_skipped(self):
+        message = Notification(to_email=self.emails, convert_args=True).queue(multi=True)
+        already_sent = message.recipients.filter(OutboxRecipient.position == 0).one()
+        already_sent.mark_sent()
+        db.session.commit()
+
+        with mail.record_messages() as outbox:
+            send_email.delay(message.id, 0, 3)
+            self.assertEquals(len(outbox), 2)
+            self.assertTrue(already_sent.email not in [i.recipients[0] for i in outbox])
+
+    def test_bad_recipient_marked_failed(self):
+        emails = ['a@foo.com', 'b\n@foo.com', 'c@foo.com']
+        with mail.record_messages() as outbox:
+            Notification(to_email=emails, convert_args=True).send(multi=True)
+            db.session.commit()
+
+            self.assertEquals(
+                sorted(i.recipients[0] for i in outbox), ['a@foo.com', 'c@foo.com']
+            )
+
+        failed = OutboxRecipient.query.filter(OutboxRecipient.failed_at != None).one()
+        self.assertEquals(failed.email, 'b\n@foo.com')
+        self.assertTrue('BadHeaderError' in failed.error)
+        self.assertEquals(failed.sent_at, None)
+        self.assertEquals(
+            OutboxRecipient.query.filter(OutboxRecipient.sent_at != None).count(), 2
+        )
+
+    def test_queue_streams_recipients(self):
+        emails = (i for i in self.emails)
+        message = OutboxMessage.queue(emails, batch_size=2, multi=True)
+        self.assertEquals(message.recipient_count, 3)
+        self.assertEquals([(i.position, i.email) for i in message.recipients], list(enumerate(self.emails)))
+
+    def test_send_leaves_session_uncommitted(self):
+        AppStatus.create(status='ok')
+        status = AppStatus.query.first()
+        status.message = 'half done'
+
+        with mail.record_messages() as outbox:
+            Notification(to_email=self.emails, convert_args=True).send(multi=True)
+            db.session.rollback()
+            db.session.commit()
+
+            self.assertEquals(len(outbox), 0)
+            self.assertEquals(AppStatus.query.first().message, None)
+            self.assertEquals(OutboxMessage.query.count(), 0)
+
+    def test_send_after_commit(self):
+        AppStatus.create(status='ok')
+        status = AppStatus.query.first()
+
+        with mail.record_messages() as outbox:
+            Notification(to_email=self.emails, convert_args=True).send(multi=True)
+            status.message = 'done'
+            self.assertEquals(len(outbox), 0)
+
+            db.session.commit()
+            self.assertEquals(len(outbox), 3)
+            self.assertEquals(AppStatus.query.first().message, 'done')
+
+    def test_purge(self):
+        old = datetime.datetime.utcnow() - datetime.timedelta(days=31)
+        sent, unsent, recent = [
+            Notification(to_email=self.emails, convert_args=True).queue(multi=True)
+            for i in range(3)
+        ]
+        for message in (sent, unsent, recent):
+            message.created_at = old
+            for recipient in message.recipients:
+                recipient.sent_at = old
+        sent.recipients.first().sent_at = None
+        sent.recipients.first().failed_at = old
+        unsent.recipients.first().sent_at = None
+        recent.recipients.first().sent_at = datetime.datetime.utcnow()
+        db.session.commit()
+        ids = [i.id for i in (sent, unsent, recent)]
+
+        self.assertEquals(OutboxMessage.purge(30), 1)
+        self.assertEquals(
+            sorted(i.id for i in OutboxMessage.query), sorted(ids[1:])
+        )
+        self.assertEquals(
+            OutboxRecipient.query.filter(OutboxRecipient.outbox_message_id == ids[0]).count(), 0
+        )
+
+class LocalSMTPServer(smtpd.SMTPServer):
+    '''SMTP server on a random local port that records what it receives
+    '''
+    def __init__(self):
+        smtpd.SMTPServer.__init__(self, ('127.0.0.1', 0), None)
+        self.port = self.socket.getsockname()[1]
+        self.connections = 0
+        self.received = []
+
+    def handle_accept(self):
+        self.connections += 1
+        smtpd.SMTPServer.handle_accept(self)
+
+    def process_message(self, peer, mailfrom, rcpttos, data):
+        if 'refused@foo.com' in rcpttos:
+            return '550 Mailbox unavailable'
+        self.received.extend(rcpttos)
+
+class TestOutboxSMTP(BaseTestCase):
+    def setUp(self):
+        super(TestOutboxSMTP, self).setUp()
+        self.server = LocalSMTPServer()
+        self.thread = threading.Thread(target=asyncore.loop, kwargs={'timeout': 0.05})
+        self.thread.start()
+
+        self.app.config['MAIL_CHUNK_SIZE'] = 3
+        self.app.config['MAIL_SEND_CONCURRENCY'] = 2
+        self.mail_state = patch.multiple(
+            self.app.extensions['mail'], server='127.0.0.1', port=self.server.port,
+            use_tls=False, use_ssl=False, username=None, suppress=False,
+            max_emails=2, debug=False
+        )
+        self.mail_state.start()
+
+    def tearDown(self):
+        self.mail_state.stop()
+        asyncore.close_all()
+        self.thread.join(1)
+        super(TestOutboxSMTP, self).tearDown()
+
+    def test_send_multi_over_smtp(self):
+        emails = ['{}@foo.com'.format(i) for i in 'abcde']
+        Notification(to_email=emails, convert_args=True).send(multi=True)
+        db.session.commit()
+
+        self.assertEquals(sorted(self.server.received), emails)
+        # two chunks, each connecting once and reconnecting after two emails
+        self.assertEquals(self.server.connections, 4)
+        self.assertEquals(
+            OutboxRecipient.query.filter(OutboxRecipient.sent_at == None).count(), 0
+        )
+
+    def test_refused_recipient_skipped(self):
+        emails = ['a@foo.com', 'refused@foo.com', 'c@foo.com', 'd@foo.com']
+        Notification(to_email=emails, convert_args=True).send(multi=True)
+        db.session.commit()
+
+        self.assertEquals(sorted(self.server.received), ['a@foo.com', 'c@foo.com', 'd@foo.com'])
+        failed = OutboxRecipient.query.filter(OutboxRecipient.failed_at != None).one()
+        self.assertEquals(failed.email, 'refused@foo.com')
+        self.assertTrue('SMTPDataError' in failed.error)
+        self.assertEquals(
+            OutboxRecipient.query.filter(
+                OutboxRecipient.sent_at == None, OutboxRecipient.failed_at == None
+            ).count(), 0
+        )
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+
+import json
+import time
+import threading
+import SocketServer
+import BaseHTTPServer
+
+from flask import abort
+
+from beacon import health
+from beacon.database import db
+from beacon.models.public import AppStatus
+from test.test_base import BaseTestCase
+
+class LocalSendgrid(BaseHTTPServer.HTTPServer):
+    '''Stand-in for Sendgrid's stats API on a random local port
+    '''
+    def __init__(self, delay=0):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), SendgridHandler)
+        self.url = 'http://127.0.0.1:{}/api/stats.get.json'.format(self.server_port)
+        self.delay = delay
+        self.requests = 0
+
+    def handle_error(self, request, client_address):
+        # probes that time out hang up before the response is written
+        pass
+
+class SendgridHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests += 1
+        time.sleep(self.server.delay)
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(json.dumps([
+            {'delivered': 100, 'repeat_bounces': 20},
+            {'delivered': 0, 'repeat_bounces': 0}
+        ]))
+
+    def log_message(self, *args):
+        pass
+
+class LocalRedis(SocketServer.ThreadingTCPServer):
+    '''Stand-in for Redis that answers every command with ``PONG``
+    '''
+    daemon_threads = True
+
+    def __init__(self, delay=0):
+        SocketServer.ThreadingTCPServer.__init__(self, ('127.0.0.1', 0), RedisHandler)
+        self.url = 'redis://127.0.0.1:{}/0'.format(self.server_address[1])
+        self.delay = delay
+
+class RedisHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        while self.rfile.readline():
+            # skip the rest of the command
+            if self.rfile.readline().startswith('$'):
+                self.rfile.readline()
+                time.sleep(self.server.delay)
+                self.wfile.write('+PONG\r\n')
+                self.wfile.flush()
+
+class TestStatus(BaseTestCase):
+    def setUp(self):
+        super(TestStatus, self).setUp()
+        AppStatus.create(status='ok')
+        health.clear()
+        self.servers = []
+        self.use(sendgrid=LocalSendgrid(), redis=LocalRedis())
+        self.app.config['STATUS_PROBE_TIMEOUT'] = 2
+        self.app.config['SENDGRID_MONTHLY_LIMIT'] = 1200
+
+    def use(self, sendgrid=None, redis=None):
+        for server, key in ((sendgrid, 'SENDGRID_STATS_URL'), (redis, 'STATUS_REDIS_URL')):
+            if server:
+                threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}).start()
+                self.servers.append(server)
+                self.app.config[key] = server.url
+        self.sendgrid = sendgrid or self.sendgrid
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        health.clear()
+        super(TestStatus, self).tearDown()
+
+    def test_status_ok(self):
+        response = self.client.get('/app/_status')
+        self.assert200(response)
+        self.assertEquals(response.json['status'], 'ok')
+        self.assertEquals(response.json['resources'], {'Sendgrid': '10.0% used'})
+
+    def test_probes_cached(self):
+        self.client.get('/app/_status')
+        self.client.get('/app/_status')
+        self.assertEquals(self.sendgrid.requests, 1)
+
+        with self.app.app_context():
+            health.check(now=time.time() + self.app.config['STATUS_PROBE_TTL'] + 1)
+        self.assertEquals(self.sendgrid.requests, 2)
+
+    def test_probes_concurrent(self):
+        self.use(sendgrid=LocalSendgrid(delay=0.5), redis=LocalRedis(delay=0.5))
+        started = time.time()
+        self.assertEquals(self.client.get('/app/_status').json['status'], 'ok')
+        self.assertTrue(time.time() - started < 1)
+
+    def test_probe_timeout(self):
+        self.use(sendgrid=LocalSendgrid(delay=1))
+        self.app.config['STATUS_PROBE_TIMEOUT'] = 0.2
+
+        started = time.time()
+        response = self.client.get('/app/_status')
+        self.assertTrue(time.time() - started < 1)
+        # the probe's own socket timeout can go off just before we stop waiting
+        self.assertTrue(response.json['status'] in (
+            'Sendgrid timed out after 0.2 seconds', 'Sendgrid is unavailable: timed out'
+        ))
+
+    def test_problems_most_serious_first(self):
+        status = AppStatus.query.first()
+        status.status, status.message = 'error', 'Scraper failed'
+        db.session.commit()
+        self.app.config['STATUS_REDIS_URL'] = 'redis://127.0.0.1:1/0'
+
+        status = self.client.get('/app/_status').json['status'].split(' || ')
+        self.assertEquals(status[0], 'error: Scraper failed')
+        self.assertTrue(status[1].startswith('Redis is unavailable'))
+        self.assertEquals(len(status), 2)
+
+    def test_liveness(self):
+        self.app.config['STATUS_REDIS_URL'] = 'redis://127.0.0.1:1/0'
+        response = self.client.get('/app/_status/live')
+        self.assert200(response)
+        self.assertEquals(response.json['status'], 'ok')
+        self.assertEquals(self.sendgrid.requests, 0)
+
+class TestErrorAggregator(BaseTestCase):
+    def setUp(self):
+        super(TestErrorAggregator, self).setUp()
+        AppStatus.create(status='ok')
+        health.errors.clear()
+        self.app.add_url_rule('/broken', 'broken', self.broken)
+
+    def tearDown(self):
+        health.errors.clear()
+        super(TestErrorAggregator, self).tearDown()
+
+    def broken(self):
+        abort(500)
+
+    def status(self):
+        db.session.expire_all()
+        return AppStatus.query.first()
+
+    def test_first_error_written(self):
+        with self.app.test_request_context():
+            self.assertTrue(health.errors.record('Boom', now=1000))
+
+        status = self.status()
+        self.assertEquals((status.status, status.message), ('error', 'Boom'))
+        self.assertEquals(status.error_count, 1)
+
+    def test_burst_coalesced(self):
+        interval = self.app.config['ERROR_FLUSH_INTERVAL']
+        with self.app.test_request_context():
+            health.errors.record('first', now=1000)
+            for i in range(10):
+                health.errors.record('error {}'.format(i), now=1001 + i)
+            self.assertEquals(self.status().error_count, 1)
+            self.assertEquals(health.errors.count, 10)
+
+            health.errors.record('last', now=1000 + interval)
+
+        status = self.status()
+        self.assertEquals((status.message, status.error_count), ('last', 12))
+        self.assertEquals(health.errors.count, 0)
+
+    def test_status_flushes_pending(self):
+        with self.app.test_request_context():
+            health.errors.record('first', now=time.time())
+            health.errors.record('second', now=time.time())
+
+        health.clear()
+        self.app.config['STATUS_REDIS_URL'] = 'redis://127.0.0.1:1/0'
+        self.app.config['SENDGRID_STATS_URL'] = 'http://127.0.0.1:1/'
+        status = self.client.get('/app/_status').json['status'].split(' || ')
+        health.clear()
+        self.assertEquals(status[0], 'error: second (2 errors)')
+
+    def test_requests_flush_pending(self):
+        interval = self.app.config['ERROR_FLUSH_INTERVAL']
+        with self.app.app_context():
+            health.errors.record('first', now=time.time() - interval)
+            health.errors.record('second', now=time.time() - interval)
+        self.assertEquals(health.errors.count, 1)
+
+        self.app.add_url_rule('/fine', 'fine', lambda: 'ok')
+        self.client.get('/fine')
+
+        status = self.status()
+        self.assertEquals((status.message, status.error_count), ('second', 2))
+        self.assertEquals(health.errors.count, 0)
+
+    def test_server_errors_recorded(self):
+        self.client.get('/broken')
+        self.client.get('/broken')
+
+        status = self.status()
+        self.assertEquals(status.error_count, 1)
+        self.assertEquals(health.errors.count, 1)
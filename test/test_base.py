@@ -2,6 +2,7 @@
 
 import os
 
+from flask import request_started
 from flask.ext.testing import TestCase as FlaskTestCase
 
 from beacon.app import create_app as _create_app, db
@@ -17,6 +18,24 @@ class BaseTestCase(FlaskTestCase):
         os.environ['CONFIG'] = 'beacon.settings.TestConfig'
         return _create_app()
 
+    def _pre_setup(self):
+        super(BaseTestCase, self)._pre_setup()
+        request_started.connect(self._reset_templates, self.app)
+
+    def _post_teardown(self):
+        request_started.disconnect(self._reset_templates, self.app)
+        super(BaseTestCase, self)._post_teardown()
+
+    def _reset_templates(self, app):
+        self.templates = []
+
+    def _add_template(self, app, template, context):
+        '''
+        Keep every template rendered by the last request, so that the
+        context of fragments that views render on their own can be checked
+        '''
+        self.templates.append((template, context))
+
     def setUp(self):
         db.create_all()
         self.app.config['CELERY_ALWAYS_EAGER'] = True
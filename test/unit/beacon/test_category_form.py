@@ -7,7 +7,9 @@ from flask_testing import TestCase
 
 from beacon.app import create_app as _create_app
 
-from beacon.forms.opportunities import CategoryForm
+from mock import patch
+
+from beacon.forms.opportunities import CategoryForm, category_tree
 from test.factories import CategoryFactory
 
 class TestCategoryForm(TestCase):
@@ -45,5 +47,53 @@ class TestCategoryForm(TestCase):
             self.assertTrue('one' in categories)
             self.assertTrue('ten' in categories)
 
-            subcategories = json.loads(new_form.get_subcategories())
+            subcategories = new_form.get_subcategories()
             self.assertEquals(len(subcategories), 3)
+
+    @patch.object(category_tree, 'builder')
+    def test_display_cleanup_cached(self, build_category_tree):
+        build_category_tree.return_value = {
+            'choices': [('', '-- Choose One --'), ('one', 'one')],
+            'subcategories': {}, 'categories': '["one"]'
+        }
+        category_tree.invalidate()
+        with current_app.test_request_context():
+            for _ in range(2):
+                new_form = CategoryForm()
+                new_form.display_cleanup()
+                new_form.categories.choices.append(('two', 'two'))
+                self.assertEquals(json.loads(new_form.get_categories()), ['one'])
+
+        self.assertEquals(build_category_tree.call_count, 1)
+        self.assertEquals(len(category_tree.get()['choices']), 2)
+
+    @patch('beacon.forms.opportunities.Category.query')
+    def test_process_batches_subcategories(self, query):
+        query.filter.return_value.all.return_value = [self.category1, self.category2]
+        self.category1.id, self.category2.id = 1, 2
+
+        with current_app.test_request_context(method='POST', data={
+            'subcategories-1': 'on', 'subcategories-2': 'on',
+            'subcategories-3': 'on', 'subcategories-foo': 'on',
+            'subcategories-4': 'off'
+        }):
+            new_form = CategoryForm()
+            self.assertEquals(query.filter.call_count, 1)
+            self.assertEquals(new_form.categories.data, set([self.category1, self.category2]))
+            self.assertEquals(
+                new_form.errors['subcategories'],
+                ['3 is not a valid choice!', 'foo is not a valid choice!']
+            )
+
+    @patch('beacon.forms.opportunities.Category.query')
+    def test_process_rejects_odd_subcategory_ids(self, query):
+        with current_app.test_request_context(method='POST', data={
+            u'subcategories-\xb2': 'on', 'subcategories-99999999999': 'on'
+        }):
+            new_form = CategoryForm()
+            self.assertEquals(query.filter.call_count, 0)
+            self.assertEquals(new_form.categories.data, set())
+            self.assertEquals(
+                new_form.errors['subcategories'],
+                [u'99999999999 is not a valid choice!', u'\xb2 is not a valid choice!']
+            )
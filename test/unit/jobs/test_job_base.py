@@ -4,7 +4,7 @@ import datetime
 import pytz
 
 from unittest import TestCase
-from mock import patch, Mock, call
+from mock import patch, Mock, call, ANY
 
 from beacon.jobs.job_base import JobBase, EmailJobBase
 
@@ -71,9 +71,13 @@ class TestEmailJobBase(TestCase):
 
         notification_mock = Mock()
         notification_mock.send = Mock()
+        notification_mock.to_email = ['a@foo.com', 'b@foo.com']
+        notification_mock.cc_email = []
 
         notification_fail = Mock()
         notification_fail.send = Mock(side_effect=Exception('something went wrong!'))
+        notification_fail.to_email = ['c@foo.com']
+        notification_fail.cc_email = ['d@foo.com']
 
         self.success_notification = notification_mock
         self.failure_notification = notification_fail
@@ -86,7 +90,13 @@ class TestEmailJobBase(TestCase):
         send_mock.return_value = [self.success_notification, self.success_notification]
         FakeEmailJob.build_notifications = send_mock
 
-        expected_updates = [call.update(status='started'), call.update(status='success')]
+        expected_updates = [
+            call.update(status='started', started_at=ANY),
+            call.update(
+                status='success', finished_at=ANY, build_seconds=ANY, send_seconds=ANY,
+                notification_count=2, recipient_count=4
+            )
+        ]
 
         FakeEmailJob().run_job(self.job)
 
@@ -98,10 +108,31 @@ class TestEmailJobBase(TestCase):
         FakeEmailJob.build_notifications = send_mock
 
         expected_updates = [
-            call.update(status='started'),
-            call.update(status='failed', info='something went wrong!')
+            call.update(status='started', started_at=ANY),
+            call.update(status='failed', info='something went wrong!'),
+            call.update(
+                finished_at=ANY, build_seconds=ANY, send_seconds=ANY,
+                notification_count=2, recipient_count=4
+            )
         ]
 
         FakeEmailJob().run_job(self.job)
 
         self.assertEquals(self.job.mock_calls, expected_updates)
+
+    def test_built_one_at_a_time(self):
+        built = []
+        def build():
+            for notification in [self.failure_notification, self.success_notification]:
+                built.append(notification)
+                yield notification
+        FakeEmailJob.build_notifications = Mock(side_effect=build)
+
+        FakeEmailJob().run_job(self.job)
+
+        self.assertEquals(built, [self.failure_notification])
+        self.assertFalse(self.success_notification.send.called)
+        self.assertEquals(self.job.mock_calls[-1], call.update(
+            finished_at=ANY, build_seconds=ANY, send_seconds=ANY,
+            notification_count=1, recipient_count=2
+        ))
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import multiprocessing
+
+from unittest import TestCase
+
+from bench.runner import percentile, report, measure, _wait_for_result
+
+class TestBenchRunner(TestCase):
+    def test_percentile(self):
+        values = [5, 1, 4, 2, 3]
+        self.assertEquals(percentile(values, 50), 3)
+        self.assertEquals(percentile(values, 90), 5)
+        self.assertEquals(percentile(values, 0), 1)
+        self.assertEquals(percentile([], 50), None)
+
+    def test_report(self):
+        table = report([dict(
+            name='front.browse', iterations=2, p50=1.0, p90=2.0, p99=2.0,
+            max=2.0, queries=3.0, peak_memory=10
+        )])
+        header, row = table.split('\n')
+        self.assertTrue(header.startswith('scenario'))
+        self.assertTrue(row.startswith('front.browse'))
+        self.assertTrue('3.0' in row)
+
+    def test_report_missing_values(self):
+        table = report([dict(
+            name='front.browse', iterations=0, p50=None, p90=None, p99=None,
+            max=None, queries=None, peak_memory=0
+        )])
+        self.assertTrue('-' in table.split('\n')[1])
+
+    def test_measure_needs_iterations(self):
+        self.assertRaises(ValueError, measure, 'front.browse', None, iterations=0)
+
+    def wait(self, target, args, timeout=None):
+        results = multiprocessing.Queue()
+        child = multiprocessing.Process(target=target, args=args)
+        child.start()
+        result = _wait_for_result(child, results, timeout)
+        child.join()
+        return result
+
+    def test_dead_child(self):
+        self.assertEquals(self.wait(os._exit, (3, )), 'The process exited with code 3')
+
+    def test_child_timeout(self):
+        started = time.time()
+        self.assertEquals(self.wait(time.sleep, (30, ), timeout=1), 'Timed out after 1 seconds')
+        self.assertTrue(time.time() - started < 10)
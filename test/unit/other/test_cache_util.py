@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+from flask_testing import TestCase
+from mock import Mock
+
+from beacon.app import create_app as _create_app
+from beacon.extensions import cache
+from beacon.cache_util import VersionedCache
+
+class TestVersionedCache(TestCase):
+    def create_app(self):
+        os.environ['CONFIG'] = 'beacon.settings.TestConfig'
+        return _create_app()
+
+    def setUp(self):
+        cache.clear()
+        self.builder = Mock(side_effect=lambda: ['built', self.builder.call_count])
+        self.versioned = VersionedCache('test', self.builder)
+
+    def test_builds_once(self):
+        self.assertEquals(self.versioned.get(), ['built', 1])
+        self.assertEquals(self.versioned.get(), ['built', 1])
+        self.assertEquals(self.builder.call_count, 1)
+
+    def test_invalidate_rebuilds(self):
+        self.versioned.get()
+        self.versioned.invalidate()
+        self.assertEquals(self.versioned.get(), ['built', 2])
+
+    def test_shared_copy_used_by_other_processes(self):
+        self.versioned.get()
+        # a second process has its own in-memory copy but shares the backend
+        other_process = VersionedCache('test', self.builder)
+        self.assertEquals(other_process.get(), ['built', 1])
+        self.assertEquals(self.builder.call_count, 1)
+
+    def test_invalidation_seen_by_other_processes(self):
+        other_process = VersionedCache('test', self.builder)
+        other_process.get()
+        self.versioned.invalidate()
+        self.assertEquals(other_process.get(), ['built', 2])
+
+    def test_derived_cached_per_version(self):
+        derived = Mock(side_effect=lambda: ['derived', derived.call_count])
+        self.assertEquals(self.versioned.get_derived('key', derived), ['derived', 1])
+        self.assertEquals(self.versioned.get_derived('key', derived), ['derived', 1])
+        self.assertEquals(self.versioned.get_derived('other', derived), ['derived', 2])
+
+        self.versioned.invalidate()
+        self.assertEquals(self.versioned.get_derived('key', derived), ['derived', 3])
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import gzip
+import json
+import datetime
+
+from unittest import TestCase
+from cStringIO import StringIO
+
+from beacon.exports import to_tsv, to_csv, to_jsonl, gzipped, parse_since
+
+HEADER = ('name', 'owned', 'groups')
+ROWS = [
+    [u'bü', True, u'a; b'],
+    [u'comma, inc', None, u''],
+]
+
+class TestExports(TestCase):
+    def test_tsv(self):
+        self.assertEquals(
+            ''.join(to_tsv(HEADER, ROWS, quoted=('groups',))),
+            u'name\towned\tgroups\nbü\tTrue\t"a; b"\ncomma, inc\tNone\t""\n'
+        )
+
+    def test_csv(self):
+        rows = list(csv.reader(StringIO(''.join(to_csv(HEADER, ROWS)))))
+        self.assertEquals(rows, [
+            ['name', 'owned', 'groups'],
+            ['b\xc3\xbc', 'True', 'a; b'],
+            ['comma, inc', '', '']
+        ])
+
+    def test_jsonl(self):
+        lines = ''.join(to_jsonl(HEADER, ROWS + [[datetime.date(2015, 1, 1), False, '']]))
+        self.assertEquals(
+            [json.loads(i) for i in lines.splitlines()],
+            [
+                {'name': u'bü', 'owned': True, 'groups': u'a; b'},
+                {'name': u'comma, inc', 'owned': None, 'groups': u''},
+                {'name': u'2015-01-01', 'owned': False, 'groups': u''}
+            ]
+        )
+
+    def test_gzipped(self):
+        data = ''.join(gzipped(to_tsv(HEADER, ROWS * 100)))
+        self.assertEquals(
+            gzip.GzipFile(fileobj=StringIO(data)).read().decode('utf-8'),
+            ''.join(to_tsv(HEADER, ROWS * 100))
+        )
+
+    def test_parse_since(self):
+        self.assertEquals(
+            parse_since('2015-10-01T12:30:00'),
+            datetime.datetime(2015, 10, 1, 12, 30)
+        )
+        self.assertEquals(
+            parse_since('2015-10-01T08:30:00-04:00'),
+            datetime.datetime(2015, 10, 1, 12, 30)
+        )
+        with self.assertRaises(ValueError):
+            parse_since('last tuesday-ish')
@@ -6,6 +6,10 @@ from unittest import TestCase
 from mock import patch, Mock, MagicMock
 from beacon.notifications import Notification
 
+class FakeMessage(object):
+    recipients = []
+    msgId = None
+
 class TestNotification(TestCase):
     def setUp(self):
         os.environ['CONFIG'] = 'beacon.settings.TestConfig'
@@ -54,6 +58,15 @@ class TestNotification(TestCase):
             notification.flatten(test_recips_complex)
         )
 
+    @patch('beacon.notifications.render_template', return_value='a test')
+    def test_notification_streams_generators(self, render_template):
+        '''Test generators of recipients aren't read up front
+        '''
+        emails = (i for i in ['a@foo.com', 'b@foo.com'])
+        notification = Notification(to_email=emails, from_email='foo@foo.com')
+        self.assertTrue(notification.to_email is emails)
+        self.assertEquals(next(emails), 'a@foo.com')
+
     @patch('beacon.notifications.current_app')
     @patch('beacon.notifications.render_template', return_value='a test')
     def test_notification_build_multi(self, current_app, render_template):
@@ -83,34 +96,51 @@ class TestNotification(TestCase):
             self.assertEquals(len(msg.recipients), 2)
 
 
-    @patch('flask_mail.Mail.send')
-    @patch('beacon.notifications.send_email.delay', return_value=True)
     @patch('beacon.notifications.render_template', return_value='a test')
-    def test_notification_send_multi(self, send, send_email, render_template):
-        '''Test multi builds multiple message objects
+    def test_notification_build_copies(self, render_template):
+        '''Test multi builds one message and copies it for each recipient
         '''
         notification = Notification(to_email=['foobar@foo.com', 'foobar2@foo.com'], from_email='foo@foo.com')
 
         notification.build_msg = Mock()
-        notification.build_msg.return_value = []
+        notification.build_msg.return_value = FakeMessage()
 
-        # should build two messages on multi send
-        notification.send(multi=True)
-        self.assertTrue(notification.build_msg.called)
-        self.assertEquals(notification.build_msg.call_count, 2)
+        # should build once, but return two messages on multi send
+        msgs = notification._build(multi=True)
+        self.assertEquals(notification.build_msg.call_count, 1)
+        self.assertEquals(len(msgs), 2)
+        self.assertEquals(
+            sorted(msg.recipients for msg in msgs),
+            [['foobar2@foo.com'], ['foobar@foo.com']]
+        )
+        self.assertNotEquals(msgs[0].msgId, msgs[1].msgId)
 
-    @patch('flask_mail.Mail.send')
-    @patch('beacon.notifications.send_email.delay')
+    @patch('beacon.notifications.current_app')
+    @patch('beacon.notifications.OutboxMessage')
+    @patch('beacon.notifications.queue_chunks')
     @patch('beacon.notifications.render_template', return_value='a test')
-    def test_notification_send_single(self, send, send_email, render_template):
-        '''Test non-multi only builds one message even with multiple emails
+    def test_notification_send_multi(self, render_template, queue_chunks, outbox, current_app):
+        '''Test multi queues the message in chunks
         '''
+        current_app.config = {'MAIL_CHUNK_SIZE': 100, 'MAIL_SEND_CONCURRENCY': 4}
         notification = Notification(to_email=['foobar@foo.com', 'foobar2@foo.com'], from_email='foo@foo.com')
 
-        notification.build_msg = Mock()
-        notification.build_msg.return_value = []
+        notification.send(multi=True)
+        self.assertEquals(outbox.queue.call_count, 1)
+        self.assertTrue(outbox.queue.call_args[1]['multi'])
+        queue_chunks.assert_called_once_with(outbox.queue.return_value, 100, 4)
+
+    @patch('beacon.notifications.current_app')
+    @patch('beacon.notifications.OutboxMessage')
+    @patch('beacon.notifications.queue_chunks')
+    @patch('beacon.notifications.render_template', return_value='a test')
+    def test_notification_send_single(self, render_template, queue_chunks, outbox, current_app):
+        '''Test non-multi queues a single message even with multiple emails
+        '''
+        current_app.config = {'MAIL_CHUNK_SIZE': 100, 'MAIL_SEND_CONCURRENCY': 4}
+        notification = Notification(to_email=['foobar@foo.com', 'foobar2@foo.com'], from_email='foo@foo.com')
 
-        # should build two messages on multi send
         notification.send(multi=False)
-        self.assertTrue(notification.build_msg.called)
-        self.assertEquals(notification.build_msg.call_count, 1)
+        self.assertFalse(outbox.queue.call_args[1]['multi'])
+        self.assertEquals(len(outbox.queue.call_args[0][0]), 2)
+        self.assertEquals(queue_chunks.call_count, 1)
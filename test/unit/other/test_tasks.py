@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+from unittest import TestCase
+from mock import patch, Mock
+
+from beacon.tasks import queue_chunks
+
+class TestQueueChunks(TestCase):
+    @patch('beacon.tasks.on_commit', side_effect=lambda callback: callback())
+    @patch('beacon.tasks.send_email.si', side_effect=lambda *args: args)
+    @patch('beacon.tasks.chain')
+    def test_queue_chunks_lanes(self, chain, si, on_commit):
+        '''Test chunks are dealt out into one chain per lane
+        '''
+        outbox = Mock(id=1)
+        outbox.chunks.return_value = [(0, 2), (2, 4), (4, 6), (6, 7)]
+
+        queue_chunks(outbox, 2, 3)
+        outbox.chunks.assert_called_once_with(2)
+        self.assertEquals(
+            [i[0] for i in chain.call_args_list],
+            [((1, 0, 2), (1, 6, 7)), ((1, 2, 4),), ((1, 4, 6),)]
+        )
+        self.assertEquals(chain.return_value.apply_async.call_count, 3)
+
+    @patch('beacon.tasks.on_commit', side_effect=lambda callback: callback())
+    @patch('beacon.tasks.send_email.si', side_effect=lambda *args: args)
+    @patch('beacon.tasks.chain')
+    def test_queue_chunks_fewer_chunks_than_lanes(self, chain, si, on_commit):
+        '''Test empty lanes are not queued
+        '''
+        outbox = Mock(id=1)
+        outbox.chunks.return_value = [(0, 2)]
+
+        queue_chunks(outbox, 2, 4)
+        chain.assert_called_once_with((1, 0, 2))
+
+    @patch('beacon.tasks.on_commit')
+    @patch('beacon.tasks.chain')
+    def test_queue_chunks_waits_for_commit(self, chain, on_commit):
+        '''Test nothing is queued until the transaction commits
+        '''
+        outbox = Mock(id=1)
+        outbox.chunks.return_value = [(0, 2)]
+
+        queue_chunks(outbox, 2, 4)
+        self.assertEquals(chain.call_count, 0)
+        on_commit.call_args[0][0]()
+        self.assertEquals(chain.call_count, 1)